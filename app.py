@@ -1,106 +1,192 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, Boolean, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms as joined_rooms
+from sqlalchemy import func, insert, select, union
+from sqlalchemy.orm import joinedload
+from collections import Counter
+from datetime import datetime, timedelta
 import os
+import re
 import json
+import atexit
+import logging
+import base64
+import database
+from models import Customer, Message, Conversation, CannedMessage, Agent, create_schema
+import archive
+import search_index
+import conversations
+import ratelimit
+from change_feed import ChangeFeed, MemoryChangeLog, DatabaseChangeLog
+import socket_queue
+import socket_rooms
+from ingest import IngestQueue, QueueFull
+from cache import TTLCache
+from canned import CannedCatalog, customer_context
+import dedupe
+from dedupe import DedupeIndex
+from inbox_stats import InboxStats, seconds_between
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, RequestMetrics
+import serialization
+import work_queue as claims
+from work_queue import WorkQueue
+from priority import calculate_priority, default_engine as priority_classifier
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+# orjson-backed jsonify with native datetimes (see serialization.py)
+app.json = serialization.JSONProvider(app)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Database setup
-Base = declarative_base()
-engine = create_engine('sqlite:///messaging_app.db', echo=False)
-Session = sessionmaker(bind=engine)
-
-# Database Models
-class Customer(Base):
-    __tablename__ = 'customers'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(200))
-    email = Column(String(200))
-    phone = Column(String(50))
-    customer_id = Column(String(100), unique=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    messages = relationship("Message", back_populates="customer")
-    profile_data = Column(Text)  # JSON string for additional customer info
-
-class Message(Base):
-    __tablename__ = 'messages'
-    id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey('customers.id'))
-    customer = relationship("Customer", back_populates="messages")
-    content = Column(Text)
-    direction = Column(String(20))  # 'incoming' or 'outgoing'
-    agent_id = Column(Integer, nullable=True)  # Null for incoming, set for outgoing
-    agent_name = Column(String(100), nullable=True)
-    status = Column(String(20), default='unread')  # 'unread', 'read', 'replied'
-    priority = Column(Integer, default=0)  # Higher number = more urgent
-    created_at = Column(DateTime, default=datetime.utcnow)
-    replied_at = Column(DateTime, nullable=True)
-
-class CannedMessage(Base):
-    __tablename__ = 'canned_messages'
-    id = Column(Integer, primary_key=True)
-    title = Column(String(200))
-    content = Column(Text)
-    category = Column(String(100))
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-class Agent(Base):
-    __tablename__ = 'agents'
-    id = Column(Integer, primary_key=True)
-    name = Column(String(100))
-    email = Column(String(200))
-    is_active = Column(Boolean, default=True)
-    last_active = Column(DateTime, default=datetime.utcnow)
-
-# Create tables
-Base.metadata.create_all(engine)
-
-# Urgency keywords for priority detection
-URGENCY_KEYWORDS = {
-    'high': ['loan approval', 'loan disbursed', 'disbursement', 'approval process', 
-             'urgent', 'asap', 'immediately', 'critical', 'emergency'],
-    'medium': ['status', 'update', 'when', 'how long', 'timeline'],
-    'low': ['how to', 'update information', 'change', 'modify']
-}
-
-def calculate_priority(content):
-    """Calculate message priority based on content"""
-    content_lower = content.lower()
-    priority = 0
-    
-    for keyword in URGENCY_KEYWORDS['high']:
-        if keyword in content_lower:
-            priority = max(priority, 3)
-    
-    for keyword in URGENCY_KEYWORDS['medium']:
-        if keyword in content_lower:
-            priority = max(priority, 2)
-    
-    for keyword in URGENCY_KEYWORDS['low']:
-        if keyword in content_lower:
-            priority = max(priority, 1)
-    
-    return priority
+# Set SOCKETIO_MESSAGE_QUEUE to share broadcasts between server processes (see socket_queue.py)
+SOCKETIO_MESSAGE_QUEUE = socket_queue.configured_queue()
+socketio = SocketIO(app, cors_allowed_origins="*", **socket_queue.socketio_options(SOCKETIO_MESSAGE_QUEUE))
+# Per-endpoint latency, SQL and emit accounting, served at /metrics (see metrics.py)
+request_metrics = RequestMetrics(
+    slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+    repeat_threshold=int(os.environ.get('N_PLUS_ONE_THRESHOLD', 10)),
+)
+request_metrics.init_app(app)
+
+# Shared, tuned engines (see database.py); GET endpoints read through ReadSession.
+# Tables are created by create_app (see models.py), not on import
+engine = database.engine
+Session = database.Session
+ReadSession = database.ReadSession
+
+# Processes sharing a message queue must also share one change sequence
+CHANGE_FEED_STORE = os.environ.get('CHANGE_FEED_STORE', 'database' if SOCKETIO_MESSAGE_QUEUE else 'memory')
+room_stats = socket_rooms.RoomStats()
+socket_clients = {}  # sid -> identity from the connect auth payload
+request_metrics.gauge('socketio_connected_clients', 'Socket.IO clients connected to this process',
+                      lambda: len(socket_clients))
+
+
+def emit_to_rooms(event, data, to=None):
+    """Emit to the given rooms (or everyone) and count the local fan-out"""
+    if to is not None:
+        manager = socketio.server.manager
+        for room in to:
+            room_stats.record(room, sum(1 for _ in manager.get_participants('/', room)))
+    request_metrics.record_emit(event, data)
+    socketio.emit(event, data, to=to)
+
+
+changes = ChangeFeed(
+    emit=emit_to_rooms,
+    log=DatabaseChangeLog(engine) if CHANGE_FEED_STORE == 'database' else MemoryChangeLog()
+)
+
+# Priority work queue for agent claims (see work_queue.py)
+work_queue = WorkQueue(claim_timeout=int(os.environ.get('CLAIM_TIMEOUT', claims.DEFAULT_CLAIM_TIMEOUT)))
+
+# Near-duplicate customer messages collapse into the earlier one (see dedupe.py)
+DEDUPE = os.environ.get('DEDUPE', 'on') != 'off'
+dedupe_index = DedupeIndex(threshold=float(os.environ.get('DEDUPE_THRESHOLD', dedupe.DEFAULT_THRESHOLD)))
+
+# Dashboard counters for GET /api/stats (see inbox_stats.py)
+inbox_stats = InboxStats(
+    window=int(os.environ.get('STATS_WINDOW', 3600)),
+    reconcile_interval=int(os.environ.get('STATS_RECONCILE_INTERVAL', 60)),
+)
+
+# Inbox pagination
+INBOX_PAGE_SIZE = 50
+INBOX_MAX_PAGE_SIZE = 200
+
+def encode_cursor(priority, created_at, message_id):
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    payload = json.dumps([priority, created_at.isoformat(), message_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        priority, created_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+        return int(priority), datetime.fromisoformat(created_at), int(message_id)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+def inbox_columns():
+    """Columns needed to render an inbox row (no ORM objects, no lazy loads)"""
+    return (
+        Message.id,
+        Message.customer_id,
+        Customer.name,
+        Customer.email,
+        Message.content,
+        Message.status,
+        Message.priority,
+        Message.created_at,
+        Message.replied_at,
+        Message.repeat_count,
+    )
+
+def inbox_row_to_dict(row):
+    return {
+        'id': row.id,
+        'customer_id': row.customer_id,
+        'customer_name': row.name if row.name is not None else 'Unknown',
+        'customer_email': row.email or '',
+        'content': row.content,
+        'status': row.status,
+        'priority': row.priority,
+        'created_at': row.created_at,
+        'replied_at': row.replied_at,
+        'repeat_count': row.repeat_count
+    }
+
+def message_to_inbox_dict(message, customer):
+    """Same shape as an inbox row, built from ORM objects already in the session"""
+    return {
+        'id': message.id,
+        'customer_id': message.customer_id,
+        'customer_name': customer.name if customer else 'Unknown',
+        'customer_email': customer.email if customer else '',
+        'content': message.content,
+        'status': message.status,
+        'priority': message.priority,
+        'created_at': message.created_at.isoformat(),
+        'replied_at': message.replied_at.isoformat() if message.replied_at else None,
+        'repeat_count': message.repeat_count or 0
+    }
+
+def conversation_columns():
+    return (Message.id, Message.content, Message.direction, Message.agent_name, Message.created_at)
+
+def message_to_conversation_dict(message):
+    return {
+        'id': message.id,
+        'content': message.content,
+        'direction': message.direction,
+        'agent_name': message.agent_name,
+        'created_at': message.created_at.isoformat()
+    }
 
 # API Routes
 @app.route('/api/messages', methods=['GET'])
 def get_messages():
-    """Get all messages with optional filters"""
-    session = Session()
+    """Get incoming messages with optional filters.
+
+    Without ``limit``/``cursor`` the full list is streamed as a JSON array
+    (or as NDJSON for ``Accept: application/x-ndjson``). Passing either switches to keyset pagination ordered by
+    (priority desc, created_at desc, id desc) and returns
+    ``{'messages': [...], 'next_cursor': ...}``.
+    """
+    session = ReadSession()
     try:
         status = request.args.get('status', 'all')
         priority = request.args.get('priority', None)
         search = request.args.get('search', '')
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit')
+        paginated = cursor is not None or limit is not None
         
-        query = session.query(Message).filter(Message.direction == 'incoming')
+        query = session.query(*inbox_columns()).outerjoin(
+            Customer, Message.customer_id == Customer.id
+        ).filter(Message.direction == 'incoming')
         
         if status != 'all':
             query = query.filter(Message.status == status)
@@ -109,67 +195,259 @@ def get_messages():
             query = query.filter(Message.priority >= int(priority))
         
         if search:
-            query = query.join(Customer).filter(
-                (Message.content.contains(search)) |
-                (Customer.name.contains(search)) |
-                (Customer.email.contains(search))
+            search_backend = search_index.backend(session)
+            match_query = search_backend.match_query(search)
+            if match_query is None:
+                return jsonify({'messages': [], 'next_cursor': None} if paginated else [])
+            query = query.filter(Message.id.in_(search_backend.matching_message_ids(match_query)))
+        
+        query = query.order_by(Message.priority.desc(), Message.created_at.desc(), Message.id.desc())
+        
+        if not paginated:
+            # Potentially the whole inbox: stream it (as NDJSON if the client asks)
+            return serialization.stream_rows(
+                ReadSession, query.statement, inbox_row_to_dict, ndjson=serialization.wants_ndjson(request)
             )
         
-        messages = query.order_by(Message.priority.desc(), Message.created_at.desc()).all()
+        # Read the feed position before querying: replaying deltas from here
+        # can only repeat changes the page already contains, never miss one.
+        feed_seq, feed_epoch = changes.seq, changes.epoch
         
-        result = []
-        for msg in messages:
-            result.append({
-                'id': msg.id,
-                'customer_id': msg.customer_id,
-                'customer_name': msg.customer.name if msg.customer else 'Unknown',
-                'customer_email': msg.customer.email if msg.customer else '',
-                'content': msg.content,
-                'status': msg.status,
-                'priority': msg.priority,
-                'created_at': msg.created_at.isoformat(),
-                'replied_at': msg.replied_at.isoformat() if msg.replied_at else None
-            })
+        try:
+            page_size = min(max(int(limit or INBOX_PAGE_SIZE), 1), INBOX_MAX_PAGE_SIZE)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        
+        if cursor:
+            try:
+                last_priority, last_created_at, last_id = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(
+                (Message.priority < last_priority) |
+                ((Message.priority == last_priority) & (Message.created_at < last_created_at)) |
+                ((Message.priority == last_priority) & (Message.created_at == last_created_at) &
+                 (Message.id < last_id))
+            )
         
-        return jsonify(result)
+        # Fetch one extra row to know whether another page exists
+        rows = query.limit(page_size + 1).all()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.priority, last.created_at, last.id)
+        
+        return jsonify({
+            'messages': [inbox_row_to_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'seq': feed_seq,
+            'epoch': feed_epoch
+        })
     finally:
         session.close()
 
+THREAD_PAGE_SIZE = 50
+
+def thread_columns():
+    return (
+        Conversation.id,
+        Conversation.customer_id,
+        Customer.name,
+        Customer.email,
+        Conversation.last_message_id,
+        Conversation.last_message_preview,
+        Conversation.last_message_direction,
+        Conversation.last_activity,
+        Conversation.unread_count,
+        Conversation.open_count,
+        Conversation.max_priority,
+        Conversation.message_count,
+    )
+
+def thread_row_to_dict(row):
+    return {
+        'id': row.id,
+        'customer_id': row.customer_id,
+        'customer_name': row.name if row.name is not None else 'Unknown',
+        'customer_email': row.email or '',
+        'last_message': {
+            'id': row.last_message_id,
+            'preview': row.last_message_preview,
+            'direction': row.last_message_direction,
+        },
+        'last_activity': row.last_activity,
+        'unread_count': row.unread_count,
+        'open_count': row.open_count,
+        'max_priority': row.max_priority,
+        'message_count': row.message_count,
+    }
+
+@app.route('/api/conversations', methods=['GET'])
+def get_conversations():
+    """Thread inbox: one row per customer, ordered by (max_priority desc, last_activity desc, id desc).
+
+    ``status`` is ``all`` (default), ``open`` (awaiting a reply) or
+    ``unread``; ``priority`` keeps threads whose open messages reach it.
+    Keyset-paginated with ``limit`` / ``cursor`` like ``/api/messages``.
+    """
+    status = request.args.get('status', 'all')
+    try:
+        page_size = min(max(int(request.args.get('limit', THREAD_PAGE_SIZE)), 1), INBOX_MAX_PAGE_SIZE)
+        priority = int(request.args['priority']) if request.args.get('priority') else None
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    session = ReadSession()
+    try:
+        query = session.query(*thread_columns()).outerjoin(
+            Customer, Conversation.customer_id == Customer.id
+        ).filter(Conversation.last_activity.isnot(None))
+        if status == 'open':
+            query = query.filter(Conversation.open_count > 0)
+        elif status == 'unread':
+            query = query.filter(Conversation.unread_count > 0)
+        if priority is not None:
+            query = query.filter(Conversation.max_priority >= priority)
+        if after:
+            last_priority, last_activity, last_id = after
+            query = query.filter(
+                (Conversation.max_priority < last_priority) |
+                ((Conversation.max_priority == last_priority) & (Conversation.last_activity < last_activity)) |
+                ((Conversation.max_priority == last_priority) & (Conversation.last_activity == last_activity) &
+                 (Conversation.id < last_id))
+            )
+        rows = query.order_by(
+            Conversation.max_priority.desc(), Conversation.last_activity.desc(), Conversation.id.desc()
+        ).limit(page_size + 1).all()
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.max_priority, last.last_activity, last.id)
+        return jsonify({'conversations': [thread_row_to_dict(row) for row in rows], 'next_cursor': next_cursor})
+    finally:
+        session.close()
+
+def customer_to_dict(customer):
+    if not customer:
+        return {}
+    return {
+        'id': customer.id,
+        'name': customer.name,
+        'email': customer.email,
+        'phone': customer.phone,
+        'customer_id': customer.customer_id,
+        'profile_data': json.loads(customer.profile_data) if customer.profile_data else {}
+    }
+
+def history_select(table, customer_pk, before=None):
+    """Conversation columns of ``table`` (messages or archived_messages) for one customer"""
+    c = table.c
+    statement = select(*(c[column.key] for column in conversation_columns())).where(c.customer_id == customer_pk)
+    if before is not None:
+        before_created_at, before_id = before
+        statement = statement.where(
+            (c.created_at < before_created_at) | ((c.created_at == before_created_at) & (c.id < before_id))
+        )
+    return statement
+
+def load_conversation(session, customer_pk, limit, before=None, include_archived=False):
+    """Latest ``limit`` messages of a conversation (older than ``before``), oldest first.
+
+    ``include_archived`` also reads ``archived_messages`` (see archive.py).
+    Returns (messages, has_more).
+    """
+    statement = history_select(Message.__table__, customer_pk, before)
+    columns = Message.__table__.c
+    if include_archived:
+        # UNION, not UNION ALL: a row is briefly in both tables while archive.py moves it
+        history = union(statement, history_select(archive.archived_messages, customer_pk, before)).subquery()
+        # Plain str labels: orjson rejects the label subclass a subquery's own names come back as
+        statement, columns = select(*(column.label(column.key) for column in history.c)), history.c
+    rows = session.execute(
+        statement.order_by(columns.created_at.desc(), columns.id.desc()).limit(limit + 1)
+    ).all()
+    return [row._asdict() for row in reversed(rows[:limit])], len(rows) > limit
+
+def encode_history_cursor(message):
+    """Cursor for the history older than a conversation dict"""
+    payload = json.dumps([message['created_at'].isoformat(), message['id']])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_history_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, message_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(message_id)
+    except Exception as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
+
+# Customer profile + conversation tail per customer, invalidated by the write paths
+CONVERSATION_PAGE_SIZE = 50
+CONVERSATION_MAX_PAGE_SIZE = 200
+conversation_cache = TTLCache(
+    maxsize=int(os.environ.get('CONVERSATION_CACHE_SIZE', 1000)),
+    ttl=float(os.environ.get('CONVERSATION_CACHE_TTL', 30)),
+)
+
+def cached_conversation(session, customer_pk):
+    """(customer dict, conversation tail, has_more) from the cache or the database"""
+    entry = conversation_cache.get(customer_pk)
+    if entry is None:
+        version = conversation_cache.version
+        customer = session.get(Customer, customer_pk) if customer_pk is not None else None
+        tail, has_more = load_conversation(session, customer_pk, CONVERSATION_PAGE_SIZE)
+        entry = (customer_to_dict(customer), tail, has_more)
+        conversation_cache.set(customer_pk, entry, version=version)
+    return entry
+
+def include_archived_arg():
+    return request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
 @app.route('/api/messages/<int:message_id>', methods=['GET'])
 def get_message(message_id):
-    """Get a specific message with customer details"""
-    session = Session()
+    """Get a specific message with customer details and the latest conversation history.
+
+    ``limit`` (default 50) caps the conversation; ``before`` is the
+    ``conversation_cursor`` of a previous response and returns older history.
+    ``include_archived=1`` also finds archived messages and history.
+    """
     try:
-        message = session.query(Message).filter(Message.id == message_id).first()
+        limit = min(max(int(request.args.get('limit', CONVERSATION_PAGE_SIZE)), 1), CONVERSATION_MAX_PAGE_SIZE)
+        before = request.args.get('before')
+        before = decode_history_cursor(before) if before else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    include_archived = include_archived_arg()
+    
+    session = ReadSession()
+    try:
+        message = session.query(
+            Message.id, Message.customer_id, Message.content, Message.status, Message.priority, Message.created_at
+        ).filter(Message.id == message_id).first()
+        if not message and include_archived:
+            c = archive.archived_messages.c
+            message = session.execute(
+                select(c.id, c.customer_id, c.content, c.status, c.priority, c.created_at).where(c.id == message_id)
+            ).first()
         if not message:
             return jsonify({'error': 'Message not found'}), 404
         
-        customer = message.customer
-        customer_info = {}
-        if customer:
-            customer_info = {
-                'id': customer.id,
-                'name': customer.name,
-                'email': customer.email,
-                'phone': customer.phone,
-                'customer_id': customer.customer_id,
-                'profile_data': json.loads(customer.profile_data) if customer.profile_data else {}
-            }
-        
-        # Get conversation history
-        conversation = session.query(Message).filter(
-            Message.customer_id == message.customer_id
-        ).order_by(Message.created_at.asc()).all()
-        
-        conversation_data = []
-        for msg in conversation:
-            conversation_data.append({
-                'id': msg.id,
-                'content': msg.content,
-                'direction': msg.direction,
-                'agent_name': msg.agent_name,
-                'created_at': msg.created_at.isoformat()
-            })
+        if include_archived:
+            customer_info, _, _ = cached_conversation(session, message.customer_id)
+            conversation_data, has_more = load_conversation(
+                session, message.customer_id, limit, before, include_archived=True
+            )
+        elif before is None and limit <= CONVERSATION_PAGE_SIZE:
+            customer_info, tail, has_more = cached_conversation(session, message.customer_id)
+            conversation_data = tail[-limit:]
+            has_more = has_more or len(tail) > limit
+        else:
+            customer_info, _, _ = cached_conversation(session, message.customer_id)
+            conversation_data, has_more = load_conversation(session, message.customer_id, limit, before)
         
         return jsonify({
             'message': {
@@ -177,14 +455,42 @@ def get_message(message_id):
                 'content': message.content,
                 'status': message.status,
                 'priority': message.priority,
-                'created_at': message.created_at.isoformat()
+                'created_at': message.created_at
             },
             'customer': customer_info,
-            'conversation': conversation_data
+            'conversation': conversation_data,
+            'conversation_cursor': encode_history_cursor(conversation_data[0]) if has_more and conversation_data else None
         })
     finally:
         session.close()
 
+def reply_values(original_message, content, agent_id, agent_name):
+    """Column values of an agent reply to ``original_message``"""
+    return {
+        'customer_id': original_message.customer_id,
+        'content': content,
+        'direction': 'outgoing',
+        'agent_id': agent_id,
+        'agent_name': agent_name,
+        'status': 'sent',
+        'created_at': datetime.utcnow()
+    }
+
+def mark_replied(original_message):
+    """Set status replied (replied_at keeps the first response time); returns the previous status"""
+    previous_status = original_message.status
+    original_message.status = 'replied'
+    if original_message.replied_at is None:
+        original_message.replied_at = datetime.utcnow()
+    return previous_status
+
+def reply_committed(updated, previous_status, agent_id, created_at, replied_at):
+    """Bring the in-process caches and counters up to date after a reply to ``updated`` commits"""
+    conversation_cache.invalidate(updated['customer_id'])
+    work_queue.remove(updated['id'])
+    dedupe_index.discard(updated['id'])
+    inbox_stats.replied(updated['priority'], previous_status, agent_id, created_at, replied_at)
+
 @app.route('/api/messages/<int:message_id>/reply', methods=['POST'])
 def reply_to_message(message_id):
     """Reply to a message"""
@@ -202,89 +508,482 @@ def reply_to_message(message_id):
         if not original_message:
             return jsonify({'error': 'Message not found'}), 404
         
-        # Create reply message
-        reply = Message(
-            customer_id=original_message.customer_id,
-            content=content,
-            direction='outgoing',
-            agent_id=agent_id,
-            agent_name=agent_name,
-            status='sent'
-        )
-        session.add(reply)
-        
-        # Update original message status
-        original_message.status = 'replied'
-        original_message.replied_at = datetime.utcnow()
+        claim = claims.active_claim(session.connection(), message_id)
+        if claim and claim[0] != agent_id:
+            return jsonify({'error': f'Message is claimed by agent {claim[0]}'}), 409
         
+        reply = Message(**reply_values(original_message, content, agent_id, agent_name))
+        session.add(reply)
+        previous_status = mark_replied(original_message)
+        session.flush()
+        search_index.index_messages(session, [reply.id])
+        conversations.record_reply(
+            session, original_message.customer_id, reply.id, content, reply.created_at, previous_status
+        )
+        updated = message_to_inbox_dict(original_message, original_message.customer)
+        reply_data = message_to_conversation_dict(reply)
+        reply_id = reply.id
+        created_at, replied_at = original_message.created_at, original_message.replied_at
+        claims.release_claim(session.connection(), message_id)
         session.commit()
+        reply_committed(updated, previous_status, agent_id, created_at, replied_at)
         
         # Emit real-time update
-        socketio.emit('new_reply', {
-            'message_id': message_id,
-            'reply': {
-                'id': reply.id,
-                'content': content,
-                'agent_name': agent_name,
-                'created_at': reply.created_at.isoformat()
-            }
-        })
+        changes.publish(
+            'new_reply', 'update',
+            to=socket_rooms.message_rooms(updated, agent_id=agent_id),
+            message_id=message_id,
+            customer_id=updated['customer_id'],
+            message=updated,
+            reply=reply_data
+        )
         
-        return jsonify({'success': True, 'reply_id': reply.id})
+        return jsonify({'success': True, 'reply_id': reply_id})
     finally:
         session.close()
 
-@app.route('/api/customers/send-message', methods=['POST'])
-def customer_send_message():
-    """Endpoint for customers to send messages"""
-    session = Session()
-    try:
-        data = request.json
-        customer_name = data.get('name', 'Unknown Customer')
-        customer_email = data.get('email', '')
-        customer_phone = data.get('phone', '')
-        content = data.get('content', '')
-        
-        if not content:
-            return jsonify({'error': 'Message content is required'}), 400
-        
-        # Find or create customer
-        customer = session.query(Customer).filter(Customer.email == customer_email).first()
-        if not customer:
-            customer = Customer(
-                name=customer_name,
-                email=customer_email,
-                phone=customer_phone,
-                customer_id=f"CUST_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}"
-            )
-            session.add(customer)
-            session.flush()
-        
-        # Create message
-        priority = calculate_priority(content)
+def load_dedupe_candidates(session, customer_ids):
+    """Index the open incoming messages of customers the dedupe index has not loaded recently"""
+    stale = [customer_id for customer_id in customer_ids if dedupe_index.needs_load(customer_id)]
+    if not stale:
+        return
+    rows = {customer_id: [] for customer_id in stale}
+    for message_id, customer_id, content in session.query(Message.id, Message.customer_id, Message.content).filter(
+        Message.customer_id.in_(stale), Message.direction == 'incoming', Message.status != 'replied'
+    ).order_by(Message.id):
+        rows[customer_id].append((message_id, content))
+    for customer_id, customer_rows in rows.items():
+        dedupe_index.load(customer_id, customer_rows)
+
+def collapse_duplicate(session, customer_id, fingerprint):
+    """Count a resubmission against the customer's matching open message; returns that message or None.
+
+    The index match is re-checked by the UPDATE itself, so a message replied
+    to by another process since it was indexed is dropped from the index
+    instead of absorbing the new one.
+    """
+    while True:
+        message_id = dedupe_index.find(customer_id, fingerprint)
+        if message_id is None:
+            return None
+        updated = session.query(Message).filter(
+            Message.id == message_id,
+            Message.customer_id == customer_id,
+            Message.direction == 'incoming',
+            Message.status != 'replied'
+        ).update({Message.repeat_count: Message.repeat_count + 1}, synchronize_session=False)
+        if updated:
+            return session.get(Message, message_id, populate_existing=True)
+        dedupe_index.discard(message_id)
+
+def store_customer_messages(session, submissions):
+    """Find or create each submission's customer and add its message.
+
+    Customers are looked up for the whole batch in one query. Missing ones are
+    inserted with ON CONFLICT (email) DO NOTHING and read back, so a customer
+    created concurrently by another request or process is reused rather than
+    failing the transaction.
+
+    A near-duplicate of one of the customer's open messages (or of an earlier
+    submission in the batch) is not stored; the matching message's
+    ``repeat_count`` goes up instead. Returns one ``(inbox_row, is_new)``
+    pair per submission, where duplicates carry the row they collapsed into
+    (flushed, not committed).
+    """
+    # A missing or null email is stored as '' (IN (NULL) would never match it)
+    emails = [submission.get('email') or '' for submission in submissions]
+    customers = {
+        customer.email: customer
+        for customer in session.query(Customer).filter(Customer.email.in_(set(emails)))
+    }
+    missing = {}
+    for email, submission in zip(emails, submissions):
+        if email not in customers and email not in missing:
+            missing[email] = submission
+    new_customer_ids = []
+    if missing:
+        stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        customers_table = Customer.__table__
+        new_customer_ids = session.execute(
+            database.insert(session, customers_table).values([{
+                'name': submission.get('name', 'Unknown Customer'),
+                'email': email,
+                'phone': submission.get('phone', ''),
+                'customer_id': f"CUST_{stamp}" + (f"_{n}" if n else ''),
+                'created_at': datetime.utcnow(),
+            } for n, (email, submission) in enumerate(missing.items())])
+            .on_conflict_do_nothing(index_elements=['email'])
+            .returning(customers_table.c.id)
+        ).scalars().all()
+        customers.update(
+            (customer.email, customer)
+            for customer in session.query(Customer).filter(Customer.email.in_(missing))
+        )
+    
+    if DEDUPE:
+        load_dedupe_candidates(session, {customer.id for customer in customers.values()})
+    batch_index = DedupeIndex(threshold=dedupe_index.threshold, reload_after=None)
+    messages = []
+    stored = []
+    for email, submission in zip(emails, submissions):
+        customer = customers[email]
+        if DEDUPE:
+            fingerprint = dedupe.Fingerprint(submission['content'])
+            position = batch_index.find(customer.id, fingerprint)
+            if position is not None:
+                messages[position].repeat_count += 1
+                stored.append((messages[position], False))
+                continue
+            existing = collapse_duplicate(session, customer.id, fingerprint)
+            if existing is not None:
+                stored.append((existing, False))
+                continue
+            batch_index.add(customer.id, len(messages), fingerprint)
         message = Message(
-            customer_id=customer.id,
-            content=content,
+            customer=customer,
+            content=submission['content'],
             direction='incoming',
             status='unread',
-            priority=priority
+            priority=calculate_priority(submission['content']),
+            repeat_count=0
         )
+        if submission.get('received_at'):
+            message.created_at = datetime.utcfromtimestamp(submission['received_at'])
         session.add(message)
+        messages.append(message)
+        stored.append((message, True))
+    
+    session.flush()
+    search_index.index_customers(session, new_customer_ids)
+    search_index.index_messages(session, [message.id for message in messages])
+    conversations.record_incoming(session, [{
+        'id': message.id,
+        'customer_id': message.customer_id,
+        'content': message.content,
+        'priority': message.priority,
+        'status': message.status,
+        'created_at': message.created_at,
+    } for message in messages])
+    return [(message_to_inbox_dict(message, message.customer), is_new) for message, is_new in stored]
+
+def queue_new_message(inbox_row):
+    """Hand a committed message to the work queue, the inbox counters and the dedupe index"""
+    work_queue.add(inbox_row['id'], inbox_row['priority'], datetime.fromisoformat(inbox_row['created_at']))
+    inbox_stats.added(inbox_row['priority'])
+    if DEDUPE:
+        dedupe_index.add(inbox_row['customer_id'], inbox_row['id'], inbox_row['content'])
+
+def publish_new_message(inbox_row, ingest_id=None, is_new=True):
+    """Broadcast a stored customer message, or the updated repeat_count of the one it duplicated"""
+    extra = {'ingest_id': ingest_id} if ingest_id else {}
+    event, op = ('new_message', 'insert') if is_new else ('message_status', 'update')
+    changes.publish(
+        event, op,
+        to=socket_rooms.message_rooms(inbox_row),
+        message_id=inbox_row['id'],
+        customer_id=inbox_row['customer_id'],
+        message=inbox_row,
+        **extra
+    )
+
+def submission_error(submission):
+    """Why a customer message submission cannot be stored, or None"""
+    content = submission.get('content')
+    if not content:
+        return 'Message content is required'
+    if not isinstance(content, str):
+        return 'Message content must be a string'
+    for field in ('name', 'email', 'phone'):
+        if not isinstance(submission.get(field), (str, type(None))):
+            return f'{field} must be a string'
+    return None
+
+def write_ingest_batch(submissions):
+    """Group-commit queued customer messages (the async ingest writer; retried on failure).
+
+    A submission that cannot be stored is logged and dropped, and its slot in
+    the result is None, so it never holds up the rest of the batch.
+    """
+    errors = [submission_error(submission) for submission in submissions]
+    for submission, error in zip(submissions, errors):
+        if error:
+            logger.error('Dropping ingest submission %s: %s', submission.get('ingest_id'), error)
+    valid = [submission for submission, error in zip(submissions, errors) if error is None]
+    session = Session()
+    try:
+        stored = iter(store_customer_messages(session, valid) if valid else [])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return [None if error else next(stored) for error in errors]
+
+def publish_ingest_batch(submissions, stored):
+    """Queue and broadcast a committed ingest batch, once (never retried)"""
+    stored = [(submission, row) for submission, row in zip(submissions, stored) if row is not None]
+    conversation_cache.invalidate(*{inbox_row['customer_id'] for _, (inbox_row, is_new) in stored if is_new})
+    for submission, (inbox_row, is_new) in stored:
+        if is_new:
+            queue_new_message(inbox_row)
+        publish_new_message(inbox_row, submission['ingest_id'], is_new=is_new)
+
+# INGEST_MODE=async acknowledges customer messages with 202 and writes them in batches
+INGEST_MODE = os.environ.get('INGEST_MODE', 'sync')
+ingest_queue = IngestQueue(
+    write_ingest_batch,
+    maxsize=int(os.environ.get('INGEST_QUEUE_SIZE', 10000)),
+    batch_size=int(os.environ.get('INGEST_BATCH_SIZE', 200)),
+    spool_path=os.environ.get('INGEST_SPOOL', 'ingest_spool.jsonl'),
+    on_committed=publish_ingest_batch,
+)
+
+# Token buckets per client IP and per email on the public endpoint (see ratelimit.py)
+rate_limiter = ratelimit.RateLimiter(
+    ratelimit.store_from_url(os.environ.get('RATE_LIMIT_STORE')),
+    enabled=os.environ.get('RATE_LIMITS', 'on') != 'off',
+    registry=request_metrics.registry,
+)
+
+@app.route('/api/customers/send-message', methods=['POST'])
+@rate_limiter.limited(
+    'send_message',
+    ip=(ratelimit.client_ip, ratelimit.configured_limit('send_message', 'ip', '60/minute:30')),
+    email=(ratelimit.json_field('email'), ratelimit.configured_limit('send_message', 'email', '10/minute:5')),
+)
+def customer_send_message():
+    """Endpoint for customers to send messages"""
+    data = request.json
+    if not isinstance(data, dict):
+        data = {}
+    error = submission_error(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    submission = {
+        'name': data.get('name', 'Unknown Customer'),
+        'email': data.get('email', ''),
+        'phone': data.get('phone', ''),
+        'content': data['content'],
+    }
+    
+    if INGEST_MODE == 'async':
+        try:
+            ingest_id = ingest_queue.submit(submission)
+        except QueueFull:
+            response = jsonify({'error': 'Too many messages, please retry shortly'})
+            response.headers['Retry-After'] = '1'
+            return response, 429
+        return jsonify({'success': True, 'queued': True, 'ingest_id': ingest_id}), 202
+    
+    session = Session()
+    try:
+        inbox_row, is_new = store_customer_messages(session, [submission])[0]
         session.commit()
+        if is_new:
+            conversation_cache.invalidate(inbox_row['customer_id'])
+    finally:
+        session.close()
+    
+    if is_new:
+        queue_new_message(inbox_row)
+    # Emit real-time update to agents
+    publish_new_message(inbox_row, is_new=is_new)
+    
+    return jsonify({
+        'success': True,
+        'message_id': inbox_row['id'],
+        'customer_id': inbox_row['customer_id'],
+        'duplicate': not is_new
+    })
+
+def rebuild_work_queue(session):
+    """Load every incoming message still awaiting a reply into the work queue (``create_app`` runs it)"""
+    max_id = session.query(func.max(Message.id)).scalar() or 0
+    rows = session.query(Message.id, Message.priority, Message.created_at).filter(
+        Message.direction == 'incoming', Message.status != 'replied', Message.id <= max_id
+    ).all()
+    work_queue.load([tuple(row) for row in rows], max_id=max_id)
+
+def sync_work_queue(session):
+    """Add messages inserted by other processes since the queue was loaded (loading it if it was not)"""
+    if not work_queue.loaded:
+        rebuild_work_queue(session)
+        return
+    # Only a rowid range in SQL (filtering on direction/status would make
+    # SQLite walk the status index instead); the rest is filtered here
+    rows = session.query(
+        Message.id, Message.priority, Message.created_at, Message.direction, Message.status
+    ).filter(Message.id > work_queue.max_loaded_id).all()
+    work_queue.load(
+        [(row.id, row.priority, row.created_at) for row in rows
+         if row.direction == 'incoming' and row.status != 'replied'],
+        max_id=max((row.id for row in rows), default=0)
+    )
+
+def queue_ids(data, *names):
+    """Integer values of ``names`` in a work-queue request body; raises ValueError"""
+    try:
+        return [int(data[name]) for name in names]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError(f"{' and '.join(names)} must be integers") from None
+
+def claim_to_dict(agent_id, expires_at):
+    return {'agent_id': agent_id, 'expires_at': expires_at.isoformat()}
+
+@app.route('/api/queue/claim', methods=['POST'])
+def claim_next_message():
+    """Hand the most urgent, oldest unclaimed message to an agent"""
+    data = request.json or {}
+    try:
+        [agent_id] = queue_ids(data, 'agent_id')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    session = Session()
+    try:
+        agent = session.get(Agent, agent_id)
+        if not agent or not agent.is_active:
+            return jsonify({'error': 'Agent not found'}), 404
         
-        # Emit real-time update to agents
-        socketio.emit('new_message', {
-            'id': message.id,
-            'customer_name': customer.name,
-            'customer_email': customer.email,
-            'content': content,
-            'priority': priority,
-            'created_at': message.created_at.isoformat()
-        })
+        sync_work_queue(session)
+        now = datetime.utcnow()
+        while True:
+            message_id = work_queue.next_candidate(now)
+            if message_id is None:
+                return jsonify({'message': None, 'claim': None})
+            try:
+                message = session.get(Message, message_id)
+                if not message or message.status == 'replied':
+                    work_queue.remove(message_id)  # replied by another process
+                    continue
+                holder, expires_at = claims.record_claim(
+                    session.connection(), message_id, agent.id, now, work_queue.claim_timeout
+                )
+            except Exception:
+                work_queue.requeue(message_id)  # popped but not claimed: keep it in the queue
+                raise
+            work_queue.claimed(message_id, holder, expires_at)
+            if holder == agent.id:
+                break
         
-        return jsonify({'success': True, 'message_id': message.id})
+        agent.last_active = now
+        claimed = message_to_inbox_dict(message, message.customer)
+        session.commit()
+        return jsonify({'message': claimed, 'claim': claim_to_dict(agent.id, expires_at)})
+    finally:
+        session.close()
+
+@app.route('/api/queue/release', methods=['POST'])
+def release_message():
+    """Give a claimed message back to the queue"""
+    data = request.json or {}
+    try:
+        agent_id, message_id = queue_ids(data, 'agent_id', 'message_id')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    session = Session()
+    try:
+        released = claims.release_claim(session.connection(), message_id, agent_id)
+        session.commit()
     finally:
         session.close()
+    if not released:
+        return jsonify({'error': 'Message is not claimed by this agent'}), 409
+    work_queue.release(message_id)
+    return jsonify({'success': True})
+
+@app.route('/api/queue/stats', methods=['GET'])
+def queue_stats():
+    return jsonify(work_queue.stats())
+
+def reconcile_inbox_stats(session):
+    """Recompute the dashboard counters from the database.
+
+    Message counts cover the hot table (the inbox); reply counts and the
+    first-response average also include archived messages, read from the
+    running totals the archive job keeps (``archive.archive_totals``), so an
+    archive run does not erase that history and the archive is never rescanned.
+    """
+    now = datetime.utcnow()
+    messages = session.query(Message.status, Message.priority, func.count()).filter(
+        Message.direction == 'incoming'
+    ).group_by(Message.status, Message.priority).all()
+    replies = Counter(dict(session.query(Message.agent_id, func.count()).filter(
+        Message.direction == 'outgoing'
+    ).group_by(Message.agent_id).all()))
+    response_sum, response_count = session.query(
+        func.sum(seconds_between(session, Message.created_at, Message.replied_at)), func.count()
+    ).filter(Message.direction == 'incoming', Message.replied_at.isnot(None)).one()
+    archived_replies, archived_sum, archived_count = archive.archived_totals(session)
+    replies.update(archived_replies)
+    response_sum = float(response_sum or 0) + archived_sum
+    response_count = (response_count or 0) + archived_count
+    recent = session.query(Message.priority, Message.created_at, Message.replied_at).filter(
+        Message.replied_at >= inbox_stats.window_start(now), Message.direction == 'incoming'
+    ).all()
+    inbox_stats.reconcile(messages, replies.items(), response_sum, response_count, recent, now=now)
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Inbox counts, reply counts and first-response latency, from in-memory counters"""
+    if inbox_stats.due():
+        session = ReadSession()
+        try:
+            reconcile_inbox_stats(session)
+        finally:
+            session.close()
+    return jsonify(inbox_stats.snapshot())
+
+# Hot/cold archival of replied messages (see archive.py); scheduled only when ARCHIVE_AFTER_DAYS is set
+def archived_batch(customer_ids):
+    conversation_cache.invalidate(*customer_ids)
+    inbox_stats.invalidate()
+
+ARCHIVE_AFTER_DAYS = os.environ.get('ARCHIVE_AFTER_DAYS')
+archive_scheduler = archive.ArchiveScheduler(
+    engine,
+    older_than=timedelta(days=float(ARCHIVE_AFTER_DAYS or 365)),
+    interval=float(os.environ.get('ARCHIVE_INTERVAL', 3600)),
+    batch_size=int(os.environ.get('ARCHIVE_BATCH_SIZE', archive.DEFAULT_BATCH_SIZE)),
+    min_free_ratio=float(os.environ.get('ARCHIVE_VACUUM_FREE_RATIO', archive.DEFAULT_MIN_FREE_RATIO)),
+    on_batch=archived_batch,
+)
+
+def archive_size(key):
+    return lambda: (archive_scheduler.last_sizes or {}).get(key, 0)
+
+request_metrics.gauge('db_hot_messages', 'Rows in messages (as of the last archive run or stats request)',
+                      archive_size('hot_messages'))
+request_metrics.gauge('db_archived_messages', 'Rows in archived_messages (as of the last archive run or stats request)',
+                      archive_size('archived_messages'))
+request_metrics.gauge('db_storage_bytes', 'Database files (SQLite) or message tables (PostgreSQL), in bytes',
+                      lambda: sum(s['bytes'] for s in (archive_scheduler.last_sizes or {}).get('storage', {}).values()))
+
+@app.route('/api/archive/stats', methods=['GET'])
+def get_archive_stats():
+    """Hot and archived row counts, storage sizes and the last scheduled archive run"""
+    session = ReadSession()
+    try:
+        archive_scheduler.last_sizes = archive.sizes(session.connection())
+    finally:
+        session.close()
+    return jsonify(dict(
+        archive_scheduler.last_sizes,
+        enabled=bool(ARCHIVE_AFTER_DAYS),
+        older_than_days=archive_scheduler.older_than.total_seconds() / 86400,
+        last_run=archive_scheduler.last_run
+    ))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the in-process caches"""
+    return jsonify({'conversations': conversation_cache.stats(), 'canned_messages': canned_catalog.stats()})
+
+@app.route('/api/ingest/stats', methods=['GET'])
+def ingest_stats():
+    """Ingest queue depth and commit batch sizes"""
+    return jsonify(dict(ingest_queue.stats(), mode=INGEST_MODE))
 
 @app.route('/api/messages/<int:message_id>/read', methods=['POST'])
 def mark_as_read(message_id):
@@ -294,27 +993,264 @@ def mark_as_read(message_id):
         message = session.query(Message).filter(Message.id == message_id).first()
         if message and message.status == 'unread':
             message.status = 'read'
+            session.flush()
+            conversations.record_read(session, message.customer_id)
+            updated = message_to_inbox_dict(message, message.customer)
             session.commit()
+            inbox_stats.status_changed(updated['priority'], 'unread', 'read')
+            changes.publish(
+                'message_status', 'status',
+                to=socket_rooms.message_rooms(updated),
+                message_id=message_id,
+                customer_id=updated['customer_id'],
+                status='read',
+                message=updated
+            )
         return jsonify({'success': True})
     finally:
         session.close()
 
-@app.route('/api/canned-messages', methods=['GET'])
-def get_canned_messages():
-    """Get all canned messages"""
+# Bulk triage: many messages per request, one transaction and one messages_batch event
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', 200))
+BULK_STATUSES = {'read': 'unread', 'unread': 'read'}  # target status -> status it applies to
+
+def bulk_message_ids(data):
+    """Distinct message ids from a bulk request body, in request order; raises ValueError"""
+    message_ids = data.get('message_ids')
+    if not isinstance(message_ids, list) or not message_ids:
+        raise ValueError('message_ids must be a non-empty list')
+    if len(message_ids) > BULK_MAX_ITEMS:
+        raise ValueError(f'At most {BULK_MAX_ITEMS} messages per request')
+    try:
+        return list(dict.fromkeys(int(message_id) for message_id in message_ids))
+    except (TypeError, ValueError):
+        raise ValueError('message_ids must be integers') from None
+
+def load_bulk_messages(session, message_ids):
+    """{id: Message} with customers loaded in the same query"""
+    rows = session.query(Message).options(joinedload(Message.customer)).filter(Message.id.in_(message_ids))
+    return {message.id: message for message in rows}
+
+def bulk_failure(message_id, error, status):
+    return {'message_id': message_id, 'success': False, 'error': error, 'status': status}
+
+def bulk_response(results):
+    applied = sum(1 for result in results if result['success'])
+    return jsonify({'success': True, 'applied': applied, 'failed': len(results) - applied, 'results': results})
+
+@app.route('/api/messages/bulk-reply', methods=['POST'])
+def bulk_reply():
+    """Send one reply (``content``, or canned message ``canned_id`` rendered per customer) to many messages.
+
+    Every message that can be replied to is answered in a single
+    transaction; ``results`` reports each message in request order.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        message_ids = bulk_message_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    agent_id = data.get('agent_id', 1)
+    agent_name = data.get('agent_name', 'Agent')
+    content = data.get('content')
+    template = None
+    if data.get('canned_id') is not None:
+        template = canned_catalog.get().templates.get(data['canned_id'])
+        if template is None:
+            return jsonify({'error': 'Canned message not found'}), 404
+    elif not content:
+        return jsonify({'error': 'Content or canned_id is required'}), 400
+    
     session = Session()
     try:
-        messages = session.query(CannedMessage).all()
-        result = [{
-            'id': msg.id,
-            'title': msg.title,
-            'content': msg.content,
-            'category': msg.category
-        } for msg in messages]
-        return jsonify(result)
+        messages = load_bulk_messages(session, message_ids)
+        claimed = claims.active_claims(session.connection(), messages)
+        results, staged = [], []
+        for message_id in message_ids:
+            original_message = messages.get(message_id)
+            if original_message is None:
+                results.append(bulk_failure(message_id, 'Message not found', 404))
+                continue
+            if claimed.get(message_id, agent_id) != agent_id:
+                results.append(bulk_failure(message_id, f'Message is claimed by agent {claimed[message_id]}', 409))
+                continue
+            reply_content = content
+            if template is not None:
+                # No agent reviews a bulk reply, so a placeholder left as written is never sent
+                context = customer_context(original_message.customer)
+                missing = template.missing(context)
+                if missing:
+                    results.append(bulk_failure(message_id, f"No value for {', '.join(missing)}", 422))
+                    continue
+                reply_content = template.render(context)
+            results.append({'message_id': message_id, 'success': True})
+            staged.append((results[-1], original_message,
+                           reply_values(original_message, reply_content, agent_id, agent_name),
+                           mark_replied(original_message)))
+        
+        items, committed = [], []
+        if staged:
+            # One multi-row INSERT whose RETURNING rows come back in parameter order
+            reply_ids = session.execute(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True),
+                [values for _, _, values, _ in staged]
+            ).scalars().all()
+            for (result, _, _, _), reply_id in zip(staged, reply_ids):
+                result['reply_id'] = reply_id
+            session.flush()
+            search_index.index_messages(session, [result['reply_id'] for result, _, _, _ in staged])
+            conversations.refresh(session, {original.customer_id for _, original, _, _ in staged})
+            claims.release_claims(session.connection(), [original.id for _, original, _, _ in staged])
+        for result, original_message, values, previous_status in staged:
+            updated = message_to_inbox_dict(original_message, original_message.customer)
+            items.append({
+                'op': 'update',
+                'event': 'new_reply',
+                'message_id': original_message.id,
+                'customer_id': original_message.customer_id,
+                'message': updated,
+                'reply': {
+                    'id': result['reply_id'],
+                    'content': values['content'],
+                    'direction': 'outgoing',
+                    'agent_name': agent_name,
+                    'created_at': values['created_at'].isoformat()
+                }
+            })
+            committed.append((updated, previous_status, agent_id,
+                              original_message.created_at, original_message.replied_at))
+        session.commit()
+        
+        for effects in committed:
+            reply_committed(*effects)
+        if items:
+            rooms, customer_rooms = socket_rooms.batch_rooms(items, agent_id=agent_id)
+            changes.publish_batch('messages_batch', items, to=rooms, partial=customer_rooms)
+        return bulk_response(results)
     finally:
         session.close()
 
+@app.route('/api/messages/bulk-status', methods=['POST'])
+def bulk_status():
+    """Mark many messages ``read`` (unread ones) or ``unread`` (read ones) in one transaction"""
+    data = request.get_json(silent=True) or {}
+    try:
+        message_ids = bulk_message_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    status = data.get('status', 'read')
+    if status not in BULK_STATUSES:
+        return jsonify({'error': f"status must be one of {', '.join(BULK_STATUSES)}"}), 400
+    
+    session = Session()
+    try:
+        messages = load_bulk_messages(session, message_ids)
+        results, changed = [], []
+        for message_id in message_ids:
+            message = messages.get(message_id)
+            if message is None:
+                results.append(bulk_failure(message_id, 'Message not found', 404))
+                continue
+            # Like mark_as_read, anything else (e.g. replied) is left as it is
+            applies = message.status == BULK_STATUSES[status]
+            results.append({'message_id': message_id, 'success': True, 'changed': applies})
+            if applies:
+                message.status = status
+                changed.append(message)
+        
+        items = []
+        if changed:
+            session.flush()
+            conversations.refresh(session, {message.customer_id for message in changed})
+            items = [{
+                'op': 'status',
+                'event': 'message_status',
+                'message_id': message.id,
+                'customer_id': message.customer_id,
+                'status': status,
+                'message': message_to_inbox_dict(message, message.customer)
+            } for message in changed]
+        session.commit()
+        
+        for item in items:
+            conversation_cache.invalidate(item['customer_id'])
+            inbox_stats.status_changed(item['message']['priority'], BULK_STATUSES[status], status)
+        if items:
+            rooms, customer_rooms = socket_rooms.batch_rooms(items)
+            changes.publish_batch('messages_batch', items, to=rooms, partial=customer_rooms)
+        return bulk_response(results)
+    finally:
+        session.close()
+
+@app.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Deltas published after ?since=<seq>; 'reset' tells the client to reload fully"""
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since must be an integer'}), 400
+    deltas = changes.since(since, request.args.get('epoch'))
+    if deltas is None:
+        return jsonify({'reset': True, 'seq': changes.seq, 'epoch': changes.epoch})
+    # Report the last delta actually returned; anything newer arrives over the socket
+    seq = deltas[-1]['seq'] if deltas else since
+    return jsonify({'reset': False, 'seq': seq, 'epoch': changes.epoch, 'changes': deltas})
+
+def load_canned_messages():
+    # The primary, not a replica: a reload right after create_canned_message must see the new row
+    session = Session()
+    try:
+        rows = session.query(
+            CannedMessage.id, CannedMessage.title, CannedMessage.content, CannedMessage.category
+        ).order_by(CannedMessage.id)
+        return [row._asdict() for row in rows]
+    finally:
+        session.close()
+
+# Canned messages served from memory (see canned.py)
+canned_catalog = CannedCatalog(load_canned_messages, ttl=float(os.environ.get('CANNED_CACHE_TTL', 30)))
+
+@app.route('/api/canned-messages', methods=['GET'])
+def get_canned_messages():
+    """Get all canned messages (ETag / If-None-Match), or type-ahead matches for ``q``"""
+    catalog = canned_catalog.get()
+    query = request.args.get('q', '').strip()
+    if query:
+        try:
+            limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        return jsonify(catalog.search(query, limit))
+    response = Response(catalog.body, mimetype='application/json')
+    response.set_etag(catalog.etag)
+    response.headers['Cache-Control'] = 'no-cache'  # revalidate every time; unchanged lists cost a 304
+    return response.make_conditional(request)
+
+@app.route('/api/canned-messages/<int:canned_id>/render', methods=['GET'])
+def render_canned_message(canned_id):
+    """Canned message with its placeholders filled in from ``customer_id``'s profile"""
+    catalog = canned_catalog.get()
+    template = catalog.templates.get(canned_id)
+    if template is None:
+        return jsonify({'error': 'Canned message not found'}), 404
+    context = {}
+    customer_id = request.args.get('customer_id')
+    if customer_id:
+        session = ReadSession()
+        try:
+            customer = session.get(Customer, int(customer_id)) if customer_id.isdigit() else None
+            if customer is None:
+                return jsonify({'error': 'Customer not found'}), 404
+            context = customer_context(customer)
+        finally:
+            session.close()
+    return jsonify({
+        'id': canned_id,
+        'title': catalog.by_id[canned_id]['title'],
+        'content': template.render(context),
+        'missing': template.missing(context)
+    })
+
 @app.route('/api/canned-messages', methods=['POST'])
 def create_canned_message():
     """Create a new canned message"""
@@ -328,40 +1264,85 @@ def create_canned_message():
         )
         session.add(canned)
         session.commit()
+        canned_catalog.invalidate()
         return jsonify({'success': True, 'id': canned.id})
     finally:
         session.close()
 
+ARCHIVE_SEARCH_PREVIEW = 200
+
+def search_archived_messages(session, query, limit=50):
+    """Archived messages containing every word of ``query``, newest first.
+
+    The archive has no full-text index (keeping the hot one small is the
+    point of archiving), so this is a scan, run only on request.
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return []
+    c = archive.archived_messages.c
+    rows = session.execute(
+        select(c.id, c.content, Customer.name, c.created_at)
+        .select_from(archive.archived_messages)
+        .outerjoin(Customer, Customer.id == c.customer_id)
+        .where(*(c.content.icontains(term, autoescape=True) for term in terms))
+        .order_by(c.created_at.desc(), c.id.desc())
+        .limit(limit)
+    ).all()
+    return [{
+        'id': row.id,
+        'content': search_index.highlight((row.content or '')[:ARCHIVE_SEARCH_PREVIEW]),
+        'customer_name': row.name if row.name is not None else 'Unknown',
+        'created_at': row.created_at,
+        'archived': True
+    } for row in rows]
+
 @app.route('/api/search', methods=['GET'])
 def search():
-    """Search messages and customers"""
-    session = Session()
+    """Search messages and customers; ``include_archived=1`` appends matching archived messages"""
+    session = ReadSession()
     try:
         query = request.args.get('q', '')
         if not query:
             return jsonify({'messages': [], 'customers': []})
         
-        # Search messages
-        messages = session.query(Message).join(Customer).filter(
-            (Message.content.contains(query)) |
-            (Customer.name.contains(query)) |
-            (Customer.email.contains(query))
-        ).limit(50).all()
+        search_backend = search_index.backend(session)
+        match_query = search_backend.match_query(query)
+        if match_query is None:
+            return jsonify({'messages': [], 'customers': []})
+        
+        # Search messages, best match first (bm25 on SQLite, ts_rank on PostgreSQL)
+        messages = session.query(
+            Message.id,
+            search_backend.message_snippet(match_query, Message.content).label('snippet'),
+            Customer.name,
+            Message.created_at
+        ).select_from(search_backend.message_table).join(
+            Message, Message.id == search_backend.message_key
+        ).outerjoin(
+            Customer, Customer.id == Message.customer_id
+        ).filter(
+            search_backend.message_match(match_query)
+        ).order_by(search_backend.message_order(match_query)).limit(50).all()
         
         # Search customers
-        customers = session.query(Customer).filter(
-            (Customer.name.contains(query)) |
-            (Customer.email.contains(query)) |
-            (Customer.phone.contains(query))
-        ).limit(20).all()
+        customers = session.query(
+            Customer.id, Customer.name, Customer.email, Customer.phone
+        ).select_from(search_backend.customer_table).join(
+            Customer, Customer.id == search_backend.customer_key
+        ).filter(
+            search_backend.customer_match(match_query)
+        ).order_by(search_backend.customer_order(match_query)).limit(20).all()
+        
+        archived = search_archived_messages(session, query) if include_archived_arg() else []
         
         return jsonify({
             'messages': [{
                 'id': msg.id,
-                'content': msg.content[:100],
-                'customer_name': msg.customer.name if msg.customer else 'Unknown',
-                'created_at': msg.created_at.isoformat()
-            } for msg in messages],
+                'content': search_index.highlight(msg.snippet),
+                'customer_name': msg.name if msg.name is not None else 'Unknown',
+                'created_at': msg.created_at
+            } for msg in messages] + archived,
             'customers': [{
                 'id': cust.id,
                 'name': cust.name,
@@ -372,6 +1353,29 @@ def search():
     finally:
         session.close()
 
+@app.route('/api/priority/keywords', methods=['GET'])
+def get_priority_keywords():
+    """Get the live priority keyword table (changed through PRIORITY_KEYWORDS_FILE, see priority.py)"""
+    return jsonify(priority_classifier.keywords)
+
+@app.route('/api/socket/rooms', methods=['GET'])
+def socket_room_stats():
+    """Members connected to this process and fan-out counters per room"""
+    stats = room_stats.snapshot()
+    members = {
+        room: len(sids) for room, sids in socketio.server.manager.rooms.get('/', {}).items()
+        if room == socket_rooms.INBOX_ROOM or (isinstance(room, str) and ':' in room)
+    }
+    return jsonify({'rooms': {
+        room: {'members': members.get(room, 0), **stats.get(room, {'events': 0, 'deliveries': 0})}
+        for room in sorted(set(stats) | set(members))
+    }})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Request, SQL and Socket.IO metrics in Prometheus text format"""
+    return Response(request_metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
 # Serve HTML files
 @app.route('/')
 def index():
@@ -387,14 +1391,72 @@ def customer_form():
 
 # WebSocket events
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
+    try:
+        identity = socket_rooms.parse_identity(auth)
+    except (KeyError, TypeError, ValueError):
+        return False
+    socket_clients[request.sid] = identity
+    for room in socket_rooms.connect_rooms(identity):
+        join_room(room)
     print('Client connected')
-    emit('connected', {'data': 'Connected to server'})
+    emit('connected', {'data': 'Connected to server', 'rooms': subscribed_rooms()})
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    socket_clients.pop(request.sid, None)
     print('Client disconnected')
 
+def subscribed_rooms():
+    return sorted(room for room in joined_rooms() if room != request.sid)
+
+@socketio.on('subscribe')
+def handle_subscribe(data):
+    """Join rooms; acknowledges with the client's rooms and any refused ones"""
+    identity = socket_clients.get(request.sid, {})
+    rejected = []
+    for room in (data or {}).get('rooms', []):
+        if socket_rooms.may_join(identity, room):
+            join_room(room)
+        else:
+            rejected.append(room)
+    return {'rooms': subscribed_rooms(), 'rejected': rejected}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe(data):
+    for room in (data or {}).get('rooms', []):
+        if room != request.sid:
+            leave_room(room)
+    return {'rooms': subscribed_rooms()}
+
+_started = False
+
+def create_app(init_schema=True):
+    """Get the server ready to serve: create missing tables, load the work queue, start the background writers.
+
+    Importing this module only defines the app. Run this once per server
+    process (``python3 app.py`` does; for gunicorn use ``'app:create_app()'``);
+    later calls return the same app.
+    """
+    global _started
+    if not _started:
+        if init_schema:
+            create_schema(engine)
+        session = ReadSession()
+        try:
+            rebuild_work_queue(session)
+        finally:
+            session.close()
+        if INGEST_MODE == 'async':
+            ingest_queue.start()
+            atexit.register(ingest_queue.stop)
+        if ARCHIVE_AFTER_DAYS:
+            archive_scheduler.start()
+            atexit.register(archive_scheduler.stop)
+        _started = True
+    return app
+
 if __name__ == '__main__':
-    socketio.run(app, debug=True, port=5000)
+    create_app()
+    socketio.run(app, debug=True, port=int(os.environ.get('PORT', 5000)))
 
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Hot/cold tiering: replied messages past a given age move to ``archived_messages``.
+
+Agents work on open messages; years of answered ones only slow down the
+inbox, status and search queries and grow the database. ``archive_old``
+moves incoming messages first replied to before a cutoff (``replied_at``),
+and agent replies sent before it, out of ``messages``. Only closed threads
+are touched: while a customer has a message awaiting a reply, their whole
+history stays hot, so agents working the thread keep the earlier replies.
+Both directions move together, so the hot conversation view never shows
+answers to questions it no longer has.
+
+Rows move in batches of ``batch_size`` (default 500), found by a forward
+scan on the primary key, and each batch takes two short write transactions:
+
+1. copy the rows into ``archived_messages`` (``ON CONFLICT DO NOTHING``,
+   so a repeated copy is harmless);
+2. delete the copied rows from ``messages`` whose thread is still closed,
+   drop the archive copies of any that a new message kept hot, add the
+   moved ones to ``archive_totals`` (reply counts and first-response times
+   for the dashboard), drop their search index rows and recompute their
+   threads.
+
+No lock is held between batches (``pause`` seconds apart), and a crash
+between the two steps loses nothing: the next run deletes what was copied.
+Copying first also keeps this safe when the archive is a separate SQLite
+file (``ARCHIVE_DATABASE``, see database.py), where WAL mode does not make
+a transaction spanning two files atomic. In that file the archive stops
+counting against the main database; otherwise it is a table next to
+``messages``. Archived rows are read only on request (``include_archived``
+on ``GET /api/messages/<id>`` and ``/api/search``).
+
+``compact`` reclaims the space freed by archiving. On SQLite it runs
+``VACUUM`` on each file whose free pages exceed ``min_free_ratio``; on
+PostgreSQL it runs ``VACUUM ANALYZE`` on tables with that share of dead
+rows. ``sizes`` reports row counts and storage bytes. ``ArchiveScheduler``
+runs archive + compact periodically inside the server (``ARCHIVE_AFTER_DAYS``).
+
+Usage:
+    python3 archive.py --older-than-days 90    # archive, then compact if worthwhile
+    python3 archive.py --stats                 # row counts and sizes
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from collections import Counter
+
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, Text, DateTime, Float, select, text, func
+
+import conversations
+import search_index
+from database import ARCHIVE_SCHEMA, DATABASE_URL, ARCHIVE_DATABASE, create_database_engine, dialect_name, insert
+from inbox_stats import seconds_between
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MIN_FREE_RATIO = 0.25
+
+# Own MetaData, like the search tables: create_all on the models never touches it
+archive_metadata = MetaData()
+archived_messages = Table(
+    'archived_messages', archive_metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),  # messages.id
+    Column('customer_id', Integer),
+    Column('content', Text),
+    Column('direction', String(20)),
+    Column('agent_id', Integer),
+    Column('agent_name', String(100)),
+    Column('status', String(20)),
+    Column('priority', Integer),
+    Column('created_at', DateTime),
+    Column('replied_at', DateTime),
+    Column('repeat_count', Integer, nullable=False, server_default='0'),
+    Column('archived_at', DateTime, nullable=False),
+    Index('ix_archived_messages_customer_created', 'customer_id', 'created_at'),
+)
+
+# Reply counts per agent and first-response totals of everything archived, kept by
+# archive_batch so the dashboard never rescans archived_messages. The 'replies'
+# rows are per agent (0 stands for none); 'first_response' has one row, agent 0.
+archive_totals = Table(
+    'archive_totals', archive_metadata,
+    Column('metric', String(20), primary_key=True),
+    Column('agent_id', Integer, primary_key=True, autoincrement=False),
+    Column('total', Integer, nullable=False),
+    Column('seconds', Float, nullable=False),
+)
+
+MESSAGE_COLUMNS = ('id', 'customer_id', 'content', 'direction', 'agent_id', 'agent_name',
+                   'status', 'priority', 'created_at', 'replied_at', 'repeat_count')
+
+# Incoming messages age from their first reply, replies from when they were sent; a
+# customer with any message still awaiting a reply keeps the whole thread hot
+SELECT_BATCH_SQL = (
+    "SELECT id, customer_id FROM messages m "
+    "WHERE id > :after "
+    "AND ((direction = 'incoming' AND status = 'replied' AND COALESCE(replied_at, created_at) < :cutoff) "
+    "OR (direction = 'outgoing' AND created_at < :cutoff)) "
+    "AND NOT EXISTS (SELECT 1 FROM messages o WHERE o.customer_id = m.customer_id "
+    "AND o.direction = 'incoming' AND o.status <> 'replied') "
+    "ORDER BY id LIMIT :limit"
+)
+COPY_SQL = (
+    f"INSERT INTO archived_messages ({', '.join(MESSAGE_COLUMNS)}, archived_at) "
+    f"SELECT {', '.join(MESSAGE_COLUMNS)}, :now FROM messages WHERE id IN ({{ids}}) "
+    "ON CONFLICT (id) DO NOTHING"
+)
+# The thread check is repeated here: a message that arrived after the batch
+# was selected reopens the thread, and its rows then stay hot
+DELETE_COPIED_SQL = (
+    "DELETE FROM messages WHERE id IN (SELECT id FROM archived_messages WHERE id IN ({ids})) "
+    "AND NOT EXISTS (SELECT 1 FROM messages o WHERE o.customer_id = messages.customer_id "
+    "AND o.direction = 'incoming' AND o.status <> 'replied') "
+    "RETURNING id, customer_id"
+)
+DROP_UNMOVED_COPIES_SQL = (
+    "DELETE FROM archived_messages WHERE id IN ({ids}) AND id IN (SELECT id FROM messages WHERE id IN ({ids}))"
+)
+
+
+def _id_clause(ids):
+    return ','.join(str(int(i)) for i in ids)
+
+
+def _sqlite_schemas(conn):
+    """Attached database names, 'main' first"""
+    return [row[1] for row in conn.exec_driver_sql('PRAGMA database_list') if row[1] != 'temp']
+
+
+def create_tables(bind):
+    """Create ``archived_messages``, in the attached archive file when there is one"""
+    with bind.begin() as conn:
+        if dialect_name(conn) == 'sqlite' and ARCHIVE_SCHEMA in _sqlite_schemas(conn):
+            # Unqualified names resolve to attached files when main has no such table
+            conn = conn.execution_options(schema_translate_map={None: ARCHIVE_SCHEMA})
+        archive_metadata.create_all(conn)
+        # Archives written before archive_totals existed: count them once
+        if conn.execute(select(archived_messages.c.id).limit(1)).first() is not None and \
+                conn.execute(select(archive_totals.c.metric).limit(1)).first() is None:
+            add_totals(conn, archived_messages.c.id.isnot(None))
+
+
+def add_totals(conn, where):
+    """Add the archived messages matching ``where`` to ``archive_totals``"""
+    c = archived_messages.c
+    replies = Counter()
+    for agent_id, count in conn.execute(
+        select(c.agent_id, func.count()).where(where, c.direction == 'outgoing').group_by(c.agent_id)
+    ):
+        replies[agent_id or 0] += count
+    rows = [{'metric': 'replies', 'agent_id': agent_id, 'total': count, 'seconds': 0.0}
+            for agent_id, count in replies.items()]
+    seconds, count = conn.execute(
+        select(func.sum(seconds_between(conn, c.created_at, c.replied_at)), func.count())
+        .where(where, c.direction == 'incoming', c.replied_at.isnot(None))
+    ).one()
+    if count:
+        rows.append({'metric': 'first_response', 'agent_id': 0, 'total': count, 'seconds': float(seconds or 0)})
+    if rows:
+        statement = insert(conn, archive_totals)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=['metric', 'agent_id'],
+            set_={'total': archive_totals.c.total + statement.excluded.total,
+                  'seconds': archive_totals.c.seconds + statement.excluded.seconds}
+        ), rows)
+
+
+def archived_totals(conn):
+    """``({agent_id: replies}, first-response seconds, first responses)`` of the archived messages"""
+    replies, seconds, count = {}, 0.0, 0
+    for row in conn.execute(select(archive_totals)):
+        if row.metric == 'replies':
+            replies[row.agent_id or None] = row.total
+        else:
+            seconds, count = row.seconds, row.total
+    return replies, seconds, count
+
+
+def archive_batch(bind, rows, now=None):
+    """Move ``(id, customer_id)`` rows to the archive; returns the number moved"""
+    now = now or datetime.utcnow()
+    ids = _id_clause(row[0] for row in rows)
+    with bind.begin() as conn:
+        conn.execute(text(COPY_SQL.format(ids=ids)), {'now': now})
+    with bind.begin() as conn:
+        moved = conn.execute(text(DELETE_COPIED_SQL.format(ids=ids))).fetchall()
+        if len(moved) < len(rows):
+            conn.execute(text(DROP_UNMOVED_COPIES_SQL.format(ids=ids)))
+        if moved:
+            add_totals(conn, archived_messages.c.id.in_([row.id for row in moved]))
+            search_index.unindex_messages(conn, [row.id for row in moved])
+            conversations.refresh(conn, {row.customer_id for row in moved if row.customer_id is not None})
+    return len(moved)
+
+
+def archive_old(bind, older_than, batch_size=DEFAULT_BATCH_SIZE, pause=0.0, now=None, on_batch=None):
+    """Archive messages replied to and agent replies sent more than ``older_than`` ago, in closed threads.
+
+    ``on_batch(customer_ids)`` runs after each committed batch. Returns
+    ``{'messages': n, 'batches': n, 'customers': n}``.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - older_than
+    after, moved, batches, customers = 0, 0, 0, set()
+    while True:
+        with bind.connect() as conn:
+            rows = conn.execute(text(SELECT_BATCH_SQL), {
+                'after': after, 'cutoff': cutoff, 'limit': batch_size
+            }).fetchall()
+        if not rows:
+            break
+        moved += archive_batch(bind, rows, now=now)
+        batches += 1
+        batch_customers = {row.customer_id for row in rows if row.customer_id is not None}
+        customers |= batch_customers
+        if on_batch is not None:
+            on_batch(batch_customers)
+        after = rows[-1].id
+        if len(rows) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return {'messages': moved, 'batches': batches, 'customers': len(customers)}
+
+
+def sizes(conn):
+    """Hot and archived row counts, plus bytes (and free bytes on SQLite) per database file or table"""
+    result = {
+        'hot_messages': conn.execute(text("SELECT COUNT(*) FROM messages")).scalar(),
+        'archived_messages': conn.execute(select(func.count()).select_from(archived_messages)).scalar(),
+        'storage': {},
+    }
+    if dialect_name(conn) == 'sqlite':
+        for schema in _sqlite_schemas(conn):
+            page_size = conn.exec_driver_sql(f'PRAGMA {schema}.page_size').scalar()
+            pages = conn.exec_driver_sql(f'PRAGMA {schema}.page_count').scalar()
+            free = conn.exec_driver_sql(f'PRAGMA {schema}.freelist_count').scalar()
+            result['storage'][schema] = {'bytes': pages * page_size, 'free_bytes': free * page_size}
+    else:
+        for table in ('messages', 'archived_messages'):
+            result['storage'][table] = {
+                'bytes': conn.execute(text("SELECT pg_total_relation_size(:t)"), {'t': table}).scalar()
+            }
+    return result
+
+
+def compact(bind, min_free_ratio=DEFAULT_MIN_FREE_RATIO):
+    """VACUUM what archiving left mostly empty; returns the names compacted"""
+    compacted = []
+    with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if dialect_name(conn) == 'sqlite':
+            for schema in _sqlite_schemas(conn):
+                pages = conn.exec_driver_sql(f'PRAGMA {schema}.page_count').scalar()
+                free = conn.exec_driver_sql(f'PRAGMA {schema}.freelist_count').scalar()
+                if pages and free / pages >= min_free_ratio:
+                    conn.exec_driver_sql(f'VACUUM {schema}')
+                    compacted.append(schema)
+            if compacted:
+                conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+        else:
+            rows = conn.execute(text(
+                "SELECT relname, n_live_tup, n_dead_tup FROM pg_stat_user_tables "
+                "WHERE relname IN ('messages', 'archived_messages', 'message_search')"
+            )).fetchall()
+            for table, live, dead in rows:
+                if dead and dead / max(live + dead, 1) >= min_free_ratio:
+                    conn.exec_driver_sql(f'VACUUM (ANALYZE) {table}')
+                    compacted.append(table)
+    return compacted
+
+
+class ArchiveScheduler:
+    """Background thread that archives and compacts every ``interval`` seconds"""
+
+    def __init__(self, bind, older_than, interval=3600, batch_size=DEFAULT_BATCH_SIZE, pause=0.05,
+                 min_free_ratio=DEFAULT_MIN_FREE_RATIO, on_batch=None):
+        self.bind = bind
+        self.older_than = older_than
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.min_free_ratio = min_free_ratio
+        self.on_batch = on_batch
+        self.last_run = None
+        self.last_sizes = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def run_once(self, now=None):
+        started = time.perf_counter()
+        archived = archive_old(self.bind, self.older_than, batch_size=self.batch_size, pause=self.pause,
+                               now=now, on_batch=self.on_batch)
+        compacted = compact(self.bind, self.min_free_ratio) if archived['messages'] else []
+        with self.bind.connect() as conn:
+            self.last_sizes = sizes(conn)
+        self.last_run = dict(archived, compacted=compacted, seconds=round(time.perf_counter() - started, 3),
+                             finished_at=datetime.utcnow().isoformat())
+        return self.last_run
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='archiver', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Archive run failed')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old replied messages to the archive')
+    parser.add_argument('--database-url', default=DATABASE_URL)
+    parser.add_argument('--archive-database', default=ARCHIVE_DATABASE,
+                        help='SQLite file attached as the archive (default: a table in the main database)')
+    parser.add_argument('--older-than-days', type=float, default=None)
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds between batches')
+    parser.add_argument('--min-free-ratio', type=float, default=DEFAULT_MIN_FREE_RATIO,
+                        help='compact files/tables with at least this share of free space')
+    parser.add_argument('--stats', action='store_true', help='only print row counts and sizes')
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.database_url, archive_path=args.archive_database)
+    create_tables(engine)
+    if not args.stats:
+        if args.older_than_days is None:
+            parser.error('--older-than-days is required unless --stats is given')
+        started = time.perf_counter()
+        result = archive_old(engine, timedelta(days=args.older_than_days),
+                             batch_size=args.batch_size, pause=args.pause)
+        print(f"Archived {result['messages']} messages of {result['customers']} customers "
+              f"in {result['batches']} batches ({time.perf_counter() - started:.1f}s)")
+        compacted = compact(engine, args.min_free_ratio)
+        if compacted:
+            print(f"Compacted: {', '.join(compacted)}")
+    with engine.connect() as conn:
+        print(json.dumps(sizes(conn), indent=2))
+
+
+if __name__ == '__main__':
+    main()
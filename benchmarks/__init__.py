@@ -0,0 +1 @@
+"""Standalone benchmark scripts. Run from the repository root, e.g. `python3 -m benchmarks.indexes`."""
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+N single-message calls against one bulk call, for replies and for marking
+messages read, on a throwaway SQLite file.
+
+Reports wall time, commits and Socket.IO emits for each way (a bulk call
+emits once to the agent rooms plus once per customer room it touches).
+
+    python3 -m benchmarks.bulk --messages 50 --rounds 5
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+
+import app as app_module
+import models
+from change_feed import ChangeFeed, MemoryChangeLog
+
+
+def setup(path):
+    engine = create_engine(f'sqlite:///{path}')
+    models.create_schema(engine)
+    app_module.Session.configure(bind=engine)
+    app_module.ReadSession.configure(bind=engine)
+    counts = {'commits': 0, 'emits': 0}
+    event.listen(engine, 'commit', lambda conn: counts.__setitem__('commits', counts['commits'] + 1))
+
+    def emit(event_name, data, to=None):
+        counts['emits'] += 1
+    app_module.changes = ChangeFeed(emit=emit, log=MemoryChangeLog())
+    return engine, counts
+
+
+def seed(n_messages):
+    session = app_module.Session()
+    customers = [app_module.Customer(name=f'Customer {i}', email=f'bulk{i}-{time.monotonic_ns()}@example.com')
+                 for i in range(min(n_messages, 20))]
+    session.add_all(customers)
+    session.flush()
+    messages = [app_module.Message(customer_id=customers[i % len(customers)].id, content=f'question {i}',
+                                   direction='incoming', status='unread', priority=i % 3)
+                for i in range(n_messages)]
+    session.add_all(messages)
+    session.commit()
+    ids = [message.id for message in messages]
+    session.close()
+    return ids
+
+
+def measure(counts, call):
+    before = dict(counts)
+    started = time.perf_counter()
+    call()
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, counts['commits'] - before['commits'], counts['emits'] - before['emits']
+
+
+def run(client, counts, n_messages, rounds):
+    operations = {
+        'reply': (
+            lambda ids: [client.post(f'/api/messages/{i}/reply', json={'content': 'Thanks, on it'}) for i in ids],
+            lambda ids: client.post('/api/messages/bulk-reply', json={'message_ids': ids, 'content': 'Thanks, on it'}),
+        ),
+        'read': (
+            lambda ids: [client.post(f'/api/messages/{i}/read') for i in ids],
+            lambda ids: client.post('/api/messages/bulk-status', json={'message_ids': ids, 'status': 'read'}),
+        ),
+    }
+    for name, (single, bulk) in operations.items():
+        results = {'single': [], 'bulk': []}
+        for _ in range(rounds):
+            for way, call in (('single', single), ('bulk', bulk)):
+                ids = seed(n_messages)
+                results[way].append(measure(counts, lambda: call(ids)))
+        for way, runs in results.items():
+            ms = statistics.median(r[0] for r in runs)
+            print(f"{name:>5} x{n_messages} {way:>6}: {ms:8.1f} ms  commits {runs[-1][1]:>4}  emits {runs[-1][2]:>4}")
+        speedup = statistics.median(r[0] for r in results['single']) / statistics.median(r[0] for r in results['bulk'])
+        print(f"{'':>5}       bulk speedup {speedup:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        engine, counts = setup(os.path.join(workdir, 'bulk.db'))
+        run(app_module.app.test_client(), counts, args.messages, args.rounds)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
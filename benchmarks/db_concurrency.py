@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Mixed concurrent reads and writes against SQLite with default engine settings
+(rollback journal, default pool) and with the tuned engines from
+database.py (WAL, busy_timeout, separate read-only pool).
+
+Readers fetch inbox pages; writers insert a message per transaction, like
+send-message. Reports throughput, p95 latency and "database is locked" errors.
+
+    python3 -m benchmarks.db_concurrency --readers 8 --writers 4 --seconds 5
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from models import Base
+from database import create_database_engine
+from benchmarks.indexes import seed
+
+INBOX_PAGE = text(
+    "SELECT m.id, m.content, c.name FROM messages m LEFT JOIN customers c ON c.id = m.customer_id "
+    "WHERE m.direction = 'incoming' ORDER BY m.priority DESC, m.created_at DESC, m.id DESC LIMIT 50"
+)
+INSERT_MESSAGE = text(
+    "INSERT INTO messages (customer_id, content, direction, status, priority, created_at) "
+    "VALUES (:customer_id, :content, 'incoming', 'unread', 1, :created_at)"
+)
+
+
+def worker(engine, write, stop, results):
+    latencies, errors, n = [], 0, 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            if write:
+                with engine.begin() as conn:
+                    conn.execute(INSERT_MESSAGE, {
+                        'customer_id': n % 1000 + 1, 'content': f'bench {n}', 'created_at': datetime.utcnow()
+                    })
+            else:
+                with engine.connect() as conn:
+                    conn.execute(INBOX_PAGE).fetchall()
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+        n += 1
+    results.append((write, latencies, errors))
+
+
+def run(label, write_engine, read_engine, readers, writers, seconds):
+    stop = threading.Event()
+    results = []
+    threads = [threading.Thread(target=worker, args=(read_engine, False, stop, results)) for _ in range(readers)]
+    threads += [threading.Thread(target=worker, args=(write_engine, True, stop, results)) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"\n{label}")
+    for write, name in ((False, 'reads'), (True, 'writes')):
+        latencies = sorted(ms for w, lat, _ in results if w == write for ms in lat)
+        errors = sum(err for w, _, err in results if w == write)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else float('nan')
+        print(f"  {name:<7}{len(latencies) / seconds:>10.0f}/s   p95 {p95:>8.2f} ms   locked errors {errors}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ('default engine', 'tuned engines (database.py)'):
+            url = f"sqlite:///{os.path.join(tmp, label.split()[0] + '.db')}"
+            if label.startswith('default'):
+                write_engine = read_engine = create_engine(url)
+            else:
+                write_engine = create_database_engine(url)
+                read_engine = create_database_engine(url, readonly=True)
+            Base.metadata.create_all(write_engine)
+            seed(write_engine, args.messages, 1000)
+            run(label, write_engine, read_engine, args.readers, args.writers, args.seconds)
+            write_engine.dispose()
+            read_engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Customer writes while one client floods send-message, with the rate limiter
+off and on, on a throwaway SQLite file.
+
+Regular customers each post from their own address and email; flooder
+threads post ``--flood-rate`` requests per second in total (or as many as the
+server answers, if fewer) from one address with ever-changing emails. Three
+phases run for ``--seconds`` each: no flood, flood without limits, flood
+with limits. Reports the regular customers' accepted messages per second and
+latency, the flood requests answered and accepted, and the messages committed
+and Socket.IO emits per second.
+
+    python3 -m benchmarks.flood --customers 8 --flood-rate 300 --seconds 5
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import event
+
+import app as app_module
+import database
+import models
+import ratelimit
+from change_feed import ChangeFeed, MemoryChangeLog
+
+FLOOD_ADDRESS = '203.0.113.7'
+
+
+def setup(path):
+    engine = database.create_database_engine(f'sqlite:///{path}')
+    models.create_schema(engine)
+    app_module.Session.configure(bind=engine)
+    app_module.ReadSession.configure(bind=engine)
+    app_module.DEDUPE = False  # every flood message would otherwise collapse into one
+    counts = {'commits': 0, 'emits': 0}
+    lock = threading.Lock()
+
+    def count(name):
+        with lock:
+            counts[name] += 1
+    event.listen(engine, 'commit', lambda conn: count('commits'))
+    app_module.changes = ChangeFeed(emit=lambda *args, **kwargs: count('emits'), log=MemoryChangeLog())
+    return engine, counts
+
+
+def post(client, address, email, content):
+    started = time.perf_counter()
+    response = client.post('/api/customers/send-message', json={'name': 'Load Test', 'email': email, 'content': content},
+                           environ_base={'REMOTE_ADDR': address})
+    return response.status_code, (time.perf_counter() - started) * 1000
+
+
+def run_phase(name, n_customers, n_flooders, flood_rate, seconds, think, counts):
+    client = app_module.app.test_client()
+    stop = threading.Event()
+    sequence = itertools.count()
+    customer_results, flood_results = [], []
+
+    def customer(i):
+        while not stop.is_set():
+            n = next(sequence)
+            customer_results.append(post(client, f'10.1.{i}.{n % 250}', f'customer{n}@example.com', f'question {n}'))
+            stop.wait(think)
+
+    def flooder():
+        interval = n_flooders / flood_rate
+        next_at = time.perf_counter()
+        while not stop.is_set():
+            n = next(sequence)
+            flood_results.append(post(client, FLOOD_ADDRESS, f'spam{n}@example.com', f'buy now {n}'))
+            next_at += interval
+            stop.wait(max(next_at - time.perf_counter(), 0))
+
+    threads = [threading.Thread(target=customer, args=(i,)) for i in range(n_customers)]
+    threads += [threading.Thread(target=flooder) for _ in range(n_flooders)]
+    before = dict(counts)
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    stop.wait(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    accepted = sorted(ms for code, ms in customer_results if code == 200)
+    p95 = accepted[int(len(accepted) * 0.95) - 1] if accepted else float('nan')
+    flood_accepted = sum(1 for code, _ in flood_results if code == 200)
+    print(f"{name:<22} customers {len(accepted) / elapsed:7.1f} msg/s "
+          f"(p50 {statistics.median(accepted) if accepted else float('nan'):6.1f} ms, p95 {p95:6.1f} ms, "
+          f"rejected {len(customer_results) - len(accepted)})  "
+          f"flood {len(flood_results) / elapsed:7.1f} req/s, {flood_accepted / elapsed:6.1f} accepted/s  "
+          f"commits {(counts['commits'] - before['commits']) / elapsed:6.1f}/s  "
+          f"emits {(counts['emits'] - before['emits']) / elapsed:6.1f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--customers', type=int, default=8, help='regular customer threads')
+    parser.add_argument('--flooders', type=int, default=4, help='threads flooding from one address')
+    parser.add_argument('--flood-rate', type=float, default=300, help='flood requests per second, all threads')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--think', type=float, default=0.01, help='pause between a customer\'s messages')
+    parser.add_argument('--ip-limit', default='60/minute:30')
+    parser.add_argument('--email-limit', default='10/minute:5')
+    parser.add_argument('--store', choices=('memory', 'sqlite'), default='memory', help='rate limit bucket store')
+    args = parser.parse_args()
+    logging.getLogger('metrics').setLevel(logging.ERROR)  # slow-query warnings are expected under a flood
+
+    limiter = app_module.rate_limiter
+    limiter.configure(
+        'send_message',
+        ip=(ratelimit.client_ip, ratelimit.Limit.parse(args.ip_limit)),
+        email=(ratelimit.json_field('email'), ratelimit.Limit.parse(args.email_limit)),
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        engine, counts = setup(os.path.join(workdir, 'flood.db'))
+        for name, flooders, enabled in (('no flood', 0, True),
+                                        ('flood, no limits', args.flooders, False),
+                                        ('flood, rate limited', args.flooders, True)):
+            limiter.enabled = enabled
+            limiter.store = (ratelimit.SQLiteBucketStore(os.path.join(workdir, f'limits-{flooders}-{enabled}.db'))
+                             if args.store == 'sqlite' else ratelimit.MemoryBucketStore())
+            run_phase(name, args.customers, flooders, args.flood_rate, args.seconds, args.think, counts)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
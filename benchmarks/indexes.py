@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark the hot inbox/conversation/customer queries before and after the
+index migrations, printing SQLite's query plan (SCAN vs SEARCH) for each.
+
+    python3 -m benchmarks.indexes --messages 200000 --customers 20000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from models import Base
+from migrations import migrate
+
+QUERIES = {
+    'inbox page': (
+        "SELECT id FROM messages WHERE direction = 'incoming' "
+        "ORDER BY priority DESC, created_at DESC, id DESC LIMIT 50",
+        {}
+    ),
+    'unread page': (
+        "SELECT id FROM messages WHERE direction = 'incoming' AND status = 'unread' "
+        "ORDER BY priority DESC, created_at DESC, id DESC LIMIT 50",
+        {}
+    ),
+    'urgent page': (
+        "SELECT id FROM messages WHERE direction = 'incoming' AND priority >= 3 "
+        "ORDER BY priority DESC, created_at DESC, id DESC LIMIT 50",
+        {}
+    ),
+    'conversation': (
+        "SELECT id FROM messages WHERE customer_id = :customer_id ORDER BY created_at ASC",
+        {'customer_id': 42}
+    ),
+    'customer by email': (
+        "SELECT id FROM customers WHERE email = :email",
+        {'email': 'customer4242@example.com'}
+    ),
+}
+
+
+def seed(engine, n_messages, n_customers):
+    rng = random.Random(1234)
+    base = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO customers (id, name, email, customer_id) VALUES (:id, :name, :email, :cid)"
+        ), [
+            {'id': i, 'name': f'Customer {i}', 'email': f'customer{i}@example.com', 'cid': f'CUST_{i}'}
+            for i in range(1, n_customers + 1)
+        ])
+        conn.execute(text(
+            "INSERT INTO messages (customer_id, content, direction, status, priority, created_at) "
+            "VALUES (:customer_id, :content, :direction, :status, :priority, :created_at)"
+        ), [
+            {
+                'customer_id': rng.randint(1, n_customers),
+                'content': f'message {i}',
+                'direction': 'incoming' if rng.random() < 0.7 else 'outgoing',
+                'status': rng.choice(['unread', 'read', 'replied', 'replied']),
+                'priority': rng.choice([0, 0, 1, 2, 2, 3]),
+                'created_at': base + timedelta(seconds=i * 7),
+            }
+            for i in range(n_messages)
+        ])
+
+
+def drop_model_indexes(engine):
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def run_queries(engine, repeat):
+    results = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = ' / '.join(row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"), params))
+            start = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql), params).fetchall()
+            elapsed_ms = (time.perf_counter() - start) / repeat * 1000
+            results[name] = (elapsed_ms, plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(engine)
+        drop_model_indexes(engine)  # simulate a database created before the indexes existed
+        print(f"Seeding {args.messages} messages / {args.customers} customers...")
+        seed(engine, args.messages, args.customers)
+
+        before = run_queries(engine, args.repeat)
+        migrate(engine)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        after = run_queries(engine, args.repeat)
+
+        print(f"\n{'query':<20}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name in QUERIES:
+            b, b_plan = before[name]
+            a, a_plan = after[name]
+            print(f"{name:<20}{b:>12.3f}{a:>12.3f}{b / a if a else float('inf'):>9.1f}x")
+            print(f"    before: {b_plan}")
+            print(f"    after:  {a_plan}")
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
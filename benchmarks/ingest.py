@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Burst of concurrent customer submissions against the synchronous and the
+queued (INGEST_MODE=async) send-message paths, on a throwaway SQLite file.
+
+Reports request latency and the time until every message is committed.
+
+    python3 -m benchmarks.ingest --messages 2000 --clients 32
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import create_engine
+
+import app as app_module
+import models
+from ingest import IngestQueue
+
+
+def run(mode, n_messages, n_clients, workdir):
+    engine = create_engine(f"sqlite:///{os.path.join(workdir, mode + '.db')}")
+    models.create_schema(engine)
+    app_module.Session.configure(bind=engine)
+    app_module.INGEST_MODE = mode
+    app_module.rate_limiter.enabled = False  # one simulated client address
+    app_module.ingest_queue = IngestQueue(app_module.write_ingest_batch, maxsize=n_messages,
+                                          on_committed=app_module.publish_ingest_batch)
+    if mode == 'async':
+        app_module.ingest_queue.start()
+    client = app_module.app.test_client()
+
+    def post(i):
+        started = time.perf_counter()
+        response = client.post('/api/customers/send-message', json={
+            'name': f'Customer {i % 500}', 'email': f'customer{i % 500}@example.com',
+            'content': f'urgent: where is my loan approval? #{i}',
+        })
+        return response.status_code, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(n_clients) as pool:
+        results = list(pool.map(post, range(n_messages)))
+    acknowledged = time.perf_counter() - started
+    app_module.ingest_queue.stop()
+    committed = time.perf_counter() - started
+
+    latencies = sorted(ms for _, ms in results)
+    codes = {code: sum(1 for c, _ in results if c == code) for code, _ in results}
+    stats = app_module.ingest_queue.stats()
+    print(f"{mode:>5}: responses {codes}  latency ms p50 {statistics.median(latencies):.1f} "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} max {latencies[-1]:.1f}")
+    print(f"       all acknowledged {acknowledged:.2f}s, all committed {committed:.2f}s "
+          f"({n_messages / committed:.0f} msgs/sec)"
+          + (f", mean batch {stats['mean_batch_size']}, max batch {stats['max_batch_size']}" if mode == 'async' else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in ('sync', 'async'):
+            run(mode, args.messages, args.clients, workdir)
+
+
+if __name__ == '__main__':
+    main()
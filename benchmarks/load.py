@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Reproducible load test of the messaging API.
+
+Seeds a synthetic database (customers drawn from a Zipf-like distribution,
+so a few customers own long conversations), starts a local server on it and
+runs agent and customer workloads against it for a fixed time:
+
+- agents poll the inbox (first and second page, all/unread/urgent), open
+  messages, search, reply and read the dashboard stats;
+- customers post send-message bursts;
+- Socket.IO agent clients measure new_message delivery latency.
+
+Prints p50/p95/p99 latency and throughput per endpoint and writes them, with
+the git commit and parameters, to a JSON file. ``--compare`` prints the
+change against an earlier result file. Everything runs offline; the RNG seed
+makes the data and the request mix repeatable.
+
+    python3 -m benchmarks.load --messages 100000 --seconds 30 --output before.json
+    python3 -m benchmarks.load --messages 100000 --seconds 30 --compare before.json
+
+``--database PATH`` keeps the seeded SQLite file between runs (seeding 1M
+messages takes a while); ``--url`` targets a server that is already running.
+
+Requires the Socket.IO client extras: pip install "python-socketio[client]"
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+
+import requests
+import socketio
+from sqlalchemy import create_engine, func, select
+
+from models import Agent, Customer, Message, create_schema
+from benchmarks.socket_fanout import REPO_ROOT, start_worker, percentile
+from priority import default_engine as priority_classifier
+import search_index
+
+CONTENT_TEMPLATES = [
+    'When will my loan be disbursed? It has been {n} days',
+    'Urgent: the approval process for application {n} is stuck',
+    'How to update information on my account {n}',
+    'I need to change my phone number, ref {n}',
+    'What is the status of my payment {n}?',
+    'Thanks for the help yesterday ({n})',
+    'Emergency: I was charged twice for order {n}',
+    'How long does the review usually take? #{n}',
+]
+SEARCH_TERMS = ['loan', 'approval', 'phone', 'payment', 'customer12', 'charged twice', 'review', 'disb']
+INSERT_CHUNK = 10000
+
+
+def zipf_cumulative_weights(n, skew):
+    total, weights = 0.0, []
+    for rank in range(1, n + 1):
+        total += 1 / rank ** skew
+        weights.append(total)
+    return weights
+
+
+def seed_database(url, n_messages, n_customers, skew, seed):
+    """Fill an empty database with customers, agents and a conversation history"""
+    rng = random.Random(seed)
+    engine = create_engine(url)
+    create_schema(engine)
+    base = datetime.utcnow() - timedelta(seconds=n_messages * 5)
+    priorities = [priority_classifier.score(template) for template in CONTENT_TEMPLATES]
+    owners = zipf_cumulative_weights(n_customers, skew)
+    with engine.begin() as conn:
+        conn.execute(Agent.__table__.insert(), [
+            {'id': i, 'name': f'Agent {i}', 'email': f'agent{i}@example.com', 'is_active': True}
+            for i in range(1, 21)
+        ])
+        for start in range(1, n_customers + 1, INSERT_CHUNK):
+            conn.execute(Customer.__table__.insert(), [
+                {'id': i, 'name': f'Customer {i}', 'email': f'customer{i}@example.com',
+                 'phone': f'555-{i:07d}', 'customer_id': f'CUST_{i}', 'created_at': base}
+                for i in range(start, min(start + INSERT_CHUNK, n_customers + 1))
+            ])
+        for start in range(0, n_messages, INSERT_CHUNK):
+            rows = []
+            for i in range(start, min(start + INSERT_CHUNK, n_messages)):
+                customer_id = bisect_left(owners, rng.random() * owners[-1]) + 1
+                created_at = base + timedelta(seconds=i * 5)
+                template = rng.randrange(len(CONTENT_TEMPLATES))
+                incoming = rng.random() < 0.7
+                status = rng.choice(['unread', 'read', 'replied']) if incoming else 'sent'
+                rows.append({
+                    'customer_id': customer_id,
+                    'content': CONTENT_TEMPLATES[template].format(n=i) if incoming else f'Agent reply {i}',
+                    'direction': 'incoming' if incoming else 'outgoing',
+                    'agent_id': None if incoming else rng.randint(1, 20),
+                    'agent_name': None if incoming else 'Agent',
+                    'status': status,
+                    'priority': priorities[template] if incoming else 0,
+                    'created_at': created_at,
+                    'replied_at': created_at + timedelta(seconds=rng.randint(30, 7200)) if status == 'replied' else None,
+                })
+            conn.execute(Message.__table__.insert(), rows)
+    search_index.rebuild(engine)
+    engine.dispose()
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}  # endpoint -> [ms]
+        self.errors = {}
+
+    def record(self, endpoint, ms, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(ms)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+def timed(http, recorder, endpoint, method, url, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = http.request(method, url, timeout=30, **kwargs)
+    except requests.RequestException:
+        recorder.record(endpoint, (time.perf_counter() - started) * 1000, False)
+        return None
+    # 409 is a claim conflict between agents, part of normal operation
+    recorder.record(endpoint, (time.perf_counter() - started) * 1000, response.status_code < 400 or response.status_code == 409)
+    return response
+
+
+def agent_workload(base_url, recorder, stop, rng, agent_id):
+    http = requests.Session()
+    api = f'{base_url}/api'
+    recent = []  # message ids seen on inbox pages
+    while not stop.is_set():
+        action = rng.choices(['poll', 'next_page', 'open', 'search', 'reply', 'stats'], [35, 10, 20, 15, 12, 8])[0]
+        if action in ('poll', 'next_page'):
+            params = {'limit': 50}
+            status = rng.choice([None, None, 'unread'])
+            if status:
+                params['status'] = status
+            elif rng.random() < 0.2:
+                params['priority'] = 3
+            response = timed(http, recorder, 'GET /api/messages', 'GET', f'{api}/messages', params=params)
+            if response is None or response.status_code != 200:
+                continue
+            page = response.json()
+            recent = [m['id'] for m in page['messages']] or recent
+            if action == 'next_page' and page['next_cursor']:
+                timed(http, recorder, 'GET /api/messages (page 2)', 'GET', f'{api}/messages',
+                      params=dict(params, cursor=page['next_cursor']))
+        elif action == 'open' and recent:
+            timed(http, recorder, 'GET /api/messages/<id>', 'GET', f'{api}/messages/{rng.choice(recent)}')
+        elif action == 'search':
+            timed(http, recorder, 'GET /api/search', 'GET', f'{api}/search', params={'q': rng.choice(SEARCH_TERMS)})
+        elif action == 'reply' and recent:
+            timed(http, recorder, 'POST /api/messages/<id>/reply', 'POST', f'{api}/messages/{recent.pop()}/reply',
+                  json={'content': 'Thanks, we are looking into it', 'agent_id': agent_id, 'agent_name': f'Agent {agent_id}'})
+        elif action == 'stats':
+            timed(http, recorder, 'GET /api/stats', 'GET', f'{api}/stats')
+
+
+def customer_workload(base_url, recorder, stop, rng, n_customers, burst, sent_at, sent_lock, counter):
+    http = requests.Session()
+    while not stop.is_set():
+        for _ in range(rng.randint(1, burst)):
+            i = next(counter)
+            customer = rng.randint(1, n_customers + 1000)  # some customers are new
+            started = time.perf_counter()
+            response = timed(http, recorder, 'POST /api/customers/send-message', 'POST',
+                             f'{base_url}/api/customers/send-message', json={
+                                 'name': f'Customer {customer}', 'email': f'customer{customer}@example.com',
+                                 'content': rng.choice(CONTENT_TEMPLATES).format(n=i),
+                             })
+            if response is not None and response.status_code == 200:
+                with sent_lock:
+                    sent_at[response.json()['message_id']] = started
+        stop.wait(rng.uniform(0.2, 1.0))
+
+
+def summarize(values, seconds):
+    if not values:
+        return {'requests': 0}
+    return {
+        'requests': len(values),
+        'throughput_rps': round(len(values) / seconds, 1),
+        'p50_ms': round(percentile(values, 50), 2),
+        'p95_ms': round(percentile(values, 95), 2),
+        'p99_ms': round(percentile(values, 99), 2),
+        'mean_ms': round(sum(values) / len(values), 2),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                               cwd=REPO_ROOT, capture_output=True, text=True, check=True)
+        return commit.stdout.strip(), bool(dirty.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_report(result, previous=None):
+    print(f"\n{'endpoint':<36}{'req':>7}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}  errors")
+    for endpoint, stats in sorted(result['endpoints'].items()):
+        if not stats['requests']:
+            continue
+        line = (f"{endpoint:<36}{stats['requests']:>7}{stats['throughput_rps']:>9.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}  {stats['errors']}")
+        before = (previous or {}).get('endpoints', {}).get(endpoint)
+        if before and before.get('requests'):
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            line += f"   p95 {before['p95_ms']:.1f} -> {stats['p95_ms']:.1f} ({change:+.0f}%)"
+        print(line)
+    socket_stats = result['socket']
+    if socket_stats.get('requests'):
+        print(f"\nnew_message delivery to {result['params']['socket_clients']} clients: "
+              f"p50 {socket_stats['p50_ms']:.1f}  p95 {socket_stats['p95_ms']:.1f}  p99 {socket_stats['p99_ms']:.1f} ms")
+
+
+def run_load(base_url, args):
+    recorder = Recorder()
+    stop = threading.Event()
+    sent_at, sent_lock, deliveries = {}, threading.Lock(), []
+
+    def on_new_message(delta):
+        received = time.perf_counter()
+        with sent_lock:
+            started = sent_at.get(delta['message_id'])
+            if started is not None:
+                deliveries.append((received - started) * 1000)
+
+    clients = []
+    for i in range(args.socket_clients):
+        client = socketio.Client()
+        client.on('new_message', on_new_message)
+        client.connect(base_url, transports=['websocket'], auth={'role': 'agent', 'agent_id': i % 20 + 1})
+        clients.append(client)
+
+    counter = itertools.count()
+    threads = [
+        threading.Thread(target=agent_workload, args=(base_url, recorder, stop, random.Random(args.seed + i), i % 20 + 1))
+        for i in range(args.agents)
+    ] + [
+        threading.Thread(target=customer_workload, args=(
+            base_url, recorder, stop, random.Random(args.seed + 1000 + i), args.customers, args.burst,
+            sent_at, sent_lock, counter))
+        for i in range(args.customer_clients)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    time.sleep(0.5)  # let the last events arrive
+    for client in clients:
+        client.disconnect()
+
+    endpoints = {
+        endpoint: dict(summarize(values, elapsed), errors=recorder.errors.get(endpoint, 0))
+        for endpoint, values in recorder.latencies.items()
+    }
+    return endpoints, summarize(deliveries, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=10000, help='seeded messages (10k-1M)')
+    parser.add_argument('--customers', type=int, default=None, help='seeded customers (default: messages / 10)')
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of messages per customer')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--agents', type=int, default=8, help='concurrent agent HTTP workers')
+    parser.add_argument('--customer-clients', type=int, default=4, help='concurrent send-message workers')
+    parser.add_argument('--burst', type=int, default=10, help='largest send-message burst')
+    parser.add_argument('--socket-clients', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--database', help='SQLite file to seed (or reuse if it exists)')
+    parser.add_argument('--url', help='run against an already running server instead')
+    parser.add_argument('--port', type=int, default=5201)
+    parser.add_argument('--output', help='result file (default: benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    args = parser.parse_args()
+    args.customers = args.customers or max(args.messages // 10, 1)
+
+    commit, dirty = git_commit()
+    result = {
+        'benchmark': 'load',
+        'commit': commit,
+        'dirty': dirty,
+        'started_at': datetime.utcnow().isoformat(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'port')},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        server = None
+        base_url = args.url
+        if not base_url:
+            path = os.path.abspath(args.database or os.path.join(workdir, 'load.db'))
+            url = f'sqlite:///{path}'
+            if not os.path.exists(path):
+                started = time.perf_counter()
+                seed_database(url, args.messages, args.customers, args.skew, args.seed)
+                print(f"seeded {args.messages} messages / {args.customers} customers in "
+                      f"{time.perf_counter() - started:.1f}s")
+            engine = create_engine(url)
+            with engine.connect() as conn:
+                result['database'] = {
+                    'messages': conn.execute(select(func.count()).select_from(Message.__table__)).scalar(),
+                    'customers': conn.execute(select(func.count()).select_from(Customer.__table__)).scalar(),
+                }
+            engine.dispose()
+            server, base_url = start_worker(args.port, workdir, {'DATABASE_URL': url})
+        try:
+            result['endpoints'], result['socket'] = run_load(base_url, args)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=10)
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(result, previous)
+
+    output = args.output or os.path.join(REPO_ROOT, 'benchmarks', 'results', f"load-{(commit or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(f"\nresults written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
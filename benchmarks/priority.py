@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark of the compiled priority classifier against the original
+per-keyword substring loop.
+
+    python3 -m benchmarks.priority --messages 100000
+"""
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from priority import PriorityEngine, URGENCY_KEYWORDS
+
+SAMPLES = [
+    "When will my loan be disbursed? I need it urgently!",
+    "What's the status of my loan approval?",
+    "How to update my account information?",
+    "Hi branch I requested my number to remain the same but it was changed",
+    "This is an emergency! I need help immediately!",
+    "Just a general question about your services.",
+    "Why was my application rejected",
+    "I said ill pay on the 5th, infact you can check my records and see I always pay on time",
+]
+
+
+def legacy_calculate_priority(content):
+    """The implementation app.py used before the priority module"""
+    content_lower = content.lower()
+    priority = 0
+    for keyword in URGENCY_KEYWORDS['high']:
+        if keyword in content_lower:
+            priority = max(priority, 3)
+    for keyword in URGENCY_KEYWORDS['medium']:
+        if keyword in content_lower:
+            priority = max(priority, 2)
+    for keyword in URGENCY_KEYWORDS['low']:
+        if keyword in content_lower:
+            priority = max(priority, 1)
+    return priority
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32}{elapsed * 1000:>10.1f} ms{n / elapsed:>14,.0f} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    engine = PriorityEngine()
+    assert [legacy_calculate_priority(m) for m in SAMPLES] == [engine.score(m) for m in SAMPLES]
+
+    workloads = {
+        # every row distinct, like live traffic
+        'distinct': [f"{rng.choice(SAMPLES)} (ref {i})" for i in range(args.messages)],
+        # a few messages repeated many times, like overlapping Excel exports
+        'repeated': [rng.choice(SAMPLES) for _ in range(args.messages)],
+    }
+    for name, messages in workloads.items():
+        series = pd.Series(messages)
+        n = len(messages)
+        print(f"\n{name} messages")
+        timed('legacy keyword loop', n, lambda: [legacy_calculate_priority(m) for m in messages])
+        timed('PriorityEngine.score', n, lambda: [engine.score(m) for m in messages])
+        timed('PriorityEngine.classify', n, lambda: [engine.classify(m) for m in messages])
+        timed('legacy Series.map', n, lambda: series.map(legacy_calculate_priority))
+        timed('PriorityEngine.score_many(Series)', n, lambda: engine.score_many(series))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Multi-process Socket.IO fan-out test.
+
+Starts two server processes that share a message queue (the bundled SQLite
+queue by default) and a database, connects agents to worker B, posts customer
+messages to worker A and measures how long each new_message event takes to
+reach every agent on B. Exits non-zero if the p95 latency exceeds the budget.
+
+    python3 -m benchmarks.socket_fanout --agents 20 --messages 50 --budget-ms 500
+
+Requires the Socket.IO client extras: pip install "python-socketio[client]"
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_SCRIPT = (
+    "import os, app; "
+    "app.socketio.run(app.create_app(), port=int(os.environ['PORT']), allow_unsafe_werkzeug=True)"
+)
+
+
+def start_worker(port, workdir, extra_env):
+    """Start ``app.py`` on ``port`` in ``workdir``; returns (process, base URL) once it answers"""
+    # Every benchmark client comes from 127.0.0.1; rate limits would only measure the limiter
+    env = {**os.environ, 'RATE_LIMITS': 'off', **extra_env}
+    env.update({
+        'PORT': str(port),
+        'PYTHONPATH': REPO_ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+    })
+    process = subprocess.Popen(
+        [sys.executable, '-c', SERVER_SCRIPT],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'{base_url}/api/changes', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'worker on port {port} did not start')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--budget-ms', type=float, default=500.0, help='p95 delivery budget')
+    parser.add_argument('--queue', default=None, help='message queue URL (default: bundled SQLite queue)')
+    parser.add_argument('--port', type=int, default=5101)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        queue_url = args.queue or f"sqlite-queue:///{os.path.join(workdir, 'queue.db')}"
+        worker_a, url_a = start_worker(args.port, workdir, {'SOCKETIO_MESSAGE_QUEUE': queue_url})
+        worker_b, url_b = start_worker(args.port + 1, workdir, {'SOCKETIO_MESSAGE_QUEUE': queue_url})
+        agents = []
+        try:
+            arrivals = {}  # message_id -> list of arrival times
+            seqs = []
+            lock = threading.Lock()
+
+            def on_new_message(delta):
+                now = time.perf_counter()
+                with lock:
+                    arrivals.setdefault(delta['message_id'], []).append(now)
+                    seqs.append(delta['seq'])
+
+            for _ in range(args.agents):
+                agent = socketio.Client()
+                agent.on('new_message', on_new_message)
+                agent.connect(url_b, transports=['websocket'], auth={'role': 'agent', 'agent_id': 1})
+                agents.append(agent)
+            time.sleep(0.5)
+
+            latencies = []
+            missing = 0
+            for i in range(args.messages):
+                sent = time.perf_counter()
+                message_id = requests.post(f'{url_a}/api/customers/send-message', json={
+                    'name': f'Load Test {i}', 'email': f'load{i}@example.com', 'content': f'urgent load test {i}'
+                }).json()['message_id']
+                deadline = time.time() + 5
+                while time.time() < deadline:
+                    with lock:
+                        if len(arrivals.get(message_id, [])) >= args.agents:
+                            break
+                    time.sleep(0.001)
+                with lock:
+                    times = arrivals.get(message_id, [])
+                    if len(times) < args.agents:
+                        missing += args.agents - len(times)
+                    latencies.extend((t - sent) * 1000 for t in times)
+
+            print(f"agents on worker B: {args.agents}, messages posted to worker A: {args.messages}")
+            print(f"deliveries: {len(latencies)} (missing {missing})")
+            if latencies:
+                print(f"latency ms: p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  "
+                      f"max {max(latencies):.1f}  mean {statistics.mean(latencies):.1f}")
+            per_agent_seqs = sorted(set(seqs))
+            print(f"shared change sequence contiguous: {per_agent_seqs == list(range(per_agent_seqs[0], per_agent_seqs[-1] + 1)) if per_agent_seqs else 'n/a'}")
+
+            ok = missing == 0 and latencies and percentile(latencies, 95) <= args.budget_ms
+            print('PASS' if ok else f'FAIL (budget p95 <= {args.budget_ms} ms)')
+            return 0 if ok else 1
+        finally:
+            for agent in agents:
+                agent.disconnect()
+            for worker in (worker_a, worker_b):
+                worker.terminate()
+                worker.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Cold-start time of the server and the CLI entry points.
+
+Each target runs ``--rounds`` times in a fresh interpreter under
+``python -X importtime``, against a new SQLite file. Reports the median wall
+time of the process and of the target's own import, the number of modules
+loaded, and the slowest direct imports (cumulative, as ``-X importtime``
+reports them):
+
+- ``models``: the models alone, as scripts and migrations use them;
+- ``import_data``: the importer module, without reading a workbook;
+- ``app``: importing the server module (no tables are created);
+- ``create_app``: import plus ``create_app()``, i.e. a worker's cold start
+  including the schema step.
+
+Fails (exit status 1) when a target loads a module it must not (pandas or
+Flask for the CLI modules), or, with ``--compare``, when a median is more
+than ``--tolerance`` slower than in the earlier result file. Results are
+written to a JSON file like benchmarks.load's.
+
+    python3 -m benchmarks.startup --rounds 5 --output before.json
+    python3 -m benchmarks.startup --rounds 5 --compare before.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> (statement, module whose import is timed, modules that must stay unloaded)
+TARGETS = {
+    'models': ('import models', 'models', ('flask', 'flask_socketio', 'pandas')),
+    'import_data': ('import import_data', 'import_data', ('flask', 'flask_socketio', 'pandas')),
+    'app': ('import app', 'app', ('pandas',)),
+    'create_app': ('import app; app.create_app()', 'app', ('pandas',)),
+}
+REPORT = "; import json, sys; print(json.dumps(sorted(sys.modules)))"
+
+
+def parse_importtime(stderr):
+    """``[(depth, module, self_us, cumulative_us)]`` from ``-X importtime`` output, in print order"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+
+def direct_imports(entries, module):
+    """(cumulative µs of ``module``, its direct imports as ``[(cumulative µs, name)]``)"""
+    children = []
+    for depth, name, _, cumulative in entries:
+        if depth == 0:
+            if name == module:
+                return cumulative, children
+            children = []
+        elif depth == 1:
+            children.append((cumulative, name))
+    return 0, []
+
+
+def run_once(statement, workdir, n):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'startup-{n}.db')}",
+               PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement + REPORT],
+                             cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    if process.returncode:
+        raise RuntimeError(f'{statement!r} failed:\n{process.stderr[-2000:]}')
+    modules = json.loads(process.stdout.strip().splitlines()[-1])
+    return elapsed, parse_importtime(process.stderr), modules
+
+
+def measure(name, rounds, workdir):
+    statement, module, forbidden = TARGETS[name]
+    wall, imported, heaviest, modules = [], [], {}, []
+    for n in range(rounds):
+        elapsed, entries, modules = run_once(statement, workdir, f'{name}-{n}')
+        cumulative, children = direct_imports(entries, module)
+        wall.append(elapsed)
+        imported.append(cumulative / 1000)
+        for child_us, child in children:
+            heaviest.setdefault(child, []).append(child_us / 1000)
+    loaded_forbidden = sorted(m for m in forbidden if m in modules)
+    return {
+        'wall_ms': round(statistics.median(wall), 1),
+        'import_ms': round(statistics.median(imported), 1),
+        'modules': len(modules),
+        'heaviest_imports': {child: round(statistics.median(ms), 1) for child, ms in
+                             sorted(heaviest.items(), key=lambda item: -statistics.median(item[1]))[:5]},
+        'forbidden_loaded': loaded_forbidden,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--targets', nargs='+', choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument('--output', help='result file (default: benchmarks/results/startup-<commit>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against --compare')
+    args = parser.parse_args()
+
+    commit = git_commit()
+    result = {'benchmark': 'startup', 'commit': commit, 'started_at': datetime.utcnow().isoformat(),
+              'python': sys.version.split()[0], 'targets': {}}
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f).get('targets', {})
+
+    failures = []
+    print(f"{'target':<12}{'wall':>9}{'import':>9}{'modules':>9}  slowest direct imports (ms)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.targets:
+            stats = result['targets'][name] = measure(name, args.rounds, workdir)
+            heaviest = ', '.join(f'{child} {ms:.0f}' for child, ms in stats['heaviest_imports'].items())
+            line = f"{name:<12}{stats['wall_ms']:>7.0f}ms{stats['import_ms']:>7.0f}ms{stats['modules']:>9}  {heaviest}"
+            before = previous.get(name)
+            if before:
+                change = (stats['wall_ms'] - before['wall_ms']) / before['wall_ms']
+                line += f"   wall {before['wall_ms']:.0f} -> {stats['wall_ms']:.0f} ms ({change * 100:+.0f}%)"
+                if change > args.tolerance:
+                    failures.append(f'{name} is {change * 100:.0f}% slower')
+            print(line)
+            if stats['forbidden_loaded']:
+                failures.append(f"{name} loads {', '.join(stats['forbidden_loaded'])}")
+
+    output = args.output or os.path.join(REPO_ROOT, 'benchmarks', 'results', f"startup-{(commit or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2, sort_keys=True)
+    print(f"\nresults written to {output}")
+    print('PASS' if not failures else 'FAIL: ' + '; '.join(failures))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+In-memory catalog of canned messages.
+
+:class:`CannedCatalog` loads the whole ``canned_messages`` table once and
+serves it from memory until ``invalidate`` is called (by
+``create_canned_message``) or ``ttl`` seconds pass, which bounds staleness
+for canned messages created by other processes. Each load builds an
+immutable :class:`Catalog` holding:
+
+- the encoded JSON body and a strong ETag derived from it, so
+  ``GET /api/canned-messages`` answers ``304 Not Modified`` to clients that
+  already hold the current list;
+- one compiled :class:`Template` per message. ``{placeholder}`` fields are
+  split out once at load time; rendering only joins literal parts and
+  customer values (see ``customer_context``);
+- a :class:`TypeaheadIndex` over title, category and content for ``?q=``.
+
+As in cache.py, a load that started before an invalidation is served to its
+caller but not kept, so a slow load never hides a newer write.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from bisect import bisect_left
+
+import serialization
+from dedupe import normalize
+
+DEFAULT_TTL = 30.0
+PLACEHOLDER = re.compile(r'\{(\w+)\}')
+
+
+class Template:
+    """Canned message content with ``{placeholder}`` fields, compiled once"""
+
+    def __init__(self, source):
+        self.source = source or ''
+        self._parts = []  # (literal text, field name or None)
+        position = 0
+        for match in PLACEHOLDER.finditer(self.source):
+            self._parts.append((self.source[position:match.start()], match.group(1)))
+            position = match.end()
+        self._parts.append((self.source[position:], None))
+        self.fields = tuple(dict.fromkeys(field for _, field in self._parts if field))
+
+    def render(self, context):
+        """Fill in fields from ``context``; unknown or empty fields stay as written for the agent to edit"""
+        out = []
+        for literal, field in self._parts:
+            out.append(literal)
+            if field is not None:
+                value = context.get(field)
+                out.append(str(value) if value not in (None, '') else '{' + field + '}')
+        return ''.join(out)
+
+    def missing(self, context):
+        return [field for field in self.fields if context.get(field) in (None, '')]
+
+
+def customer_context(customer):
+    """Template values for a customer: profile_data fields plus name, first_name, email, phone and customer_id"""
+    context = {}
+    if customer.profile_data:
+        try:
+            profile = json.loads(customer.profile_data)
+        except ValueError:
+            profile = {}
+        if isinstance(profile, dict):
+            context.update(profile)
+    name = customer.name or ''
+    context.update({
+        'name': name,
+        'first_name': name.split()[0] if name.split() else '',
+        'email': customer.email,
+        'phone': customer.phone,
+        'customer_id': customer.customer_id,
+    })
+    return context
+
+
+class TypeaheadIndex:
+    """Prefix (sorted word list) and infix (trigram) lookup over canned messages"""
+
+    FIELD_WEIGHTS = (('title', 3), ('category', 2), ('content', 1))
+
+    def __init__(self, entries):
+        self._texts = []  # per entry: normalized field texts
+        self._words = []  # sorted (word, entry position, weight)
+        self._trigrams = {}  # trigram -> entry positions
+        for position, entry in enumerate(entries):
+            texts = {field: normalize(entry.get(field)) for field, _ in self.FIELD_WEIGHTS}
+            self._texts.append(texts)
+            for field, weight in self.FIELD_WEIGHTS:
+                text = texts[field]
+                self._words.extend((word, position, weight) for word in set(text.split()))
+                for i in range(len(text) - 2):
+                    self._trigrams.setdefault(text[i:i + 3], set()).add(position)
+        self._words.sort()
+
+    def _term_scores(self, term):
+        scores = {}
+        # A word prefix scores double a match inside a word ("pass": "password" before "bypass")
+        i = bisect_left(self._words, (term,))
+        while i < len(self._words) and self._words[i][0].startswith(term):
+            _, position, weight = self._words[i]
+            scores[position] = max(scores.get(position, 0), 2 * weight)
+            i += 1
+        if len(term) >= 3:
+            candidates = None
+            for j in range(len(term) - 2):
+                found = self._trigrams.get(term[j:j + 3], set())
+                candidates = found if candidates is None else candidates & found
+                if not candidates:
+                    break
+            for position in candidates or ():
+                for field, weight in self.FIELD_WEIGHTS:
+                    if term in self._texts[position][field]:
+                        scores[position] = max(scores.get(position, 0), weight)
+                        break
+        return scores
+
+    def search(self, query, limit=10):
+        """Entry positions matching every term of ``query``, best first"""
+        scores = None
+        for term in normalize(query).split():
+            term_scores = self._term_scores(term)
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {position: scores[position] + score
+                          for position, score in term_scores.items() if position in scores}
+            if not scores:
+                return []
+        if scores is None:
+            return []
+        return sorted(scores, key=lambda position: (-scores[position], position))[:limit]
+
+
+class Catalog:
+    """One loaded version of the canned messages; never modified after construction"""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.by_id = {entry['id']: entry for entry in entries}
+        self.templates = {entry['id']: Template(entry['content']) for entry in entries}
+        self.body = serialization.dumps(entries)
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.index = TypeaheadIndex(entries)
+
+    def search(self, query, limit=10):
+        return [self.entries[position] for position in self.index.search(query, limit)]
+
+
+class CannedCatalog:
+    def __init__(self, loader, ttl=DEFAULT_TTL):
+        self._loader = loader  # returns canned messages as dicts with id, title, content, category
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._expires_at = 0.0
+        self._version = 0
+        self._stats = {'hits': 0, 'loads': 0, 'invalidations': 0}
+
+    def get(self):
+        """The current :class:`Catalog`, loading it if invalidated or expired"""
+        with self._lock:
+            if self._catalog is not None and self._expires_at > time.monotonic():
+                self._stats['hits'] += 1
+                return self._catalog
+            version = self._version
+        catalog = Catalog(self._loader())
+        with self._lock:
+            self._stats['loads'] += 1
+            if version == self._version:
+                self._catalog = catalog
+                self._expires_at = time.monotonic() + self.ttl
+        return catalog
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._catalog = None
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, loaded=self._catalog is not None,
+                        size=len(self._catalog.entries) if self._catalog else 0)
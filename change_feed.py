@@ -0,0 +1,177 @@
+"""
+Versioned change feed for real-time inbox updates.
+
+Every write that agents need to see is published as a delta with a
+monotonically increasing sequence number and emitted over Socket.IO. Recent
+deltas are kept in a bounded log so a client that notices a gap
+(``seq`` != last seen + 1) can fetch just the missing changes from
+``GET /api/changes?since=N`` instead of reloading the whole inbox.
+
+``epoch`` identifies the sequence a client is following. A client holding a
+different epoch (or asking for changes older than the log) is told to do a
+full reload.
+
+Two logs are available:
+
+- :class:`MemoryChangeLog` (default): per process; the epoch changes on restart.
+- :class:`DatabaseChangeLog`: a table in the application database, so several
+  server processes behind a Socket.IO message queue share one sequence.
+"""
+
+import json
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, DateTime, select, func
+
+DEFAULT_LOG_SIZE = 5000
+
+
+class MemoryChangeLog:
+    def __init__(self, size=DEFAULT_LOG_SIZE):
+        self._log = deque(maxlen=size)
+        self._seq = 0
+        self.epoch = uuid.uuid4().hex[:12]
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def append(self, delta):
+        self._seq += 1
+        delta['seq'] = self._seq
+        delta['epoch'] = self.epoch
+        self._log.append(delta)
+        return delta
+
+    def since(self, seq):
+        if seq > self._seq:
+            return None
+        oldest = self._log[0]['seq'] if self._log else self._seq + 1
+        if seq + 1 < oldest:
+            return None
+        return [delta for delta in self._log if delta['seq'] > seq]
+
+
+log_metadata = MetaData()
+change_log = Table(
+    'change_log', log_metadata,
+    Column('seq', Integer, primary_key=True, autoincrement=True),
+    Column('payload', Text, nullable=False),
+    Column('created_at', DateTime, default=datetime.utcnow),
+    sqlite_autoincrement=True,  # never reuse a seq after pruning
+)
+change_log_epoch = Table(
+    'change_log_epoch', log_metadata,
+    Column('id', Integer, primary_key=True),
+    Column('epoch', String(32), nullable=False),
+)
+
+
+class DatabaseChangeLog:
+    """Change log shared by every process using the same database"""
+
+    def __init__(self, engine, size=DEFAULT_LOG_SIZE, prune_every=100):
+        self.engine = engine
+        self.size = size
+        self.prune_every = prune_every
+        self._epoch = None
+        self._setup_lock = threading.Lock()
+
+    def _ready(self):
+        """Create the tables and the epoch on first use, so constructing the log touches no database"""
+        if self._epoch is None:
+            with self._setup_lock:
+                if self._epoch is None:
+                    log_metadata.create_all(self.engine)
+                    with self.engine.begin() as conn:
+                        epoch = conn.execute(select(change_log_epoch.c.epoch)).scalar()
+                        if epoch is None:
+                            epoch = uuid.uuid4().hex[:12]
+                            conn.execute(change_log_epoch.insert().values(id=1, epoch=epoch))
+                    self._epoch = epoch
+        return self._epoch
+
+    @property
+    def epoch(self):
+        return self._ready()
+
+    @property
+    def seq(self):
+        self._ready()
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.coalesce(func.max(change_log.c.seq), 0))).scalar()
+
+    def append(self, delta):
+        delta['epoch'] = self.epoch
+        with self.engine.begin() as conn:
+            seq = conn.execute(change_log.insert().values(payload='')).inserted_primary_key[0]
+            delta['seq'] = seq
+            conn.execute(change_log.update().where(change_log.c.seq == seq).values(payload=json.dumps(delta)))
+            if seq % self.prune_every == 0:
+                conn.execute(change_log.delete().where(change_log.c.seq <= seq - self.size))
+        return delta
+
+    def since(self, seq):
+        self._ready()
+        with self.engine.connect() as conn:
+            oldest, latest = conn.execute(
+                select(func.min(change_log.c.seq), func.max(change_log.c.seq))
+            ).one()
+            latest = latest or 0
+            if seq > latest:
+                return None
+            if seq + 1 < (oldest or latest + 1):
+                return None
+            rows = conn.execute(
+                select(change_log.c.payload).where(change_log.c.seq > seq).order_by(change_log.c.seq)
+            ).scalars()
+            return [json.loads(payload) for payload in rows]
+
+
+class ChangeFeed:
+    def __init__(self, emit, log=None):
+        self._emit = emit
+        self._log = log or MemoryChangeLog()
+        self._lock = threading.Lock()
+
+    @property
+    def seq(self):
+        return self._log.seq
+
+    @property
+    def epoch(self):
+        return self._log.epoch
+
+    def publish(self, event, op, to=None, **data):
+        """Assign the next sequence number, record the delta and emit it to ``to`` rooms"""
+        with self._lock:
+            delta = {'op': op, 'event': event}
+            delta.update(data)
+            delta = self._log.append(delta)
+            # Emit under the lock so this process emits deltas in sequence order
+            self._emit(event, delta, to=to)
+        return delta
+
+    def publish_batch(self, event, items, to=None, partial=None):
+        """Publish several changes as one delta (``op`` ``batch``, one sequence number).
+
+        The whole delta is emitted once to ``to``; ``partial`` maps further
+        rooms to the subset of ``items`` they may see, each emitted as a copy
+        of the delta with the same ``seq``.
+        """
+        with self._lock:
+            delta = self._log.append({'op': 'batch', 'event': event, 'items': items})
+            self._emit(event, delta, to=to)
+            for room, subset in (partial or {}).items():
+                self._emit(event, dict(delta, items=subset), to=[room])
+        return delta
+
+    def since(self, seq, epoch=None):
+        """Deltas after ``seq``, or None if the client must reload from scratch"""
+        with self._lock:
+            if epoch is not None and epoch != self.epoch:
+                return None
+            return self._log.since(seq)
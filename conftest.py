@@ -0,0 +1,98 @@
+"""
+Tests run against SQLite by default. To run them against PostgreSQL either
+point ``TEST_DATABASE_URL`` at a scratch database (its ``public`` schema is
+dropped before every test) or pass ``--postgres`` to start a throwaway
+cluster with ``initdb`` / ``pg_ctl`` from ``PG_BIN`` or the PATH (initdb
+refuses to run as root).
+"""
+
+import os
+import socket
+import subprocess
+
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+import canned
+import database
+import dedupe
+import inbox_stats
+import models
+import ratelimit
+import work_queue
+
+
+def pytest_addoption(parser):
+    parser.addoption('--postgres', action='store_true',
+                     help='run the database tests against a throwaway PostgreSQL cluster')
+
+
+def _pg_tool(name):
+    return os.path.join(os.environ['PG_BIN'], name) if os.environ.get('PG_BIN') else name
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='session')
+def database_url(request, tmp_path_factory):
+    """PostgreSQL URL for the test run, or None for per-test SQLite files"""
+    if os.environ.get('TEST_DATABASE_URL') or not request.config.getoption('--postgres'):
+        yield os.environ.get('TEST_DATABASE_URL')
+        return
+    workdir = tmp_path_factory.mktemp('postgres')
+    data, port = str(workdir / 'data'), _free_port()
+    subprocess.run([_pg_tool('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-sync'],
+                   check=True, capture_output=True)
+    subprocess.run([_pg_tool('pg_ctl'), '-D', data, '-l', str(workdir / 'postgres.log'), '-w', '-o',
+                    f"-p {port} -c listen_addresses=127.0.0.1 -c unix_socket_directories='' -c fsync=off",
+                    'start'], check=True, capture_output=True)
+    try:
+        yield f'postgresql://postgres@127.0.0.1:{port}/postgres'
+    finally:
+        subprocess.run([_pg_tool('pg_ctl'), '-D', data, '-m', 'immediate', 'stop'], capture_output=True)
+
+
+@pytest.fixture
+def db(tmp_path, database_url):
+    """Point the app's sessions at a fresh, empty database for one test"""
+    url = database_url or f"sqlite:///{tmp_path / 'test.db'}"
+    engine = database.create_database_engine(url)
+    if database_url:
+        with engine.begin() as conn:
+            conn.execute(text('DROP SCHEMA public CASCADE'))
+            conn.execute(text('CREATE SCHEMA public'))
+    models.create_schema(engine)
+    read_engine = database.create_database_engine(url, readonly=True)
+    app_module.Session.configure(bind=engine)
+    app_module.ReadSession.configure(bind=read_engine)
+    app_module.conversation_cache.clear()
+    shared_catalog = app_module.canned_catalog
+    app_module.canned_catalog = canned.CannedCatalog(app_module.load_canned_messages, ttl=shared_catalog.ttl)
+    # Tests send bursts from one address; test_ratelimit.py turns the limiter back on
+    shared_limits = app_module.rate_limiter.store, app_module.rate_limiter.enabled
+    app_module.rate_limiter.store, app_module.rate_limiter.enabled = ratelimit.MemoryBucketStore(), False
+    shared_queue, app_module.work_queue = app_module.work_queue, work_queue.WorkQueue()
+    shared_stats, app_module.inbox_stats = app_module.inbox_stats, inbox_stats.InboxStats()
+    shared_dedupe, app_module.dedupe_index = app_module.dedupe_index, dedupe.DedupeIndex()
+    yield engine
+    app_module.rate_limiter.store, app_module.rate_limiter.enabled = shared_limits
+    app_module.canned_catalog = shared_catalog
+    app_module.dedupe_index = shared_dedupe
+    app_module.inbox_stats = shared_stats
+    app_module.work_queue = shared_queue
+    app_module.Session.configure(bind=app_module.engine)
+    app_module.ReadSession.configure(bind=database.read_engine)
+    app_module.conversation_cache.clear()
+    read_engine.dispose()
+    engine.dispose()
+
+
+@pytest.fixture
+def client(db):
+    app_module.app.config['TESTING'] = True
+    return app_module.app.test_client()
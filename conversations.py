@@ -0,0 +1,183 @@
+"""
+Denormalized per-customer conversation threads.
+
+The ``conversations`` table (model ``Conversation`` in models.py) holds one
+row per customer with what the thread inbox shows, so listing threads reads
+one row per customer instead of aggregating over all of their messages:
+
+- ``last_message_id`` / ``last_message_preview`` / ``last_message_direction``
+  and ``last_activity``: the newest message in either direction;
+- ``unread_count``: incoming messages still unread;
+- ``open_count``: incoming messages not replied to yet;
+- ``max_priority``: highest priority among incoming messages not yet replied
+  to (0 when nothing is waiting);
+- ``message_count``: messages in both directions.
+
+The write paths update the row in the same transaction as the messages
+(``record_incoming``, ``record_reply``, ``record_read``). The counters are
+relative updates (``unread_count + n``), so concurrent writers in several
+processes never overwrite each other. ``refresh`` recomputes threads from
+the messages table; the migration uses it to backfill existing data and the
+importer uses it after bulk inserts.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import text
+
+PREVIEW_LENGTH = 200
+
+CREATE_MISSING_SQL = (
+    "INSERT INTO conversations (customer_id, unread_count, open_count, max_priority, message_count, created_at) "
+    "VALUES (:customer_id, 0, 0, 0, 0, :now) ON CONFLICT (customer_id) DO NOTHING"
+)
+
+# SET expressions all see the row as it was before the UPDATE, so the
+# last_activity comparisons stay consistent with each other
+_LAST_MESSAGE_SET = (
+    "last_message_id = CASE WHEN last_activity IS NULL OR last_activity <= :created_at "
+    "THEN :message_id ELSE last_message_id END, "
+    "last_message_preview = CASE WHEN last_activity IS NULL OR last_activity <= :created_at "
+    "THEN :preview ELSE last_message_preview END, "
+    "last_message_direction = CASE WHEN last_activity IS NULL OR last_activity <= :created_at "
+    "THEN :direction ELSE last_message_direction END, "
+    "last_activity = CASE WHEN last_activity IS NULL OR last_activity <= :created_at "
+    "THEN :created_at ELSE last_activity END"
+)
+
+RECORD_INCOMING_SQL = (
+    "UPDATE conversations SET "
+    "unread_count = unread_count + :unread, "
+    "open_count = open_count + :open, "
+    "message_count = message_count + :count, "
+    "max_priority = CASE WHEN max_priority < :priority THEN :priority ELSE max_priority END, "
+    f"{_LAST_MESSAGE_SET} "
+    "WHERE customer_id = :customer_id"
+)
+
+_OPEN_PRIORITY = (
+    "(SELECT COALESCE(MAX(m.priority), 0) FROM messages m WHERE m.customer_id = conversations.customer_id "
+    "AND m.direction = 'incoming' AND m.status != 'replied')"
+)
+
+RECORD_REPLY_SQL = (
+    "UPDATE conversations SET "
+    "unread_count = CASE WHEN unread_count >= :was_unread THEN unread_count - :was_unread ELSE 0 END, "
+    "open_count = CASE WHEN open_count >= :was_open THEN open_count - :was_open ELSE 0 END, "
+    "message_count = message_count + 1, "
+    f"max_priority = {_OPEN_PRIORITY}, "
+    f"{_LAST_MESSAGE_SET} "
+    "WHERE customer_id = :customer_id"
+)
+
+RECORD_READ_SQL = (
+    "UPDATE conversations SET unread_count = unread_count - 1 "
+    "WHERE customer_id = :customer_id AND unread_count > 0"
+)
+
+BACKFILL_MISSING_SQL = (
+    "INSERT INTO conversations (customer_id, unread_count, open_count, max_priority, message_count, created_at) "
+    "SELECT m.customer_id, 0, 0, 0, 0, MIN(m.created_at) FROM messages m "
+    "WHERE m.customer_id IS NOT NULL {filter} "
+    "AND NOT EXISTS (SELECT 1 FROM conversations c WHERE c.customer_id = m.customer_id) "
+    "GROUP BY m.customer_id"
+)
+
+_LATEST = (
+    "(SELECT {expression} FROM messages m WHERE m.customer_id = conversations.customer_id "
+    "ORDER BY m.created_at DESC, m.id DESC LIMIT 1)"
+)
+
+REFRESH_SQL = (
+    "UPDATE conversations SET "
+    "unread_count = (SELECT COUNT(*) FROM messages m WHERE m.customer_id = conversations.customer_id "
+    "AND m.direction = 'incoming' AND m.status = 'unread'), "
+    "open_count = (SELECT COUNT(*) FROM messages m WHERE m.customer_id = conversations.customer_id "
+    "AND m.direction = 'incoming' AND m.status != 'replied'), "
+    "message_count = (SELECT COUNT(*) FROM messages m WHERE m.customer_id = conversations.customer_id), "
+    f"max_priority = {_OPEN_PRIORITY}, "
+    f"last_message_id = {_LATEST.format(expression='m.id')}, "
+    f"last_message_preview = {_LATEST.format(expression=f'SUBSTR(m.content, 1, {PREVIEW_LENGTH})')}, "
+    f"last_message_direction = {_LATEST.format(expression='m.direction')}, "
+    "last_activity = (SELECT MAX(m.created_at) FROM messages m WHERE m.customer_id = conversations.customer_id) "
+    "{where}"
+)
+
+
+def preview(content):
+    return (content or '')[:PREVIEW_LENGTH]
+
+
+def _id_clause(ids):
+    return ','.join(str(int(i)) for i in ids)
+
+
+def create_missing(session, customer_ids, now=None):
+    """Make sure each customer has a conversation row (safe against concurrent writers)"""
+    now = now or datetime.utcnow()
+    params = [{'customer_id': customer_id, 'now': now} for customer_id in sorted(set(customer_ids))]
+    if params:
+        session.execute(text(CREATE_MISSING_SQL), params)
+
+
+def record_incoming(session, messages):
+    """Count new incoming messages, given as dicts with customer_id, id, content, priority, status, created_at"""
+    by_customer = {}
+    for message in messages:
+        if message['customer_id'] is not None:
+            by_customer.setdefault(message['customer_id'], []).append(message)
+    if not by_customer:
+        return
+    create_missing(session, by_customer)
+    params = []
+    for customer_id, rows in by_customer.items():
+        latest = max(rows, key=lambda row: (row['created_at'], row['id']))
+        params.append({
+            'customer_id': customer_id,
+            'unread': sum(1 for row in rows if row['status'] == 'unread'),
+            'open': sum(1 for row in rows if row['status'] != 'replied'),
+            'count': len(rows),
+            'priority': max(row['priority'] or 0 for row in rows),
+            'message_id': latest['id'],
+            'preview': preview(latest['content']),
+            'direction': 'incoming',
+            'created_at': latest['created_at'],
+        })
+    session.execute(text(RECORD_INCOMING_SQL), params)
+
+
+def record_reply(session, customer_id, reply_id, content, created_at, previous_status):
+    """Count an agent reply; run after the replied-to message's status is flushed.
+
+    ``previous_status`` is the replied-to message's status before the reply.
+    """
+    if customer_id is None:
+        return
+    create_missing(session, [customer_id])
+    session.execute(text(RECORD_REPLY_SQL), {
+        'customer_id': customer_id,
+        'was_unread': 1 if previous_status == 'unread' else 0,
+        'was_open': 0 if previous_status == 'replied' else 1,
+        'message_id': reply_id,
+        'preview': preview(content),
+        'direction': 'outgoing',
+        'created_at': created_at,
+    })
+
+
+def record_read(session, customer_id):
+    if customer_id is not None:
+        session.execute(text(RECORD_READ_SQL), {'customer_id': customer_id})
+
+
+def refresh(conn, customer_ids=None):
+    """Recompute conversations from the messages table (all of them, or the given customers')"""
+    if customer_ids is not None:
+        ids = _id_clause(set(customer_ids))
+        if not ids:
+            return
+        conn.execute(text(BACKFILL_MISSING_SQL.format(filter=f"AND m.customer_id IN ({ids})")))
+        conn.execute(text(REFRESH_SQL.format(where=f"WHERE customer_id IN ({ids})")))
+    else:
+        conn.execute(text(BACKFILL_MISSING_SQL.format(filter='')))
+        conn.execute(text(REFRESH_SQL.format(where='')))
@@ -0,0 +1,146 @@
+"""
+Shared database engines and sessions for the server, importer and tools.
+
+Every SQLite connection is set up on connect with:
+
+- ``journal_mode=WAL``: readers no longer block behind a writer (and an
+  import running next to the server no longer stalls the inbox);
+- ``synchronous=NORMAL``: safe with WAL, one fsync per checkpoint instead of
+  per commit;
+- ``busy_timeout``: writers wait for the lock instead of failing with
+  "database is locked";
+- ``mmap_size`` / ``cache_size``: serve hot pages from memory.
+
+``engine`` / ``Session`` are read-write. ``read_engine`` / ``ReadSession``
+open the same file read-only (``mode=ro`` plus ``query_only``) for the GET
+endpoints, with their own connection pool so reads never queue behind
+connections held by writers.
+
+Pool sizes default to 10 (+20 overflow); under eventlet, where every request
+is a green thread, they default to 50 (+50). Override with ``DB_POOL_SIZE``
+and ``DB_MAX_OVERFLOW``.
+
+``DATABASE_URL`` selects the database (default: ``messaging_app.db`` in the
+working directory). PostgreSQL URLs (``postgresql://`` or ``postgres://``)
+use the psycopg 3 driver (``pip install "psycopg[binary]"``); connections
+are pre-pinged and recycled after ``DB_POOL_RECYCLE`` seconds, and reads go
+to ``DATABASE_READ_URL`` (e.g. a streaming replica) when it is set. The
+read-only engine opens PostgreSQL sessions with
+``default_transaction_read_only``, the counterpart of ``query_only``.
+
+On SQLite, ``ARCHIVE_DATABASE`` names a second file that every connection
+attaches as schema ``archive``; archive.py keeps archived messages there so
+they stop growing the main file.
+"""
+
+import os
+import sys
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+DEFAULT_DATABASE_URL = 'sqlite:///messaging_app.db'
+ARCHIVE_SCHEMA = 'archive'
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,            # ms
+    'mmap_size': 256 * 1024 * 1024,  # bytes
+    'cache_size': -64000,            # negative = KiB, i.e. 64 MB per connection
+    'temp_store': 'MEMORY',
+}
+
+
+def _green_threads():
+    eventlet = sys.modules.get('eventlet')
+    return eventlet is not None and eventlet.patcher.is_monkey_patched('thread')
+
+
+def pool_options():
+    green = _green_threads()
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 50 if green else 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 50 if green else 20)),
+    }
+
+
+def normalize_url(url):
+    """Parsed URL; plain PostgreSQL URLs are pointed at the psycopg 3 driver"""
+    url = make_url(url)
+    if url.drivername in ('postgres', 'postgresql'):
+        url = url.set(drivername='postgresql+psycopg')
+    return url
+
+
+def _apply_pragmas(engine, pragmas):
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def _attach_archive(engine, path):
+    @event.listens_for(engine, 'connect')
+    def attach_archive(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (os.path.abspath(path),))
+
+
+def create_database_engine(url=DEFAULT_DATABASE_URL, readonly=False, archive_path=None, **kwargs):
+    """Engine for ``url`` with the connection tuning above applied.
+
+    ``archive_path`` (SQLite only) is attached to every connection as ``archive``.
+    """
+    url = normalize_url(url)
+    if url.get_backend_name() != 'sqlite':
+        options = dict(pool_options(), pool_pre_ping=True,
+                       pool_recycle=int(os.environ.get('DB_POOL_RECYCLE', 1800)))
+        if readonly:
+            options['connect_args'] = {'options': '-c default_transaction_read_only=on'}
+        return create_engine(url, **dict(options, **kwargs))
+
+    pragmas = dict(SQLITE_PRAGMAS)
+    in_memory = url.database in (None, '', ':memory:')
+    if readonly and not in_memory:
+        # The writer engine owns the WAL switch; a read-only connection cannot change it
+        pragmas.pop('journal_mode')
+        pragmas['query_only'] = 'ON'
+        url = url.set(
+            database=f'file:{os.path.abspath(url.database)}?mode=ro',
+            query=dict(url.query, uri='true')
+        )
+    if in_memory:
+        pragmas.pop('journal_mode')  # an in-memory database has no WAL
+    else:
+        kwargs = dict(pool_options(), **kwargs)
+    engine = create_engine(url, **kwargs)
+    if archive_path:
+        _attach_archive(engine, archive_path)  # first, so journal_mode=WAL also covers the archive
+    _apply_pragmas(engine, pragmas)
+    return engine
+
+
+def dialect_name(bind):
+    """'sqlite' or 'postgresql' for an engine, connection or session"""
+    dialect = getattr(bind, 'dialect', None) or bind.get_bind().dialect
+    return dialect.name
+
+
+def insert(bind, table):
+    """Dialect-specific INSERT for ``bind`` (supports ``on_conflict_do_nothing``)"""
+    return (postgresql.insert if dialect_name(bind) == 'postgresql' else sqlite.insert)(table)
+
+
+DATABASE_URL = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+ARCHIVE_DATABASE = os.environ.get('ARCHIVE_DATABASE')
+engine = create_database_engine(DATABASE_URL, archive_path=ARCHIVE_DATABASE)
+Session = sessionmaker(bind=engine)
+
+read_engine = create_database_engine(
+    os.environ.get('DATABASE_READ_URL', DATABASE_URL), readonly=True, archive_path=ARCHIVE_DATABASE
+)
+ReadSession = sessionmaker(bind=read_engine)
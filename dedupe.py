@@ -0,0 +1,176 @@
+"""
+Near-duplicate detection for incoming customer messages.
+
+Customers often resubmit the same question with small edits ("when will my
+loan be disbursed??" then "When will my loan be disbursed"). Instead of a new
+inbox row, such a resubmission is collapsed into the customer's earlier
+message and counted in ``messages.repeat_count``.
+
+Each message gets a :class:`Fingerprint`:
+
+- ``key``: a hash of the normalized text (NFKC, case-folded, punctuation
+  dropped, whitespace collapsed), so messages that differ only in case,
+  punctuation or spacing match exactly;
+- ``signature``: a MinHash of the normalized text's character shingles,
+  whose agreement estimates the Jaccard similarity of two messages. It is
+  computed on first comparison only, since most customers have a single
+  open message and never need one.
+
+:class:`DedupeIndex` keeps the fingerprints of each customer's recent
+messages in memory (bounded per customer and in customers, least recently
+used first out). A message matches when its key is already indexed, or when
+both texts are at least ``MIN_NEAR_LENGTH`` characters long and the
+estimated similarity reaches ``threshold``; short replies like "ok" only
+ever match exactly.
+
+The index is per process and only a hint: callers re-check a match in the
+database before collapsing into it (see ``store_customer_messages`` in
+app.py) and ``discard`` entries that no longer qualify.
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+DEFAULT_THRESHOLD = 0.8
+NUM_PERM = 32
+SHINGLE_SIZE = 4
+MIN_NEAR_LENGTH = 20
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)  # fixed, so signatures are stable across processes
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    """Case-folded words of ``text`` separated by single spaces"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def minhash(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [_hash64(shingle) for shingle in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+class Fingerprint:
+    __slots__ = ('normalized', 'key', '_signature')
+
+    def __init__(self, text):
+        self.normalized = normalize(text)
+        self.key = hashlib.blake2b(self.normalized.encode('utf-8'), digest_size=16).digest()
+        self._signature = None
+
+    @property
+    def signature(self):
+        if self._signature is None:
+            self._signature = minhash(self.normalized)
+        return self._signature
+
+    def similarity(self, other):
+        """Estimated Jaccard similarity of the two texts' shingles"""
+        if self.key == other.key:
+            return 1.0
+        same = sum(1 for a, b in zip(self.signature, other.signature) if a == b)
+        return same / NUM_PERM
+
+
+class DedupeIndex:
+    """Per-customer fingerprints of recent messages, keyed by a caller-chosen ref (usually the message id)"""
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, max_per_customer=50, max_customers=10000, reload_after=300):
+        self.threshold = threshold
+        self.max_per_customer = max_per_customer
+        self.max_customers = max_customers
+        self.reload_after = reload_after
+        self._lock = threading.Lock()
+        self._customers = OrderedDict()  # customer id -> (loaded_at, OrderedDict ref -> Fingerprint)
+        self._owners = {}  # ref -> customer id
+
+    def __len__(self):
+        return len(self._owners)
+
+    def needs_load(self, customer_id, now=None):
+        """Whether the customer's messages should be (re)loaded from the database"""
+        entry = self._customers.get(customer_id)
+        if entry is None:
+            return True
+        return self.reload_after is not None and (now or time.monotonic()) - entry[0] >= self.reload_after
+
+    def load(self, customer_id, rows, now=None):
+        """Replace a customer's entries with ``(ref, content)`` rows, oldest first"""
+        with self._lock:
+            self._forget(customer_id)
+            self._customers[customer_id] = (now or time.monotonic(), OrderedDict())
+            for ref, content in rows:
+                self._add(customer_id, ref, content if isinstance(content, Fingerprint) else Fingerprint(content))
+            self._evict_customers()
+
+    def add(self, customer_id, ref, fingerprint):
+        """Index a new message of a customer (loading an empty customer if needed)"""
+        if not isinstance(fingerprint, Fingerprint):
+            fingerprint = Fingerprint(fingerprint)
+        with self._lock:
+            if customer_id not in self._customers:
+                self._customers[customer_id] = (time.monotonic(), OrderedDict())
+            self._add(customer_id, ref, fingerprint)
+            self._evict_customers()
+
+    def discard(self, ref):
+        with self._lock:
+            customer_id = self._owners.pop(ref, None)
+            if customer_id is not None:
+                self._customers[customer_id][1].pop(ref, None)
+
+    def find(self, customer_id, fingerprint, exclude=()):
+        """Ref of the customer's most similar indexed message, or None below the threshold"""
+        if not isinstance(fingerprint, Fingerprint):
+            fingerprint = Fingerprint(fingerprint)
+        with self._lock:
+            entry = self._customers.get(customer_id)
+            if entry is None:
+                return None
+            self._customers.move_to_end(customer_id)
+            candidates = [(ref, other) for ref, other in entry[1].items() if ref not in exclude]
+        best, best_score = None, -1.0
+        for ref, other in reversed(candidates):  # newest first, so ties go to the latest message
+            if other.key == fingerprint.key:
+                return ref
+            if len(fingerprint.normalized) < MIN_NEAR_LENGTH or len(other.normalized) < MIN_NEAR_LENGTH:
+                continue
+            score = fingerprint.similarity(other)
+            if score >= self.threshold and score > best_score:
+                best, best_score = ref, score
+        return best
+
+    def _add(self, customer_id, ref, fingerprint):
+        entries = self._customers[customer_id][1]
+        entries[ref] = fingerprint
+        self._owners[ref] = customer_id
+        while self.max_per_customer is not None and len(entries) > self.max_per_customer:
+            old_ref, _ = entries.popitem(last=False)
+            self._owners.pop(old_ref, None)
+
+    def _forget(self, customer_id):
+        entry = self._customers.pop(customer_id, None)
+        if entry is not None:
+            for ref in entry[1]:
+                self._owners.pop(ref, None)
+
+    def _evict_customers(self):
+        while self.max_customers is not None and len(self._customers) > self.max_customers:
+            customer_id = next(iter(self._customers))
+            self._forget(customer_id)
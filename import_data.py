@@ -1,20 +1,67 @@
-import pandas as pd
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app import Base, Customer, Message, CannedMessage, calculate_priority
+from sqlalchemy import bindparam, select, MetaData, Table, Column, String, Integer, DateTime
+from models import Customer, Message, CannedMessage, create_schema
+from priority import calculate_priority
+import priority
+import search_index
+import conversations
+import dedupe
+import argparse
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 import os
 import json
+import time
 from datetime import datetime
 
-# Database setup
-engine = create_engine('sqlite:///messaging_app.db', echo=False)
-Session = sessionmaker(bind=engine)
+# Same tuned engine as the server (WAL, busy timeout), so an import can run next to it
+from database import engine, Session
+
+# pandas (with openpyxl) takes longer to import than the rest of this module;
+# it is imported inside the functions that read workbooks, so the other
+# tasks (e.g. create_default_canned_messages) start without it
+
+def find_excel_files(directory='.'):
+    return [f for f in os.listdir(directory) if f.endswith('.xlsx') and 'MessageData' in f]
+
+def detect_columns(df):
+    """Guess (name, email, phone, message, customer_id) columns from the sheet headers"""
+    name_col = None
+    email_col = None
+    phone_col = None
+    message_col = None
+    customer_id_col = None
+    
+    for col in df.columns:
+        col_lower = str(col).lower()
+        if 'name' in col_lower and name_col is None:
+            name_col = col
+        elif 'email' in col_lower and email_col is None:
+            email_col = col
+        elif 'phone' in col_lower or 'mobile' in col_lower:
+            phone_col = col
+        elif 'message' in col_lower or 'content' in col_lower or 'text' in col_lower:
+            message_col = col
+        elif 'customer' in col_lower and 'id' in col_lower:
+            customer_id_col = col
+    
+    # If we can't find message column, use the first text-like column
+    if message_col is None:
+        for col in df.columns:
+            if df[col].dtype == 'object':
+                message_col = col
+                break
+    
+    return name_col, email_col, phone_col, message_col, customer_id_col
 
 def import_excel_files():
-    """Import all Excel files from the current directory"""
+    """Import all Excel files from the current directory, one row at a time"""
+    import pandas as pd
+
     session = Session()
     try:
-        excel_files = [f for f in os.listdir('.') if f.endswith('.xlsx') and 'MessageData' in f]
+        excel_files = find_excel_files()
         
         print(f"Found {len(excel_files)} Excel files to import")
         
@@ -25,36 +72,15 @@ def import_excel_files():
                 print(f"  Columns: {df.columns.tolist()}")
                 print(f"  Rows: {len(df)}")
                 
-               
-                name_col = None
-                email_col = None
-                phone_col = None
-                message_col = None
-                customer_id_col = None
-                
-                for col in df.columns:
-                    col_lower = str(col).lower()
-                    if 'name' in col_lower and name_col is None:
-                        name_col = col
-                    elif 'email' in col_lower and email_col is None:
-                        email_col = col
-                    elif 'phone' in col_lower or 'mobile' in col_lower:
-                        phone_col = col
-                    elif 'message' in col_lower or 'content' in col_lower or 'text' in col_lower:
-                        message_col = col
-                    elif 'customer' in col_lower and 'id' in col_lower:
-                        customer_id_col = col
-                
-                # If we can't find message column, use the first text-like column
-                if message_col is None:
-                    for col in df.columns:
-                        if df[col].dtype == 'object':
-                            message_col = col
-                            break
+                name_col, email_col, phone_col, message_col, customer_id_col = detect_columns(df)
                 
                 print(f"  Using columns: name={name_col}, email={email_col}, phone={phone_col}, message={message_col}")
                 
                 imported = 0
+                new_customer_ids = []
+                new_messages = []
+                # Messages of this run are refs to Message objects, stored ones are ids
+                index = dedupe.DedupeIndex(max_per_customer=None, max_customers=None, reload_after=None)
                 for idx, row in df.iterrows():
                     try:
                         # Get customer info
@@ -91,15 +117,19 @@ def import_excel_files():
                             })
                             session.add(customer)
                             session.flush()
+                            new_customer_ids.append(customer.id)
                         
-                        # Check if message already exists (avoid duplicates)
-                        existing_message = session.query(Message).filter(
-                            Message.customer_id == customer.id,
-                            Message.content == message_content,
-                            Message.direction == 'incoming'
-                        ).first()
-                        
-                        if not existing_message:
+                        # Skip (near-)duplicates of stored messages; count repeats within this import
+                        if index.needs_load(customer.id):
+                            index.load(customer.id, session.query(Message.id, Message.content).filter(
+                                Message.customer_id == customer.id,
+                                Message.direction == 'incoming'
+                            ).order_by(Message.id).all())
+                        fingerprint = dedupe.Fingerprint(message_content)
+                        duplicate = index.find(customer.id, fingerprint)
+                        if isinstance(duplicate, Message):
+                            duplicate.repeat_count += 1
+                        elif duplicate is None:
                             # Create message
                             priority = calculate_priority(message_content)
                             message = Message(
@@ -107,15 +137,22 @@ def import_excel_files():
                                 content=message_content,
                                 direction='incoming',
                                 status='unread',
-                                priority=priority
+                                priority=priority,
+                                repeat_count=0
                             )
                             session.add(message)
+                            index.add(customer.id, message, fingerprint)
+                            new_messages.append(message)
                             imported += 1
                         
                     except Exception as e:
                         print(f"    Error processing row {idx}: {e}")
                         continue
                 
+                session.flush()
+                search_index.index_customers(session, new_customer_ids)
+                search_index.index_messages(session, [m.id for m in new_messages])
+                conversations.refresh(session, {m.customer_id for m in new_messages})
                 session.commit()
                 print(f"  Imported {imported} messages from {excel_file}")
                 
@@ -129,6 +166,317 @@ def import_excel_files():
     finally:
         session.close()
 
+# Batched import
+DEFAULT_CHUNK_SIZE = 1000
+IN_CLAUSE_SIZE = 500  # stay well below SQLite's bound-parameter limit
+
+checkpoint_metadata = MetaData()
+import_checkpoints = Table(
+    'import_checkpoints', checkpoint_metadata,
+    Column('file_name', String(500), primary_key=True),
+    Column('signature', String(64)),
+    Column('rows_done', Integer),
+    Column('rows_total', Integer),
+    Column('completed_at', DateTime, nullable=True),
+)
+
+def file_signature(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _in_chunks(values):
+    values = list(values)
+    for i in range(0, len(values), IN_CLAUSE_SIZE):
+        yield values[i:i + IN_CLAUSE_SIZE]
+
+def normalize_sheet(df):
+    """Column-wise equivalent of the per-row extraction in import_excel_files.
+
+    Returns one row per sheet row that carries a message, with columns
+    position, name, email, phone, content, customer_ref and priority.
+    """
+    import pandas as pd
+
+    name_col, email_col, phone_col, message_col, customer_id_col = detect_columns(df)
+    labels = pd.Series(df.index, index=df.index)
+    
+    def text_column(col, default):
+        if col is None:
+            return pd.Series(default, index=df.index, dtype=object)
+        values = df[col]
+        return values.astype(str).astype(object).where(values.notna(), default)
+    
+    rows = pd.DataFrame({
+        'position': range(len(df)),
+        'name': text_column(name_col, 'Customer ' + (labels + 1).astype(str)),
+        'email': text_column(email_col, 'customer' + (labels + 1).astype(str) + '@example.com'),
+        'phone': text_column(phone_col, ''),
+        'content': text_column(message_col, ''),
+        'customer_ref': text_column(customer_id_col, None),
+        'label': labels,
+    }, index=df.index)
+    # pandas turns a None fill into NaN (and infers a string dtype from a
+    # plain list); keep missing refs as None in an object column
+    rows['customer_ref'] = pd.Series(
+        [ref if isinstance(ref, str) else None for ref in rows['customer_ref']], index=rows.index, dtype=object
+    )
+    rows = rows[(rows['content'] != '') & (rows['content'] != 'nan')]
+    rows['priority'] = priority.default_engine.score_many(rows['content'])
+    return rows
+
+def resolve_customers(conn, refs, emails):
+    """Look up existing customers by customer_id and by email in set-based queries"""
+    by_ref, by_email = {}, {}
+    for chunk in _in_chunks(refs):
+        for pk, ref in conn.execute(select(Customer.id, Customer.customer_id).where(Customer.customer_id.in_(chunk))):
+            by_ref[ref] = pk
+    for chunk in _in_chunks(emails):
+        for pk, email in conn.execute(select(Customer.id, Customer.email).where(Customer.email.in_(chunk))):
+            by_email[email] = pk
+    return by_ref, by_email
+
+def existing_message_index(conn, customer_pks):
+    """Dedupe index of the incoming messages already stored for these customers (refs are message ids)"""
+    stored = {}
+    for chunk in _in_chunks(customer_pks):
+        query = select(Message.customer_id, Message.id, Message.content).where(
+            Message.direction == 'incoming', Message.customer_id.in_(chunk)
+        ).order_by(Message.id)
+        for customer_pk, message_id, content in conn.execute(query):
+            stored.setdefault(customer_pk, []).append((message_id, content))
+    index = dedupe.DedupeIndex(max_per_customer=None, max_customers=None, reload_after=None)
+    for customer_pk, rows in stored.items():
+        index.load(customer_pk, rows)
+    return index
+
+def new_customer_row(row, signature):
+    idx = row.label
+    return {
+        'name': row.name,
+        'email': row.email,
+        'phone': row.phone,
+        # Derived from the file contents rather than the clock so re-runs and
+        # parallel runs generate the same ids
+        'customer_id': row.customer_ref or f"CUST_IMPORT_{signature[:12]}_{idx}",
+        # Same mock profile data as the row-by-row importer
+        'profile_data': json.dumps({
+            'account_type': 'premium' if idx % 3 == 0 else 'standard',
+            'join_date': (datetime.utcnow().replace(day=1) if idx % 2 == 0 else datetime.utcnow()).isoformat(),
+            'total_messages': 0,
+            'last_contact': None
+        }),
+    }
+
+def _load_checkpoint(conn, excel_file, signature):
+    """Sheet position to resume from, or None if the file was fully imported"""
+    checkpoint = conn.execute(
+        import_checkpoints.select().where(import_checkpoints.c.file_name == excel_file)
+    ).first()
+    if checkpoint is None or checkpoint.signature != signature:
+        return 0
+    if checkpoint.completed_at is not None:
+        return None
+    return checkpoint.rows_done
+
+def _save_checkpoint(conn, excel_file, signature, rows_done, rows_total):
+    conn.execute(import_checkpoints.delete().where(import_checkpoints.c.file_name == excel_file))
+    conn.execute(import_checkpoints.insert().values(
+        file_name=excel_file,
+        signature=signature,
+        rows_done=rows_done,
+        rows_total=rows_total,
+        completed_at=datetime.utcnow() if rows_done >= rows_total else None
+    ))
+
+def bulk_import_rows(bind, excel_file, signature, rows, rows_total, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Write normalized rows in chunked transactions; returns the number of messages inserted.
+
+    Each chunk commits its customers, messages, search index rows and the file
+    checkpoint together, so an interrupted import resumes after the last
+    committed chunk.
+
+    Exact and near duplicates (see dedupe.py) of messages already in the
+    database are skipped, since exports overlap; a duplicate of a message
+    inserted by this import adds to that message's ``repeat_count``.
+    """
+    with bind.begin() as conn:
+        checkpoint_metadata.create_all(conn)
+        start = _load_checkpoint(conn, excel_file, signature)
+        if start is None:
+            return None
+        refs = {ref for ref in rows['customer_ref'] if ref}
+        by_ref, by_email = resolve_customers(conn, refs, set(rows['email']))
+        index = existing_message_index(conn, set(by_ref.values()) | set(by_email.values()))
+    
+    def lookup(row):
+        customer_pk = by_ref.get(row.customer_ref) if row.customer_ref else None
+        if customer_pk is None and row.email:
+            customer_pk = by_email.get(row.email)
+        return customer_pk
+    
+    customers_table = Customer.__table__
+    messages_table = Message.__table__
+    imported = 0
+    inserted = set()  # ids of messages inserted by this call
+    for chunk_start in range(start, rows_total, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, rows_total)
+        chunk = rows[(rows['position'] >= chunk_start) & (rows['position'] < chunk_end)]
+        with bind.begin() as conn:
+            # Create customers first seen in this chunk: one per email, and rows whose
+            # ref is new but whose email is already pending join that customer (the
+            # same ref -> email fallback as the row importer)
+            pending = {}       # email -> row the customer is created from
+            pending_refs = {}  # customer_ref -> email of its pending customer
+            for row in chunk.itertuples(index=False):
+                if lookup(row) is not None or (row.customer_ref and row.customer_ref in pending_refs):
+                    continue
+                if row.email not in pending:
+                    pending[row.email] = row
+                if row.customer_ref:
+                    pending_refs[row.customer_ref] = row.email
+            new_customer_ids = []
+            if pending:
+                created = conn.execute(
+                    customers_table.insert().returning(customers_table.c.id, sort_by_parameter_order=True),
+                    [new_customer_row(row, signature) for row in pending.values()]
+                ).scalars().all()
+                created_by_email = dict(zip(pending, created))
+                by_email.update(created_by_email)
+                for ref, email in pending_refs.items():
+                    by_ref[ref] = created_by_email[email]
+                new_customer_ids = list(created)
+            
+            message_rows = []
+            fingerprints = []
+            repeats = {}  # message id from an earlier chunk -> duplicates found in this one
+            for row in chunk.itertuples(index=False):
+                customer_pk = lookup(row)
+                fingerprint = dedupe.Fingerprint(row.content)
+                duplicate = index.find(customer_pk, fingerprint)
+                if isinstance(duplicate, tuple):  # a row of this chunk
+                    message_rows[duplicate[1]]['repeat_count'] += 1
+                    continue
+                if duplicate is not None:
+                    if duplicate in inserted:
+                        repeats[duplicate] = repeats.get(duplicate, 0) + 1
+                    continue
+                index.add(customer_pk, ('row', len(message_rows)), fingerprint)
+                fingerprints.append(fingerprint)
+                message_rows.append({
+                    'customer_id': customer_pk,
+                    'content': row.content,
+                    'direction': 'incoming',
+                    'status': 'unread',
+                    'priority': int(row.priority),
+                    'repeat_count': 0
+                })
+            new_message_ids = []
+            if message_rows:
+                new_message_ids = conn.execute(
+                    messages_table.insert().returning(messages_table.c.id, sort_by_parameter_order=True),
+                    message_rows
+                ).scalars().all()
+            for position, (message_row, message_id) in enumerate(zip(message_rows, new_message_ids)):
+                index.discard(('row', position))
+                index.add(message_row['customer_id'], message_id, fingerprints[position])
+            inserted.update(new_message_ids)
+            if repeats:
+                conn.execute(
+                    messages_table.update()
+                    .where(messages_table.c.id == bindparam('message_id'))
+                    .values(repeat_count=messages_table.c.repeat_count + bindparam('repeats')),
+                    [{'message_id': message_id, 'repeats': n} for message_id, n in repeats.items()]
+                )
+            
+            search_index.index_customers(conn, new_customer_ids)
+            search_index.index_messages(conn, new_message_ids)
+            conversations.refresh(conn, {row['customer_id'] for row in message_rows})
+            _save_checkpoint(conn, excel_file, signature, chunk_end, rows_total)
+        imported += len(new_message_ids)
+    return imported
+
+ParsedWorkbook = namedtuple('ParsedWorkbook', ['excel_file', 'rows', 'rows_total', 'seconds', 'error'])
+
+def parse_workbook(directory, excel_file):
+    """Read and normalize one workbook without touching the database.
+
+    This is the CPU-bound half of the import; with --workers > 1 it runs in a
+    process pool while the parent process remains the only database writer.
+    """
+    import pandas as pd
+
+    started = time.perf_counter()
+    try:
+        df = pd.read_excel(os.path.join(directory, excel_file))
+        rows = normalize_sheet(df)
+    except Exception as e:
+        return ParsedWorkbook(excel_file, None, 0, time.perf_counter() - started, str(e))
+    return ParsedWorkbook(excel_file, rows, len(df), time.perf_counter() - started, None)
+
+def _is_imported(bind, excel_file, signature):
+    with bind.begin() as conn:
+        checkpoint_metadata.create_all(conn)
+        return _load_checkpoint(conn, excel_file, signature) is None
+
+def import_excel_files_batched(directory='.', chunk_size=DEFAULT_CHUNK_SIZE, bind=None, workers=1):
+    """Import all Excel files with set-based lookups and chunked bulk inserts.
+
+    With ``workers > 1`` workbooks are parsed in a process pool. Results are
+    consumed in file-name order by this process alone, so the database sees a
+    single writer and the outcome matches a serial run.
+    """
+    bind = bind or engine
+    excel_files = sorted(find_excel_files(directory))
+    print(f"Found {len(excel_files)} Excel files to import")
+    
+    signatures = {}
+    for excel_file in excel_files:
+        signature = file_signature(os.path.join(directory, excel_file))
+        if _is_imported(bind, excel_file, signature):
+            print(f"  {excel_file}: already imported, skipping")
+        else:
+            signatures[excel_file] = signature
+    pending = [f for f in excel_files if f in signatures]
+    
+    totals = {'rows': 0, 'imported': 0}
+    started = time.perf_counter()
+    
+    def write_all(parsed_workbooks):
+        for parsed in parsed_workbooks:
+            print(f"\nProcessing {parsed.excel_file}...")
+            if parsed.error is not None:
+                print(f"  Error processing {parsed.excel_file}: {parsed.error}")
+                continue
+            write_started = time.perf_counter()
+            try:
+                imported = bulk_import_rows(bind, parsed.excel_file, signatures[parsed.excel_file],
+                                            parsed.rows, parsed.rows_total, chunk_size)
+            except Exception as e:
+                print(f"  Error processing {parsed.excel_file}: {e}")
+                continue
+            elapsed = parsed.seconds + time.perf_counter() - write_started
+            totals['rows'] += parsed.rows_total
+            totals['imported'] += imported or 0
+            print(f"  Imported {imported or 0} messages from {parsed.excel_file} "
+                  f"({parsed.rows_total} rows, parse {parsed.seconds:.2f}s + write "
+                  f"{elapsed - parsed.seconds:.2f}s, {parsed.rows_total / elapsed:.0f} rows/sec)")
+    
+    if workers > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            # map() yields in submission order, keeping writes deterministic
+            write_all(pool.map(parse_workbook, repeat(directory), pending))
+    else:
+        write_all(map(parse_workbook, repeat(directory), pending))
+    
+    elapsed = time.perf_counter() - started
+    rate = totals['rows'] / elapsed if elapsed else 0
+    print(f"\nImport completed! {totals['imported']} messages from {totals['rows']} rows "
+          f"in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+    return totals['imported']
+
 def create_default_canned_messages():
     """Create some default canned messages"""
     session = Session()
@@ -136,7 +484,7 @@ def create_default_canned_messages():
         canned_messages = [
             {
                 'title': 'Loan Approval Status',
-                'content': 'Thank you for contacting us. We are currently reviewing your loan application. You will receive an update within 2-3 business days. If you have any urgent concerns, please let us know.',
+                'content': 'Hi {first_name}, thank you for contacting us. We are currently reviewing your loan application. You will receive an update within 2-3 business days. If you have any urgent concerns, please let us know.',
                 'category': 'loan'
             },
             {
@@ -151,7 +499,7 @@ def create_default_canned_messages():
             },
             {
                 'title': 'General Inquiry',
-                'content': 'Thank you for reaching out. We have received your message and will respond to your inquiry shortly. If this is urgent, please call our support line.',
+                'content': 'Hi {first_name}, thank you for reaching out. We have received your message and will respond to your inquiry shortly. If this is urgent, please call our support line.',
                 'category': 'general'
             },
             {
@@ -175,8 +523,21 @@ def create_default_canned_messages():
         session.close()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import customer messages from Excel exports')
+    parser.add_argument('--mode', choices=['batch', 'row'], default='batch',
+                        help='batch: chunked bulk inserts (default); row: original row-by-row import')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='rows per transaction in batch mode')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='processes used to parse workbooks in batch mode (writes stay in one process)')
+    args = parser.parse_args()
+    
     print("Starting data import...")
-    import_excel_files()
+    create_schema(engine)
+    if args.mode == 'batch':
+        import_excel_files_batched(chunk_size=args.chunk_size, workers=args.workers)
+    else:
+        import_excel_files()
     print("\nCreating default canned messages...")
     create_default_canned_messages()
     print("\nDone!")
@@ -0,0 +1,175 @@
+"""
+Materialized inbox counters behind ``GET /api/stats``.
+
+``InboxStats`` keeps running totals that the write paths update after they
+commit, so reading them never touches the database:
+
+- incoming messages by status and by priority, and unread by priority;
+- replies per agent;
+- the sum and count of first-response times (``created_at`` to the first
+  reply's ``replied_at``) for the average;
+- for each priority tier, a histogram of first-response latency over a
+  rolling window. Replies enter the window as they are recorded and are
+  subtracted again once they fall out of it.
+
+The counters only see this process's writes. ``reconcile`` replaces them with
+totals recomputed from the database; the app does that on a read once
+``reconcile_interval`` seconds have passed, which also corrects drift from
+writes committed while a reconcile query was running.
+"""
+
+import bisect
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from database import dialect_name
+from priority import TIER_SCORES
+
+# Upper bounds of the latency histogram buckets, in seconds; one more bucket
+# counts everything slower
+LATENCY_BUCKETS = (60, 300, 900, 3600, 4 * 3600, 24 * 3600)
+PRIORITY_TIERS = {score: tier for tier, score in TIER_SCORES.items()}
+HIGH_PRIORITY = TIER_SCORES['high']
+
+
+def priority_tier(priority):
+    return PRIORITY_TIERS.get(priority or 0, 'none')
+
+
+def seconds_between(bind, start, end):
+    """SQL expression for ``end - start`` in seconds on ``bind``'s database"""
+    if dialect_name(bind) == 'postgresql':
+        return func.extract('epoch', end - start)
+    return (func.julianday(end) - func.julianday(start)) * 86400
+
+
+class InboxStats:
+    def __init__(self, window=3600, reconcile_interval=60):
+        self.window = window
+        self.reconcile_interval = reconcile_interval
+        self._lock = threading.Lock()
+        self._reconciled = None  # (monotonic, datetime) of the last reconcile
+        self._reset()
+
+    def _reset(self):
+        self._status = Counter()
+        self._priority = Counter()
+        self._unread = Counter()  # priority -> unread incoming messages
+        self._agents = Counter()
+        self._response_sum = 0.0
+        self._response_count = 0
+        self._recent = deque()  # (replied_at, tier, bucket) inside the window
+        self._histograms = {}   # tier -> per-bucket counts
+
+    def added(self, priority, status='unread'):
+        """An incoming message was stored"""
+        with self._lock:
+            priority = priority or 0
+            self._status[status] += 1
+            self._priority[priority] += 1
+            if status == 'unread':
+                self._unread[priority] += 1
+
+    def status_changed(self, priority, old, new):
+        with self._lock:
+            self._move(priority or 0, old, new)
+
+    def replied(self, priority, old_status, agent_id, created_at, replied_at):
+        """An agent replied; the first reply to a message counts as its response time"""
+        with self._lock:
+            self._agents[agent_id] += 1
+            if old_status == 'replied':
+                return
+            self._move(priority or 0, old_status, 'replied')
+            latency = (replied_at - created_at).total_seconds()
+            self._response_sum += latency
+            self._response_count += 1
+            self._observe(priority_tier(priority), latency, replied_at)
+
+    def due(self):
+        """Whether the counters have not been reconciled within the interval"""
+        return self._reconciled is None or time.monotonic() - self._reconciled[0] >= self.reconcile_interval
+
+    def invalidate(self):
+        """Reconcile on the next read (after rows left the messages table in bulk)"""
+        self._reconciled = None
+
+    def window_start(self, now=None):
+        return (now or datetime.utcnow()) - timedelta(seconds=self.window)
+
+    def reconcile(self, messages, replies, response_sum, response_count, recent, now=None):
+        """Replace every counter with totals computed from the database.
+
+        ``messages`` are (status, priority, count) rows for incoming messages,
+        ``replies`` are (agent_id, count) rows and ``recent`` are
+        (priority, created_at, replied_at) rows of first responses since
+        ``window_start(now)``.
+        """
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._reset()
+            for status, priority, count in messages:
+                priority = priority or 0
+                self._status[status] += count
+                self._priority[priority] += count
+                if status == 'unread':
+                    self._unread[priority] += count
+            self._agents.update(dict(replies))
+            self._response_sum = float(response_sum or 0)
+            self._response_count = response_count or 0
+            for priority, created_at, replied_at in sorted(recent, key=lambda row: row[2]):
+                self._observe(priority_tier(priority), (replied_at - created_at).total_seconds(), replied_at)
+            self._reconciled = (time.monotonic(), now)
+
+    def snapshot(self, now=None):
+        with self._lock:
+            self._expire(now or datetime.utcnow())
+            unread = sum(self._unread.values())
+            return {
+                'messages': {
+                    'total': sum(self._priority.values()),
+                    'by_status': dict(self._status),
+                    'by_priority': {str(p): n for p, n in sorted(self._priority.items())},
+                    'unread': unread,
+                    'high_priority': sum(n for p, n in self._priority.items() if p >= HIGH_PRIORITY),
+                    'unread_high_priority': sum(n for p, n in self._unread.items() if p >= HIGH_PRIORITY),
+                },
+                'replies': {
+                    'total': sum(self._agents.values()),
+                    'by_agent': {str(a): n for a, n in sorted(self._agents.items(), key=lambda item: str(item[0]))},
+                },
+                'first_response': {
+                    'count': self._response_count,
+                    'average_seconds': (round(self._response_sum / self._response_count, 1)
+                                        if self._response_count else None),
+                    'window_seconds': self.window,
+                    'buckets': list(LATENCY_BUCKETS) + ['+Inf'],
+                    'by_tier': {tier: list(counts) for tier, counts in self._histograms.items()},
+                },
+                'reconciled_at': self._reconciled[1].isoformat() if self._reconciled else None,
+            }
+
+    def _move(self, priority, old, new):
+        if old == new:
+            return
+        self._status[old] -= 1
+        self._status[new] += 1
+        if old == 'unread':
+            self._unread[priority] -= 1
+        elif new == 'unread':
+            self._unread[priority] += 1
+
+    def _observe(self, tier, latency, replied_at):
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, latency)
+        self._histograms.setdefault(tier, [0] * (len(LATENCY_BUCKETS) + 1))[bucket] += 1
+        self._recent.append((replied_at, tier, bucket))
+
+    def _expire(self, now):
+        start = self.window_start(now)
+        while self._recent and self._recent[0][0] < start:
+            _, tier, bucket = self._recent.popleft()
+            self._histograms[tier][bucket] -= 1
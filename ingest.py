@@ -0,0 +1,176 @@
+"""
+Asynchronous ingestion of inbound customer messages.
+
+With ``INGEST_MODE=async`` the send-message endpoint only validates the
+submission, gives it an ``ingest_id`` and puts it on a bounded in-memory
+queue; the request returns 202 straight away. A single writer thread drains
+the queue and hands everything waiting (up to ``batch_size``) to
+``write_batch`` so a burst of submissions costs one SQLite transaction
+instead of one per request.
+
+- Backpressure: when the queue is full ``submit`` raises :class:`QueueFull`
+  and the endpoint answers 429.
+- Durability: ``stop`` (registered with ``atexit``) drains the queue before
+  the process exits. Submissions that cannot be written -- the database keeps
+  failing, or the drain times out -- are appended to a JSON-lines spool file
+  and written by the next process on start-up.
+- Retries: only ``write_batch`` is retried. What it returns is handed once
+  to ``on_committed`` (broadcasts and other notifications); an error there is
+  logged, and never re-runs a batch that is already committed.
+- Metrics: ``stats`` reports the queue depth and commit batch sizes.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    """The ingest queue is at capacity; the client should retry later"""
+
+
+class IngestQueue:
+    def __init__(self, write_batch, maxsize=10000, batch_size=200, spool_path=None, retries=3, on_committed=None):
+        self._write_batch = write_batch
+        self._on_committed = on_committed
+        self._queue = queue.Queue(maxsize)
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.spool_path = spool_path
+        self.retries = retries
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'accepted': 0, 'rejected': 0, 'committed': 0, 'failed': 0, 'spooled': 0,
+            'batches': 0, 'last_batch_size': 0, 'max_batch_size': 0,
+        }
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, item):
+        """Enqueue one submission; returns its ingest_id or raises QueueFull"""
+        item = dict(item, ingest_id=uuid.uuid4().hex, received_at=time.time())
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._count(rejected=1)
+            raise QueueFull()
+        self._count(accepted=1)
+        return item['ingest_id']
+
+    def flush(self, timeout=10):
+        """Wait until everything submitted so far has been written (or spooled)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout=10):
+        """Drain the queue, then stop the writer; spool whatever is left"""
+        if self._thread is not None:
+            self.flush(timeout)
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+        leftover = self._drain(None)
+        if leftover:
+            self._spool(leftover)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['depth'] = self._queue.qsize()
+        stats['capacity'] = self.maxsize
+        stats['mean_batch_size'] = round(stats['committed'] / stats['batches'], 2) if stats['batches'] else 0
+        return stats
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _drain(self, first):
+        batch = [] if first is None else [first]
+        while len(batch) < self.batch_size or first is None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        self._recover()
+        while True:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            # Everything that queued up during the previous commit goes in this one
+            batch = self._drain(first)
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _commit(self, batch):
+        for attempt in range(self.retries):
+            try:
+                written = self._write_batch(batch)
+            except Exception:
+                logger.exception('Ingest batch of %d failed (attempt %d)', len(batch), attempt + 1)
+                time.sleep(0.05 * 2 ** attempt)
+                continue
+            with self._lock:
+                self._stats['committed'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['last_batch_size'] = len(batch)
+                self._stats['max_batch_size'] = max(self._stats['max_batch_size'], len(batch))
+            if self._on_committed is not None:
+                try:
+                    self._on_committed(batch, written)
+                except Exception:
+                    logger.exception('Notifying a committed ingest batch of %d failed', len(batch))
+            return
+        self._count(failed=len(batch))
+        self._spool(batch)
+
+    def _spool(self, items):
+        if not self.spool_path:
+            logger.error('Dropping %d ingest submissions (no spool file configured)', len(items))
+            return
+        with open(self.spool_path, 'a') as f:
+            for item in items:
+                f.write(json.dumps(item) + '\n')
+        self._count(spooled=len(items))
+
+    def _recover(self):
+        """Write submissions spooled by a previous process, oldest first"""
+        if not self.spool_path:
+            return
+        recovering = self.spool_path + '.recovering'
+        if not os.path.exists(recovering):
+            if not os.path.exists(self.spool_path):
+                return
+            os.replace(self.spool_path, recovering)
+        with open(recovering) as f:
+            items = [json.loads(line) for line in f if line.strip()]
+        logger.info('Recovering %d spooled ingest submissions', len(items))
+        for i in range(0, len(items), self.batch_size):
+            self._commit(items[i:i + self.batch_size])  # failures go back to the spool
+        os.remove(recovering)
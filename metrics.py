@@ -0,0 +1,284 @@
+"""
+Request-level instrumentation, exposed in Prometheus text format.
+
+``RequestMetrics.init_app`` hooks into Flask and SQLAlchemy and records:
+
+- ``http_request_duration_seconds``: latency per endpoint, method and status;
+- ``db_queries_per_request`` and ``db_query_seconds_total``: how many
+  statements each endpoint runs and how long they take, from the engine's
+  ``before_cursor_execute`` / ``after_cursor_execute`` events (all engines,
+  including ones created later; ``handle_error`` clears the start time of a
+  statement that failed);
+- ``http_response_rows_total`` / ``http_response_bytes_total``: list items
+  passed to ``jsonify`` and the size of the response body;
+- ``socketio_emits_total`` / ``socketio_emit_bytes_total``: events emitted
+  and their JSON payload size (see ``record_emit``).
+
+Only statements run while serving a request are measured. Those slower than
+``slow_query_ms`` are logged with the endpoint that ran them. A request that
+runs the same statement ``repeat_threshold`` times or more is logged as a
+likely N+1 pattern (a query per row instead of a join or an IN list).
+
+``Registry.render`` produces the text served at ``/metrics``. There are no
+external dependencies; metrics are per process.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter as StatementCounter
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}  # label values -> value
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label names, label values, value) tuples"""
+        with self._lock:
+            return [('', self.labelnames, key, value) for key, value in sorted(self._values.items())]
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """A value set explicitly, or read from ``function`` at render time"""
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.function is not None:
+            return [('', (), (), self.function())]
+        return super().samples()
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        names = self.labelnames + ('le',)
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    samples.append(('_bucket', names, key + (repr(float(bound)),), cumulative))
+                samples.append(('_bucket', names, key + ('+Inf',), count))
+                samples.append(('_sum', self.labelnames, key, total))
+                samples.append(('_count', self.labelnames, key, count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for suffix, names, values, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(names, values)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _row_count(payload):
+    """Rows in a JSON payload: the items of a top-level list, or of the lists in a dict"""
+    if isinstance(payload, list):
+        return len(payload)
+    if isinstance(payload, dict):
+        return sum(len(value) for value in payload.values() if isinstance(value, list))
+    return 0
+
+
+class RequestMetrics:
+    def __init__(self, registry=None, slow_query_ms=100, repeat_threshold=10):
+        self.registry = registry or Registry()
+        self.slow_query_ms = slow_query_ms
+        self.repeat_threshold = repeat_threshold
+        self._state = f'_metrics_{id(self)}'  # per-request state on flask.g
+        self._started = f'_metrics_{id(self)}_started'  # running statement's start time on conn.info
+        r = self.registry
+        self.request_duration = r.histogram(
+            'http_request_duration_seconds', 'Request latency', ('endpoint', 'method', 'status'))
+        self.queries_per_request = r.histogram(
+            'db_queries_per_request', 'SQL statements executed per request', ('endpoint',),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.query_seconds = r.counter(
+            'db_query_seconds_total', 'Time spent executing SQL statements', ('endpoint',))
+        self.slow_queries = r.counter(
+            'db_slow_queries_total', 'SQL statements slower than the slow-query threshold', ('endpoint',))
+        self.repeated_queries = r.counter(
+            'db_repeated_query_requests_total', 'Requests that ran one statement repeatedly (likely N+1)',
+            ('endpoint',))
+        self.response_rows = r.counter(
+            'http_response_rows_total', 'List items serialized into JSON responses', ('endpoint',))
+        self.response_bytes = r.counter(
+            'http_response_bytes_total', 'Response body bytes', ('endpoint',))
+        self.emits = r.counter('socketio_emits_total', 'Socket.IO events emitted', ('event',))
+        self.emit_bytes = r.counter(
+            'socketio_emit_bytes_total', 'JSON payload bytes of emitted Socket.IO events', ('event',))
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(Engine, 'handle_error', self._handle_error)
+        json_response = app.json.response
+
+        def response(*args, **kwargs):
+            state = self._request_state()
+            if state is not None:
+                state['rows'] += _row_count(args[0] if len(args) == 1 else args or kwargs)
+            return json_response(*args, **kwargs)
+        app.json.response = response
+
+    def gauge(self, name, help, function):
+        """Register a gauge read from ``function()`` when /metrics is scraped"""
+        return self.registry.gauge(name, help, function=function)
+
+    def record_emit(self, event_name, data):
+        self.emits.inc(event=event_name)
+        self.emit_bytes.inc(len(json.dumps(data, default=str)), event=event_name)
+
+    def render(self):
+        return self.registry.render()
+
+    def _request_state(self):
+        return g.get(self._state) if has_request_context() else None
+
+    def _start_request(self):
+        setattr(g, self._state, {'started': time.perf_counter(), 'queries': 0, 'query_time': 0.0,
+                                 'statements': StatementCounter(), 'rows': 0})
+
+    def _finish_request(self, response):
+        state = g.pop(self._state, None)
+        if state is None:
+            return response
+        endpoint = request.endpoint or 'unmatched'
+        self.request_duration.observe(
+            time.perf_counter() - state['started'],
+            endpoint=endpoint, method=request.method, status=response.status_code)
+        self.queries_per_request.observe(state['queries'], endpoint=endpoint)
+        self.query_seconds.inc(state['query_time'], endpoint=endpoint)
+        if state['rows']:
+            self.response_rows.inc(state['rows'], endpoint=endpoint)
+        if not response.direct_passthrough:
+            self.response_bytes.inc(response.calculate_content_length() or 0, endpoint=endpoint)
+        if state['statements']:
+            statement, count = state['statements'].most_common(1)[0]
+            if count >= self.repeat_threshold:
+                self.repeated_queries.inc(endpoint=endpoint)
+                logger.warning('%s ran the same statement %d times (likely N+1): %s',
+                               endpoint, count, ' '.join(statement.split())[:500])
+        return response
+
+    # One slot per connection: a connection runs one cursor execute at a time, and
+    # the slot is cleared on failure so it does not outlive the statement
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info[self._started] = time.perf_counter()
+
+    def _handle_error(self, exception_context):
+        if exception_context.connection is not None:
+            exception_context.connection.info.pop(self._started, None)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop(self._started, None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        state = self._request_state()
+        if state is None:
+            return  # scripts and background threads importing the app are not measured
+        state['queries'] += 1
+        state['query_time'] += elapsed
+        # An executemany may reach the cursor in several batches (e.g. INSERT ... RETURNING
+        # on SQLite, one row at a time); it is still one statement of the request
+        if not executemany or state.get('executemany') is not context:
+            state['statements'][statement] += 1
+        state['executemany'] = context if executemany else None
+        if elapsed * 1000 >= self.slow_query_ms:
+            endpoint = request.endpoint or 'unmatched'
+            self.slow_queries.inc(endpoint=endpoint)
+            logger.warning('Slow query (%.1f ms) in %s: %s',
+                           elapsed * 1000, endpoint, ' '.join(statement.split())[:500])
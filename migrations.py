@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations for an existing messaging database.
+
+`Base.metadata.create_all` only creates missing tables, so indexes and other
+changes added to the models later never reach a database that already exists.
+Each migration here is applied once, in order, inside its own transaction and
+recorded in the `schema_migrations` table. Migrations never drop data.
+
+Usage:
+    python3 migrations.py                 # apply pending migrations
+    python3 migrations.py --status        # show applied/pending migrations
+    python3 migrations.py --database-url sqlite:///other.db
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from sqlalchemy import text, inspect, MetaData, Table, Column, Integer, String, DateTime
+
+from models import Customer, Message, Conversation, create_schema
+import conversations
+import search_index
+from database import DATABASE_URL, create_database_engine
+
+migration_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200)),
+    Column('applied_at', DateTime),
+)
+
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied without losing data"""
+
+
+def _create_indexes(conn, table, names):
+    for index in table.indexes:
+        if index.name in names:
+            index.create(conn, checkfirst=True)
+
+
+def _add_hot_path_indexes(conn):
+    _create_indexes(conn, Message.__table__, {
+        'ix_messages_inbox',
+        'ix_messages_inbox_status',
+        'ix_messages_customer_created',
+    })
+
+
+def _add_unique_customer_email(conn):
+    duplicates = conn.execute(text(
+        "SELECT email, COUNT(*) FROM customers "
+        "WHERE email IS NOT NULL GROUP BY email HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        listing = ', '.join(f"{email!r} x{count}" for email, count in duplicates[:10])
+        raise MigrationError(
+            f"Cannot add unique index on customers.email: {len(duplicates)} duplicated "
+            f"email(s) ({listing}). Merge these customers and re-run the migration."
+        )
+    _create_indexes(conn, Customer.__table__, {'ux_customers_email'})
+
+
+def _add_search_index(conn):
+    search_index.create_tables(conn)
+    search_index.populate(conn)
+
+
+def _add_replied_at_index(conn):
+    _create_indexes(conn, Message.__table__, {'ix_messages_replied_at'})
+
+
+def _add_conversations(conn):
+    Conversation.__table__.create(conn, checkfirst=True)
+    conversations.refresh(conn)
+
+
+def _add_repeat_count(conn):
+    if 'repeat_count' not in {column['name'] for column in inspect(conn).get_columns('messages')}:
+        conn.execute(text("ALTER TABLE messages ADD COLUMN repeat_count INTEGER NOT NULL DEFAULT 0"))
+
+
+# (version, description, function) -- append only, never renumber
+MIGRATIONS = [
+    (1, 'Composite indexes for inbox and conversation queries', _add_hot_path_indexes),
+    (2, 'Unique index on customers.email', _add_unique_customer_email),
+    (3, 'FTS5 search index over messages and customers', _add_search_index),
+    (4, 'Index on messages.replied_at for response-time stats', _add_replied_at_index),
+    (5, 'Conversation threads backfilled from messages', _add_conversations),
+    (6, 'messages.repeat_count for collapsed near-duplicates', _add_repeat_count),
+]
+
+
+def applied_versions(engine):
+    migration_metadata.create_all(engine)
+    with engine.connect() as conn:
+        return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def migrate(engine, target=None):
+    """Apply pending migrations up to `target` (default: latest). Returns applied versions."""
+    done = applied_versions(engine)
+    applied = []
+    for version, description, upgrade in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version,
+                description=description,
+                applied_at=datetime.utcnow()
+            ))
+        applied.append(version)
+    return applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Apply schema migrations to the messaging database')
+    parser.add_argument('--database-url', default=DATABASE_URL)
+    parser.add_argument('--status', action='store_true', help='list migrations without applying them')
+    parser.add_argument('--target', type=int, default=None, help='stop after this version')
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.database_url)
+    if args.status:
+        done = applied_versions(engine)
+        for version, description, _ in MIGRATIONS:
+            state = 'applied' if version in done else 'pending'
+            print(f"  {version:>3}  {state:<8} {description}")
+        return 0
+
+    try:
+        # Missing tables first (a new database gets the current schema), then the upgrades
+        create_schema(engine)
+        applied = migrate(engine, target=args.target)
+    except MigrationError as e:
+        print(f"Migration failed: {e}")
+        return 1
+    if applied:
+        print(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        print("Database is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
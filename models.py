@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Database models, importable without side effects.
+
+Importing this module defines the tables and nothing else: no engine, no
+connection, no Flask app. The server, the importer, migrations and the
+benchmarks share it, so a CLI job does not pay for Flask-SocketIO or a
+round of ``CREATE TABLE IF NOT EXISTS`` just to get at ``Message``.
+
+Creating the schema is an explicit step, ``create_schema(bind)``: the model
+tables plus the search index, claim and archive tables kept on their own
+MetaData by search_index.py, work_queue.py and archive.py. ``create_app``
+runs it on server start, ``migrations.py`` and ``import_data.py`` before
+they write, and it can be run on its own:
+
+    python3 models.py [--database-url sqlite:///other.db] [--archive-database archive.db]
+"""
+
+import argparse
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index
+from sqlalchemy.orm import declarative_base, relationship
+
+Base = declarative_base()
+
+
+class Customer(Base):
+    __tablename__ = 'customers'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(200))
+    email = Column(String(200))
+    phone = Column(String(50))
+    customer_id = Column(String(100), unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    messages = relationship("Message", back_populates="customer")
+    profile_data = Column(Text)  # JSON string for additional customer info
+
+    __table_args__ = (
+        # find-or-create by email in customer_send_message and the importer
+        Index('ux_customers_email', 'email', unique=True),
+    )
+
+
+class Message(Base):
+    __tablename__ = 'messages'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'))
+    customer = relationship("Customer", back_populates="messages")
+    content = Column(Text)
+    direction = Column(String(20))  # 'incoming' or 'outgoing'
+    agent_id = Column(Integer, nullable=True)  # Null for incoming, set for outgoing
+    agent_name = Column(String(100), nullable=True)
+    status = Column(String(20), default='unread')  # 'unread', 'read', 'replied'
+    priority = Column(Integer, default=0)  # Higher number = more urgent
+    created_at = Column(DateTime, default=datetime.utcnow)
+    replied_at = Column(DateTime, nullable=True)
+    # Near-duplicate resubmissions collapsed into this message (see dedupe.py)
+    repeat_count = Column(Integer, default=0, server_default='0', nullable=False)
+
+    __table_args__ = (
+        # Inbox ordering: direction filter, then priority/created_at/id (scanned backwards)
+        Index('ix_messages_inbox', 'direction', 'priority', 'created_at', 'id'),
+        # Inbox filtered by status (e.g. the Unread tab)
+        Index('ix_messages_inbox_status', 'direction', 'status', 'priority', 'created_at', 'id'),
+        # Per-customer conversation history in get_message
+        Index('ix_messages_customer_created', 'customer_id', 'created_at'),
+        # Rolling first-response window in reconcile_inbox_stats
+        Index('ix_messages_replied_at', 'replied_at'),
+    )
+
+
+class Conversation(Base):
+    """One thread per customer with denormalized inbox fields (see conversations.py)"""
+    __tablename__ = 'conversations'
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, ForeignKey('customers.id'), nullable=False, unique=True)
+    last_message_id = Column(Integer, nullable=True)
+    last_message_preview = Column(Text, nullable=True)
+    last_message_direction = Column(String(20), nullable=True)
+    last_activity = Column(DateTime, nullable=True)
+    unread_count = Column(Integer, default=0, nullable=False)
+    open_count = Column(Integer, default=0, nullable=False)  # incoming messages awaiting a reply
+    max_priority = Column(Integer, default=0, nullable=False)  # highest priority awaiting a reply
+    message_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Thread inbox ordering, same shape as ix_messages_inbox
+        Index('ix_conversations_inbox', 'max_priority', 'last_activity', 'id'),
+    )
+
+
+class CannedMessage(Base):
+    __tablename__ = 'canned_messages'
+    id = Column(Integer, primary_key=True)
+    title = Column(String(200))
+    content = Column(Text)
+    category = Column(String(100))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Agent(Base):
+    __tablename__ = 'agents'
+    id = Column(Integer, primary_key=True)
+    name = Column(String(100))
+    email = Column(String(200))
+    is_active = Column(Boolean, default=True)
+    last_active = Column(DateTime, default=datetime.utcnow)
+
+
+def create_schema(bind):
+    """Create every missing table and index the server uses (existing ones are left alone)"""
+    # Imported here so that importing the models stays free of engines and app modules
+    import archive
+    import search_index
+    import work_queue
+
+    Base.metadata.create_all(bind)
+    search_index.create_search_tables(bind)
+    work_queue.create_claims_table(bind)
+    archive.create_tables(bind)
+
+
+def main(argv=None):
+    from database import ARCHIVE_DATABASE, DATABASE_URL, create_database_engine
+
+    parser = argparse.ArgumentParser(description='Create the messaging database tables')
+    parser.add_argument('--database-url', default=DATABASE_URL)
+    parser.add_argument('--archive-database', default=ARCHIVE_DATABASE,
+                        help='SQLite file attached as the archive (default: a table in the main database)')
+    args = parser.parse_args(argv)
+    engine = create_database_engine(args.database_url, archive_path=args.archive_database)
+    create_schema(engine)
+    engine.dispose()
+    print("Schema is in place")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Priority detection for incoming customer messages.
+
+The keyword table is compiled once per (re)load into a single alternation,
+``\\b(?=(?P<high>...)|(?P<medium>...)|(?P<low>...))``, with one named group
+per tier. ``score`` and ``classify`` both make one pass over the lowercased
+content with it: the group that matched gives the tier, its text the keyword.
+``score`` stops at the first keyword of the highest tier. The lookahead
+consumes nothing, so a keyword starting inside another one is still seen.
+
+Keywords match at the start of a word (``\\bkeyword``), so ``urgent`` still
+matches "urgently" and ``change`` matches "changes", but ``change`` no longer
+matches inside "exchange" or ``asap`` inside "wasapp".
+
+The table can be swapped at runtime with ``reload`` (or ``load_keywords_file``)
+without restarting; readers always see either the old or the new table. There
+is no HTTP endpoint for it: set ``PRIORITY_KEYWORDS_FILE`` to a JSON file and
+every process using the default engine (server workers, the importer) reloads
+it within ``PRIORITY_KEYWORDS_TTL`` seconds (default 5) of an edit. A file
+that does not parse is logged and the previous table stays in use.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# Urgency keywords for priority detection
+URGENCY_KEYWORDS = {
+    'high': ['loan approval', 'loan disbursed', 'disbursement', 'approval process',
+             'urgent', 'asap', 'immediately', 'critical', 'emergency'],
+    'medium': ['status', 'update', 'when', 'how long', 'timeline'],
+    'low': ['how to', 'update information', 'change', 'modify']
+}
+
+TIER_SCORES = {'high': 3, 'medium': 2, 'low': 1}
+
+PRIORITY_LABELS = {
+    0: 'None (Default)',
+    1: 'Low',
+    2: 'Medium',
+    3: 'High/Urgent'
+}
+
+
+def _alternation(keywords):
+    # Longest first so a longer keyword wins over its own prefix
+    return '|'.join(re.escape(k.lower()) for k in sorted(keywords, key=len, reverse=True))
+
+
+class PriorityEngine:
+    """Compiled keyword classifier; see the module docstring"""
+
+    def __init__(self, keywords=None):
+        self._watched = None      # (path, interval) given to watch_file
+        self._watched_mtime = None
+        self._next_check = 0.0
+        self.reload(keywords or URGENCY_KEYWORDS)
+
+    def reload(self, keywords):
+        """Compile and atomically install a new {tier: [keywords]} table"""
+        if not isinstance(keywords, dict) or not all(
+            isinstance(words, list) and all(isinstance(w, str) for w in words) for words in keywords.values()
+        ):
+            raise ValueError('Expected an object of keyword lists')
+        unknown = set(keywords) - set(TIER_SCORES)
+        if unknown:
+            raise ValueError(f"Unknown priority tiers: {', '.join(sorted(unknown))}")
+
+        tiers = sorted(
+            ((TIER_SCORES[tier], tier, [k for k in words if k]) for tier, words in keywords.items()),
+            reverse=True
+        )
+        # At each word start the alternation tries higher tiers first, so a
+        # position reports the most urgent keyword that starts there.
+        groups = [f'(?P<{tier}>{_alternation(words)})' for _, tier, words in tiers if words]
+        pattern = re.compile(rf'\b(?={"|".join(groups)})') if groups else None
+        top = max((score for score, _, words in tiers if words), default=0)
+
+        table = {tier: list(words) for tier, words in keywords.items()}
+        # Single assignment so concurrent readers never see a half-built state
+        self._state = (table, pattern, top)
+
+    @property
+    def keywords(self):
+        self._check_file()
+        return {tier: list(words) for tier, words in self._state[0].items()}
+
+    def score(self, content):
+        """Priority 0-3 for one message"""
+        self._check_file()
+        _, pattern, top = self._state
+        if not content or pattern is None:
+            return 0
+        priority = 0
+        for match in pattern.finditer(content.lower()):
+            score = TIER_SCORES[match.lastgroup]
+            if score > priority:
+                priority = score
+                if priority == top:
+                    break
+        return priority
+
+    def classify(self, content):
+        """Return (priority, matched keywords) in one pass over the content"""
+        self._check_file()
+        _, pattern, _ = self._state
+        if not content or pattern is None:
+            return 0, []
+        matched = []
+        priority = 0
+        for match in pattern.finditer(content.lower()):
+            keyword = match.group(match.lastgroup)
+            if keyword not in matched:
+                matched.append(keyword)
+            priority = max(priority, TIER_SCORES[match.lastgroup])
+        return priority, matched
+
+    def score_many(self, contents):
+        """Score a list of strings or a pandas Series.
+
+        When texts repeat (overlapping Excel exports) each distinct text is
+        scored once. A Series comes back as an int Series on the same index;
+        anything else as a list.
+        """
+        if hasattr(contents, 'map'):
+            distinct = contents.dropna().unique()
+            if len(distinct) * 2 > len(contents):
+                scored = contents.map(self.score, na_action='ignore')
+            else:
+                scored = contents.map({content: self.score(content) for content in distinct})
+            return scored.fillna(0).astype('int64')
+        scores = {}
+        return [
+            scores[content] if content in scores else scores.setdefault(content, self.score(content))
+            for content in contents
+        ]
+
+    def load_keywords_file(self, path):
+        """Reload the table from a JSON file shaped like URGENCY_KEYWORDS"""
+        with open(path) as f:
+            self.reload(json.load(f))
+
+    def watch_file(self, path, interval=5):
+        """Load the table from ``path`` now, and again whenever the file changes.
+
+        The modification time is checked at most every ``interval`` seconds,
+        by the scoring calls themselves.
+        """
+        self.load_keywords_file(path)
+        self._watched_mtime = os.stat(path).st_mtime_ns
+        self._next_check = time.monotonic() + interval
+        self._watched = (path, interval)
+
+    def _check_file(self):
+        if self._watched is None or time.monotonic() < self._next_check:
+            return
+        path, interval = self._watched
+        self._next_check = time.monotonic() + interval
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime == self._watched_mtime:
+                return
+            self._watched_mtime = mtime
+            self.load_keywords_file(path)
+        except (OSError, ValueError):
+            logger.exception('Keeping the current priority keywords; %s could not be loaded', path)
+
+
+default_engine = PriorityEngine()
+if os.environ.get('PRIORITY_KEYWORDS_FILE'):
+    default_engine.watch_file(os.environ['PRIORITY_KEYWORDS_FILE'],
+                              interval=float(os.environ.get('PRIORITY_KEYWORDS_TTL', 5)))
+
+
+def calculate_priority(content):
+    """Calculate message priority based on content"""
+    return default_engine.score(content)
+
+
+def classify_priority(content):
+    """Return (priority, matched keywords) for content"""
+    return default_engine.classify(content)
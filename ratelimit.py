@@ -0,0 +1,273 @@
+"""
+Token-bucket rate limiting for public endpoints.
+
+``RateLimiter.limited(route, ip=(key function, limit), ...)`` wraps a Flask
+view. Before the view runs, each request takes one token from a bucket per
+key kind (e.g. the client IP and the email in the JSON body). A bucket holds
+up to ``burst`` tokens and refills at ``rate`` per second. A request is let
+through only if every bucket has a token; otherwise no token is taken and
+the client gets ``429`` with ``Retry-After``. Rejected requests never reach
+the view, so they cost a JSON parse and a bucket lookup, and no database
+work, broadcast or ingest queue slot.
+
+Limits are written ``<count>/<period>[:<burst>]``, e.g. ``10/minute`` or
+``60/minute:20``; ``off`` disables one. ``configured_limit`` reads the
+override for a route and key kind from ``RATE_LIMIT_<ROUTE>_<KIND>``.
+
+Buckets live in one of two stores:
+
+- :class:`MemoryBucketStore` (default): per process, bounded in size (least
+  recently used keys are dropped, which only refills them early);
+- :class:`SQLiteBucketStore` (``RATE_LIMIT_STORE=sqlite:///path.db``): a
+  small table in its own SQLite file, shared by every worker process on the
+  host, so N workers do not allow N times the limit. Each check is one short
+  ``BEGIN IMMEDIATE`` transaction on that file, never on the application
+  database. Keys found empty are then rejected from memory until they
+  refill, so a flood costs the file one transaction per refill period.
+
+Given a metrics registry, decisions are counted in
+``rate_limit_requests_total`` (per route and result) and
+``rate_limit_exhausted_total`` (per route and the key kind that ran out),
+and the configured limits are exported as gauges.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import jsonify, request
+
+SQLITE_SCHEME = 'sqlite:///'
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+class Limit(namedtuple('Limit', 'rate burst')):
+    """``rate`` tokens per second, at most ``burst`` at once"""
+
+    @classmethod
+    def parse(cls, spec):
+        """``'10/minute'`` or ``'10/minute:20'``; None for ``off`` or an empty spec"""
+        spec = (spec or '').strip().lower()
+        if spec in ('', 'off', 'none'):
+            return None
+        try:
+            amount, _, burst = spec.partition(':')
+            count, _, period = amount.partition('/')
+            seconds = PERIODS[period.strip().rstrip('s') or 'second']
+            count = float(count)
+            limit = cls(count / seconds, float(burst) if burst else count)
+        except (KeyError, ValueError):
+            raise ValueError(f'Invalid rate limit: {spec!r} (expected e.g. 10/minute or 10/minute:20)') from None
+        if limit.rate <= 0 or limit.burst < 1:
+            raise ValueError(f'Invalid rate limit: {spec!r}')
+        return limit
+
+
+def configured_limit(route, kind, default):
+    """The limit for ``route`` and key ``kind`` from RATE_LIMIT_<ROUTE>_<KIND>, else ``default``"""
+    return Limit.parse(os.environ.get(f'RATE_LIMIT_{route}_{kind}'.upper().replace('-', '_'), default))
+
+
+def _refill(tokens, updated_at, limit, now):
+    if tokens is None:
+        return limit.burst
+    return min(limit.burst, tokens + max(now - updated_at, 0.0) * limit.rate)
+
+
+def _decide(buckets, limits, now):
+    """(keys without a token, new token counts after taking one from each)"""
+    tokens = {key: _refill(*buckets.get(key, (None, None)), limits[key], now) for key in limits}
+    empty = {key: (1 - tokens[key]) / limits[key].rate for key in limits if tokens[key] < 1}
+    return empty, {key: value - 1 for key, value in tokens.items()}
+
+
+class MemoryBucketStore:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, limits):
+        """Take a token from each ``{key: Limit}`` bucket, or from none.
+
+        Returns ``{key: seconds until it has a token}`` for the empty
+        buckets; an empty dict means the tokens were taken.
+        """
+        now = time.monotonic()
+        with self._lock:
+            empty, tokens = _decide(self._buckets, limits, now)
+            if not empty:
+                for key, value in tokens.items():
+                    self._buckets[key] = (value, now)
+                    self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+        return empty
+
+
+class SQLiteBucketStore:
+    """Buckets in a SQLite file shared by the worker processes of one host"""
+
+    def __init__(self, path, prune_after=3600, prune_every=1000, max_empty_keys=10000):
+        self.path = path
+        self.prune_after = prune_after
+        self.prune_every = prune_every
+        self.max_empty_keys = max_empty_keys
+        self._local = threading.local()
+        self._takes = 0
+        # Other processes can only take tokens, so an empty bucket stays empty at least
+        # until its refill time: reject those keys here without touching the file
+        self._lock = threading.Lock()
+        self._empty_until = {}  # key -> time.monotonic() deadline
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM rate_limit_buckets").fetchone()[0]
+
+    def take(self, limits):
+        local_now = time.monotonic()
+        with self._lock:
+            known_empty = {key: self._empty_until[key] - local_now for key in limits
+                           if self._empty_until.get(key, 0) > local_now}
+        if known_empty:
+            return known_empty
+        conn = self._connection()
+        now = time.time()  # wall clock: shared between processes
+        keys = list(limits)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                f"SELECT key, tokens, updated_at FROM rate_limit_buckets WHERE key IN ({','.join('?' * len(keys))})",
+                keys
+            ).fetchall()
+            empty, tokens = _decide({key: (value, updated_at) for key, value, updated_at in rows}, limits, now)
+            if not empty:
+                conn.executemany(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    [(key, value, now) for key, value in tokens.items()]
+                )
+                self._takes += 1
+                if self._takes % self.prune_every == 0:
+                    # Long idle buckets are full again; dropping them changes nothing
+                    conn.execute("DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - self.prune_after,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if empty:
+            with self._lock:
+                if len(self._empty_until) >= self.max_empty_keys:
+                    self._empty_until = {key: until for key, until in self._empty_until.items() if until > local_now}
+                self._empty_until.update((key, local_now + wait) for key, wait in empty.items())
+        return empty
+
+
+def store_from_url(url):
+    """``None``/``memory`` for a per-process store, ``sqlite:///path`` for a shared one"""
+    if not url or url == 'memory':
+        return MemoryBucketStore()
+    if url.startswith(SQLITE_SCHEME):
+        return SQLiteBucketStore(url[len(SQLITE_SCHEME):])
+    raise ValueError(f'Unsupported RATE_LIMIT_STORE: {url}')
+
+
+def client_ip():
+    """Address of the connecting client (behind a proxy, apply werkzeug's ProxyFix first)"""
+    return request.remote_addr
+
+
+def json_field(name):
+    """Key function: a field of the JSON body, trimmed and case-folded"""
+    def key():
+        data = request.get_json(silent=True)
+        value = data.get(name) if isinstance(data, dict) else None
+        if value is None:
+            return None
+        return str(value).strip().casefold() or None
+    return key
+
+
+class RateLimiter:
+    def __init__(self, store=None, enabled=True, registry=None):
+        self.store = store or MemoryBucketStore()
+        self.enabled = enabled
+        self._routes = {}  # route -> {kind: (key function, Limit)}
+        self._metrics = None
+        if registry is not None:
+            self._metrics = {
+                'requests': registry.counter('rate_limit_requests_total', 'Requests checked by the rate limiter',
+                                             ('route', 'result')),
+                'exhausted': registry.counter('rate_limit_exhausted_total',
+                                              'Rejections per route and key kind whose bucket was empty',
+                                              ('route', 'key')),
+                'rate': registry.gauge('rate_limit_tokens_per_second', 'Configured refill rate',
+                                       ('route', 'key')),
+                'burst': registry.gauge('rate_limit_burst', 'Configured bucket size', ('route', 'key')),
+            }
+            registry.gauge('rate_limit_buckets', 'Buckets held by the rate limit store',
+                           function=lambda: len(self.store))
+
+    def limits(self, route):
+        return {kind: limit for kind, (_, limit) in self._routes.get(route, {}).items()}
+
+    def check(self, route):
+        """Seconds the current request must wait, 0 if it may proceed (and took its tokens)"""
+        if not self.enabled:
+            return 0.0
+        keys = {}
+        for kind, (key_function, limit) in self._routes[route].items():
+            value = key_function()
+            if value is not None:
+                keys[f'{route}:{kind}:{value}'] = (kind, limit)
+        if not keys:
+            return 0.0
+        empty = self.store.take({key: limit for key, (_, limit) in keys.items()})
+        if self._metrics is not None:
+            self._metrics['requests'].inc(route=route, result='rejected' if empty else 'allowed')
+            for key in empty:
+                self._metrics['exhausted'].inc(route=route, key=keys[key][0])
+        return max(empty.values(), default=0.0)
+
+    def configure(self, route, **kinds):
+        """Set a route's limits per key kind, each given as ``(key function, Limit or None)``"""
+        self._routes[route] = {kind: spec for kind, spec in kinds.items() if spec[1] is not None}
+        if self._metrics is not None:
+            for kind, (_, limit) in self._routes[route].items():
+                self._metrics['rate'].set(limit.rate, route=route, key=kind)
+                self._metrics['burst'].set(limit.burst, route=route, key=kind)
+
+    def limited(self, route, **kinds):
+        """Decorator: limit a view as in ``configure``"""
+        self.configure(route, **kinds)
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                retry_after = self.check(route) if self._routes[route] else 0.0
+                if retry_after:
+                    response = jsonify({'error': 'Too many messages, please slow down'})
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response, 429
+                return view(*args, **kwargs)
+            return wrapper
+        return decorator
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Full-text index over messages and customers: FTS5 on SQLite, tsvector on
+PostgreSQL.
+
+Two standalone tables mirror the searchable fields:
+
+- ``message_search`` (rowid = messages.id): message content plus the owning
+  customer's name, email and phone, so one MATCH covers everything the agent
+  search box used to LIKE-scan.
+- ``customer_search`` (rowid = customers.id): customer name, email and phone.
+
+On PostgreSQL the same two tables hold one weighted ``tsvector`` per row
+(content weighted above customer details) behind a GIN index, keyed by
+``message_id`` / ``customer_id``. ``backend(session)`` returns the
+implementation for a connection; the endpoints build their queries from it.
+
+Rows are added by the write paths (``index_messages`` / ``index_customers``)
+inside the same transaction as the insert. ``rebuild`` repopulates both
+tables from scratch for existing databases:
+
+    python3 search_index.py --rebuild
+"""
+
+import argparse
+import html
+import re
+
+from sqlalchemy import select, text, func, literal_column, MetaData, Table, Column, Index, Integer, Text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from database import DATABASE_URL, create_database_engine, dialect_name
+
+# Tables are declared on their own MetaData so Base.metadata.create_all never
+# tries to create them as ordinary tables.
+search_metadata = MetaData()
+message_search = Table(
+    'message_search', search_metadata,
+    Column('rowid', Integer, primary_key=True),
+    Column('content', Text),
+    Column('customer_name', Text),
+    Column('customer_email', Text),
+    Column('customer_phone', Text),
+)
+customer_search = Table(
+    'customer_search', search_metadata,
+    Column('rowid', Integer, primary_key=True),
+    Column('name', Text),
+    Column('email', Text),
+    Column('phone', Text),
+)
+
+pg_search_metadata = MetaData()
+pg_message_search = Table(
+    'message_search', pg_search_metadata,
+    Column('message_id', Integer, primary_key=True),
+    Column('document', TSVECTOR, nullable=False),
+    Index('ix_message_search_document', 'document', postgresql_using='gin'),
+)
+pg_customer_search = Table(
+    'customer_search', pg_search_metadata,
+    Column('customer_id', Integer, primary_key=True),
+    Column('document', TSVECTOR, nullable=False),
+    Index('ix_customer_search_document', 'document', postgresql_using='gin'),
+)
+
+# prefix='2 3' keeps short type-ahead prefixes from scanning the whole term list
+CREATE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS message_search USING fts5("
+    "content, customer_name, customer_email, customer_phone, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5("
+    "name, email, phone, tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+]
+
+MESSAGE_ROWS_SQL = (
+    "INSERT INTO message_search (rowid, content, customer_name, customer_email, customer_phone) "
+    "SELECT m.id, m.content, c.name, c.email, c.phone "
+    "FROM messages m LEFT JOIN customers c ON c.id = m.customer_id"
+)
+CUSTOMER_ROWS_SQL = (
+    "INSERT INTO customer_search (rowid, name, email, phone) "
+    "SELECT id, name, email, phone FROM customers"
+)
+
+# 'simple' lowercases without stemming, like unicode61. Email and phone
+# punctuation is blanked so their parts are separate words, as in FTS5.
+_PG_CUSTOMER_TEXT = (
+    "concat_ws(' ', c.name, translate(c.email, '@.', '  '), translate(c.phone, '-+().', '     '))"
+)
+PG_MESSAGE_ROWS_SQL = (
+    "INSERT INTO message_search (message_id, document) "
+    "SELECT m.id, setweight(to_tsvector('simple', coalesce(m.content, '')), 'A') || "
+    f"setweight(to_tsvector('simple', {_PG_CUSTOMER_TEXT}), 'B') "
+    "FROM messages m LEFT JOIN customers c ON c.id = m.customer_id"
+)
+PG_CUSTOMER_ROWS_SQL = (
+    "INSERT INTO customer_search (customer_id, document) "
+    f"SELECT c.id, to_tsvector('simple', {_PG_CUSTOMER_TEXT}) FROM customers c"
+)
+
+# The database marks matches with control characters, not HTML: the excerpt is
+# customer text, so ``highlight`` escapes it before the markers become <mark>.
+SNIPPET_OPEN = '\x02'
+SNIPPET_CLOSE = '\x03'
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_PG_TOKEN_RE = re.compile(r'[^\W_]+', re.UNICODE)
+
+
+def highlight(snippet):
+    """HTML for a ``message_snippet`` value: the text escaped, the matches in <mark>"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+
+def _id_clause(ids):
+    return ','.join(str(int(i)) for i in ids)
+
+
+def build_match_query(user_query):
+    """Turn free text from the search box into an FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term and all terms must match, so
+    ``"jane lo"`` finds Jane's messages mentioning loans while she types.
+    Returns None when the input contains no searchable words.
+    """
+    tokens = _TOKEN_RE.findall(user_query or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def build_tsquery(user_query):
+    """PostgreSQL counterpart of ``build_match_query`` (``to_tsquery`` syntax)"""
+    tokens = _PG_TOKEN_RE.findall(user_query or '')
+    if not tokens:
+        return None
+    return ' & '.join(f'{token}:*' for token in tokens)
+
+
+def _match(table, match_query):
+    return literal_column(table.name).op('MATCH')(match_query)
+
+
+class FTS5Search:
+    message_table, message_key = message_search, message_search.c.rowid
+    customer_table, customer_key = customer_search, customer_search.c.rowid
+
+    def create_tables(self, conn):
+        for statement in CREATE_STATEMENTS:
+            conn.execute(text(statement))
+
+    def index_messages(self, session, ids):
+        session.execute(text(f"DELETE FROM message_search WHERE rowid IN ({ids})"))
+        session.execute(text(f"{MESSAGE_ROWS_SQL} WHERE m.id IN ({ids})"))
+
+    def index_customers(self, session, ids):
+        session.execute(text(f"DELETE FROM customer_search WHERE rowid IN ({ids})"))
+        session.execute(text(f"{CUSTOMER_ROWS_SQL} WHERE id IN ({ids})"))
+
+    def populate(self, conn):
+        conn.execute(text("DELETE FROM message_search"))
+        conn.execute(text("DELETE FROM customer_search"))
+        conn.execute(text(MESSAGE_ROWS_SQL))
+        conn.execute(text(CUSTOMER_ROWS_SQL))
+        conn.execute(text("INSERT INTO message_search (message_search) VALUES ('optimize')"))
+        conn.execute(text("INSERT INTO customer_search (customer_search) VALUES ('optimize')"))
+
+    match_query = staticmethod(build_match_query)
+
+    def message_match(self, match_query):
+        return _match(message_search, match_query)
+
+    def customer_match(self, match_query):
+        return _match(customer_search, match_query)
+
+    def message_order(self, match_query):
+        """bm25 score for message_search (lower is better)"""
+        return func.bm25(literal_column(message_search.name))
+
+    def customer_order(self, match_query):
+        return func.bm25(literal_column(customer_search.name))
+
+    def message_snippet(self, match_query, content, tokens=12):
+        """Excerpt of the best-matching part of the message content, matches between the SNIPPET markers"""
+        return func.snippet(literal_column(message_search.name), 0, SNIPPET_OPEN, SNIPPET_CLOSE, '…', tokens)
+
+    def matching_message_ids(self, match_query):
+        """Subquery of message ids matching ``match_query`` (for IN filters)"""
+        return select(self.message_key).where(self.message_match(match_query))
+
+
+class PostgresSearch(FTS5Search):
+    message_table, message_key = pg_message_search, pg_message_search.c.message_id
+    customer_table, customer_key = pg_customer_search, pg_customer_search.c.customer_id
+
+    def create_tables(self, conn):
+        pg_search_metadata.create_all(conn)
+
+    def index_messages(self, session, ids):
+        session.execute(text(f"DELETE FROM message_search WHERE message_id IN ({ids})"))
+        session.execute(text(f"{PG_MESSAGE_ROWS_SQL} WHERE m.id IN ({ids})"))
+
+    def index_customers(self, session, ids):
+        session.execute(text(f"DELETE FROM customer_search WHERE customer_id IN ({ids})"))
+        session.execute(text(f"{PG_CUSTOMER_ROWS_SQL} WHERE c.id IN ({ids})"))
+
+    def populate(self, conn):
+        conn.execute(text("TRUNCATE message_search, customer_search"))
+        conn.execute(text(PG_MESSAGE_ROWS_SQL))
+        conn.execute(text(PG_CUSTOMER_ROWS_SQL))
+        conn.execute(text("ANALYZE message_search"))
+        conn.execute(text("ANALYZE customer_search"))
+
+    match_query = staticmethod(build_tsquery)
+
+    @staticmethod
+    def _tsquery(match_query):
+        return func.to_tsquery('simple', match_query)
+
+    def message_match(self, match_query):
+        return pg_message_search.c.document.op('@@')(self._tsquery(match_query))
+
+    def customer_match(self, match_query):
+        return pg_customer_search.c.document.op('@@')(self._tsquery(match_query))
+
+    def message_order(self, match_query):
+        return func.ts_rank(pg_message_search.c.document, self._tsquery(match_query)).desc()
+
+    def customer_order(self, match_query):
+        return func.ts_rank(pg_customer_search.c.document, self._tsquery(match_query)).desc()
+
+    def message_snippet(self, match_query, content, tokens=12):
+        options = (f'StartSel="{SNIPPET_OPEN}", StopSel="{SNIPPET_CLOSE}", '
+                   f'MaxWords={tokens}, MinWords={min(tokens, 5)}')
+        return func.ts_headline('simple', content, self._tsquery(match_query), options)
+
+
+_BACKENDS = {'sqlite': FTS5Search(), 'postgresql': PostgresSearch()}
+
+
+def backend(bind):
+    """Search implementation for an engine, connection or session"""
+    name = dialect_name(bind)
+    if name not in _BACKENDS:
+        raise ValueError(f"Full-text search is not supported on {name}")
+    return _BACKENDS[name]
+
+
+def create_tables(conn):
+    backend(conn).create_tables(conn)
+
+
+def create_search_tables(bind):
+    """Create the search tables if they do not exist yet"""
+    with bind.begin() as conn:
+        create_tables(conn)
+
+
+def index_messages(session, message_ids):
+    """Add (or refresh) the search rows for the given message ids.
+
+    Runs on the caller's session so the index update commits or rolls back
+    together with the messages themselves.
+    """
+    if message_ids:
+        backend(session).index_messages(session, _id_clause(message_ids))
+
+
+def unindex_messages(session, message_ids):
+    """Drop the search rows of messages moved out of the messages table"""
+    if message_ids:
+        search = backend(session)
+        session.execute(search.message_table.delete().where(search.message_key.in_(list(message_ids))))
+
+
+def index_customers(session, customer_ids):
+    """Add (or refresh) the search rows for the given customer ids"""
+    if customer_ids:
+        backend(session).index_customers(session, _id_clause(customer_ids))
+
+
+def populate(conn):
+    """Replace the contents of both search tables from messages/customers"""
+    backend(conn).populate(conn)
+
+
+def rebuild(bind):
+    """Create (if needed) and repopulate both search tables in one transaction"""
+    with bind.begin() as conn:
+        create_tables(conn)
+        populate(conn)
+        messages = conn.execute(text("SELECT COUNT(*) FROM message_search")).scalar()
+        customers = conn.execute(text("SELECT COUNT(*) FROM customer_search")).scalar()
+    return messages, customers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Manage the full-text search index')
+    parser.add_argument('--database-url', default=DATABASE_URL)
+    parser.add_argument('--rebuild', action='store_true', help='repopulate the index from messages/customers')
+    args = parser.parse_args(argv)
+
+    engine = create_database_engine(args.database_url)
+    if args.rebuild:
+        messages, customers = rebuild(engine)
+        print(f"Indexed {messages} messages and {customers} customers")
+    else:
+        create_search_tables(engine)
+        print("Search tables are present (use --rebuild to repopulate)")
+
+
+if __name__ == '__main__':
+    main()
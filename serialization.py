@@ -0,0 +1,92 @@
+"""
+JSON encoding for API responses.
+
+``JSONProvider`` replaces Flask's default provider. It encodes with orjson
+when that is installed (``pip install orjson``) and with the standard
+library otherwise. Either way datetimes are written as ``isoformat()`` text,
+so row builders hand ``Row`` values (datetimes included) straight to
+``jsonify`` instead of formatting every field themselves.
+
+``stream_rows`` serves a large query result from a generator: the usual JSON
+array written in chunks, or NDJSON (one object per line) when the client
+sends ``Accept: application/x-ndjson``. Rows are fetched ``STREAM_BATCH`` at
+a time, so neither the rows nor the encoded body are ever held in full.
+"""
+
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response
+from flask.json.provider import JSONProvider as BaseJSONProvider
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder produces the same JSON, only slower
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson')
+STREAM_BATCH = 500
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps(obj):
+    """Encode ``obj`` to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, default=_default, separators=(',', ':')).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class JSONProvider(BaseJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=JSON_MIMETYPE)
+
+
+def wants_ndjson(request):
+    """Whether the Accept header prefers NDJSON over JSON (JSON wins ties and */*)"""
+    best = request.accept_mimetypes.best_match((JSON_MIMETYPE,) + NDJSON_MIMETYPES, default=JSON_MIMETYPE)
+    return best in NDJSON_MIMETYPES
+
+
+def stream_rows(session_factory, statement, to_dict, ndjson=False, batch=None):
+    """Response that runs ``statement`` in its own session while the body is sent"""
+    def generate():
+        session = session_factory()
+        try:
+            result = session.execute(statement.execution_options(yield_per=batch or STREAM_BATCH))
+            separator = b''
+            if not ndjson:
+                yield b'['
+            for rows in result.partitions():
+                encoded = [dumps(to_dict(row)) for row in rows]
+                if ndjson:
+                    yield b'\n'.join(encoded) + b'\n'
+                else:
+                    yield separator + b','.join(encoded)
+                    separator = b','
+            if not ndjson:
+                yield b']'
+        finally:
+            session.close()
+    return Response(generate(), mimetype=NDJSON_MIMETYPES[0] if ndjson else JSON_MIMETYPE)
@@ -0,0 +1,106 @@
+"""
+Message-queue configuration for running several Socket.IO server processes.
+
+Flask-SocketIO only delivers an emit to clients connected to the emitting
+process. With a ``message_queue`` every process publishes its emits to a
+shared channel and relays what the others publish, so an event raised by a
+request on worker A reaches agents connected to worker B.
+
+``SOCKETIO_MESSAGE_QUEUE`` selects the backend:
+
+- unset: single process, no queue (the default);
+- ``redis://...``, ``kafka://...``, ``zmq+tcp://...`` or any kombu URL:
+  handed to Flask-SocketIO as ``message_queue``;
+- ``sqlite-queue:///path/to/queue.db``: the bundled :class:`SQLiteQueueManager`,
+  a polling queue in a local SQLite file for tests and single-host setups
+  without a broker.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import socketio
+
+SQLITE_QUEUE_SCHEME = 'sqlite-queue://'
+
+
+class SQLiteQueueManager(socketio.PubSubManager):
+    """Pub/sub client manager backed by an append-only table in a SQLite file.
+
+    Publishing inserts a row; each process polls for rows newer than the last
+    one it has seen. Rows older than ``retention`` seconds are pruned by the
+    publishers. Every process on the host must point at the same file.
+    """
+    name = 'sqlite'
+
+    def __init__(self, url='sqlite-queue:///socketio_queue.db', channel='flask-socketio',
+                 write_only=False, logger=None, json=None, poll_interval=0.02, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        # Same convention as SQLAlchemy: sqlite-queue:///relative.db, sqlite-queue:////abs/path.db
+        self.path = url[len(SQLITE_QUEUE_SCHEME) + 1:] if url.startswith(SQLITE_QUEUE_SCHEME) else url
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._publishes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS socketio_queue ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _sleep(self, seconds):
+        if self.server is not None:
+            self.server.sleep(seconds)
+        else:
+            time.sleep(seconds)
+
+    def _publish(self, data):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            "INSERT INTO socketio_queue (channel, payload, created_at) VALUES (?, ?, ?)",
+            (self.channel, self.json.dumps(data), now)
+        )
+        self._publishes += 1
+        if self._publishes % 100 == 0:
+            conn.execute("DELETE FROM socketio_queue WHERE created_at < ?", (now - self.retention,))
+
+    def _listen(self):
+        conn = self._connection()
+        # Only relay messages published after this process started listening
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_queue").fetchone()[0]
+        while True:
+            rows = conn.execute(
+                "SELECT id, payload FROM socketio_queue WHERE id > ? AND channel = ? ORDER BY id",
+                (last_id, self.channel)
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+            if not rows:
+                self._sleep(self.poll_interval)
+
+
+def socketio_options(message_queue=None):
+    """Keyword arguments for ``SocketIO(...)`` for the configured queue URL"""
+    if not message_queue:
+        return {}
+    if message_queue.startswith(SQLITE_QUEUE_SCHEME):
+        return {'client_manager': SQLiteQueueManager(message_queue)}
+    return {'message_queue': message_queue}
+
+
+def configured_queue():
+    return os.environ.get('SOCKETIO_MESSAGE_QUEUE') or None
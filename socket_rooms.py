@@ -0,0 +1,136 @@
+"""
+Socket.IO rooms for targeted broadcasting.
+
+Clients identify themselves in the connect ``auth`` payload and are placed in
+rooms instead of receiving every event:
+
+- agents (``{"role": "agent", "agent_id": 1}``) join ``agent:<id>`` and the
+  ``inbox`` room, or only ``priority:<n>`` rooms when ``tiers`` is given;
+- customers (``{"role": "customer", "customer_id": 5}``) join their own
+  ``customer:<id>`` conversation room;
+- anything else joins no room and receives no change events.
+
+Agents can adjust their rooms with the ``subscribe`` / ``unsubscribe`` socket
+events. Each message event goes to ``inbox``, the message's ``priority:<n>``
+room and the customer's conversation room; Socket.IO delivers it once per
+client even if the client is in several of them. A ``messages_batch`` event
+from the bulk endpoints goes whole to ``inbox`` and the priority rooms it
+touches; each customer room gets a copy holding only that customer's changes.
+
+Rooms are a fan-out optimisation, not access control. The identity is taken
+from the client's word: nothing checks that a socket claiming ``role: agent``
+or a ``customer_id`` is that agent or customer, so any client can receive any
+room's events (as it can read any message over the REST API, which has no
+authentication either). ``may_join`` only keeps subscriptions consistent with
+the claimed identity. Restricting events per user needs the identity to come
+from a server-side session or a signed token first.
+
+``RoomStats`` counts, per room, the events sent and the local deliveries, so
+the fan-out can be monitored via ``GET /api/socket/rooms``. With a message
+queue the counts cover the clients connected to this process only.
+"""
+
+import threading
+
+INBOX_ROOM = 'inbox'
+PRIORITY_TIERS = (0, 1, 2, 3)
+
+
+def agent_room(agent_id):
+    return f'agent:{agent_id}'
+
+
+def priority_room(priority):
+    return f'priority:{priority}'
+
+
+def customer_room(customer_id):
+    return f'customer:{customer_id}'
+
+
+def message_rooms(message, agent_id=None):
+    """Rooms interested in a change to an inbox message dict"""
+    rooms = [INBOX_ROOM, priority_room(message.get('priority') or 0)]
+    if message.get('customer_id') is not None:
+        rooms.append(customer_room(message['customer_id']))
+    if agent_id is not None:
+        rooms.append(agent_room(agent_id))
+    return rooms
+
+
+def batch_rooms(items, agent_id=None):
+    """(agent rooms for a whole batch of change items, {customer room: that customer's items})"""
+    rooms = [INBOX_ROOM]
+    customers = {}
+    for item in items:
+        room = priority_room(item['message'].get('priority') or 0)
+        if room not in rooms:
+            rooms.append(room)
+        if item.get('customer_id') is not None:
+            customers.setdefault(customer_room(item['customer_id']), []).append(item)
+    if agent_id is not None:
+        rooms.append(agent_room(agent_id))
+    return rooms, customers
+
+
+def connect_rooms(identity):
+    """Rooms a newly connected client joins"""
+    role = identity.get('role')
+    if role == 'agent':
+        rooms = [agent_room(identity['agent_id'])]
+        tiers = identity.get('tiers')
+        if tiers:
+            rooms.extend(priority_room(tier) for tier in tiers)
+        else:
+            rooms.append(INBOX_ROOM)
+        return rooms
+    if role == 'customer':
+        return [customer_room(identity['customer_id'])]
+    return []
+
+
+def parse_identity(auth):
+    """Normalize the connect auth payload (unverified, see the module docstring); raises ValueError if malformed"""
+    auth = auth or {}
+    role = auth.get('role')
+    if role == 'agent':
+        tiers = [int(tier) for tier in auth.get('tiers') or []]
+        if any(tier not in PRIORITY_TIERS for tier in tiers):
+            raise ValueError('Unknown priority tier')
+        return {'role': 'agent', 'agent_id': int(auth.get('agent_id', 1)), 'tiers': tiers}
+    if role == 'customer':
+        return {'role': 'customer', 'customer_id': int(auth['customer_id'])}
+    return {'role': None}
+
+
+def may_join(identity, room):
+    """Whether a client with ``identity`` may subscribe to ``room``"""
+    role = identity.get('role')
+    if role == 'customer':
+        return room == customer_room(identity['customer_id'])
+    if role != 'agent':
+        return False
+    if room == INBOX_ROOM or room == agent_room(identity['agent_id']):
+        return True
+    kind, _, key = room.partition(':')
+    if kind == 'priority':
+        return key.isdigit() and int(key) in PRIORITY_TIERS
+    return kind == 'customer' and key.isdigit()
+
+
+class RoomStats:
+    """Per-room event and delivery counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}
+
+    def record(self, room, recipients):
+        with self._lock:
+            counts = self._rooms.setdefault(room, {'events': 0, 'deliveries': 0})
+            counts['events'] += 1
+            counts['deliveries'] += recipients
+
+    def snapshot(self):
+        with self._lock:
+            return {room: dict(counts) for room, counts in self._rooms.items()}
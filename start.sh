@@ -17,6 +17,11 @@ source venv/bin/activate
 echo "Installing dependencies..."
 pip3 install -r requirements.txt
 
+# Apply schema migrations
+echo ""
+echo "Applying database migrations..."
+python3 migrations.py
+
 # Import data
 echo ""
 echo "Importing customer messages from Excel files..."
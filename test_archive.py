@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+import app as app_module
+import archive
+import database
+import search_index
+
+
+def send(client, content, email='jane@example.com'):
+    return client.post('/api/customers/send-message', json={'name': 'Jane', 'email': email, 'content': content}).get_json()
+
+
+def age_messages(db, days):
+    age = timedelta(days=days)
+    with db.begin() as conn:
+        rows = conn.execute(text("SELECT id, created_at, replied_at FROM messages")).fetchall()
+        for row in rows:
+            conn.execute(text("UPDATE messages SET created_at = :created, replied_at = :replied WHERE id = :id"), {
+                'id': row.id,
+                'created': as_datetime(row.created_at) - age,
+                'replied': as_datetime(row.replied_at) - age if row.replied_at else None,
+            })
+
+
+def as_datetime(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def test_old_replied_messages_move_to_archive(client, db):
+    answered = send(client, 'Where is my loan statement?')['message_id']
+    client.post(f'/api/messages/{answered}/reply', json={'content': 'Sent to your email'})
+    # Bob's thread is still open, so his old answered question and its reply stay hot
+    bob_answered = send(client, 'Is my card blocked?', 'bob@example.com')['message_id']
+    client.post(f'/api/messages/{bob_answered}/reply', json={'content': 'It is active again'})
+    still_open = send(client, 'Can I change my due date?', 'bob@example.com')['message_id']
+    age_messages(db, 100)
+
+    result = archive.archive_old(db, timedelta(days=30), batch_size=1)
+    assert (result['messages'], result['batches'], result['customers']) == (2, 2, 1)
+    with db.connect() as conn:
+        assert {row[0] for row in conn.execute(text("SELECT id FROM messages WHERE direction = 'incoming'"))} == \
+            {bob_answered, still_open}
+        assert conn.execute(text("SELECT COUNT(*) FROM messages WHERE direction = 'outgoing'")).scalar() == 1
+        assert answered not in set(conn.execute(search_index.backend(conn).matching_message_ids(
+            search_index.backend(conn).match_query('statement'))).scalars())
+        stats = archive.sizes(conn)
+    assert (stats['hot_messages'], stats['archived_messages']) == (3, 2)
+    assert all(part['bytes'] > 0 for part in stats['storage'].values())
+
+    recent = send(client, 'Thanks, got the statement')['message_id']
+
+    hot = client.get(f'/api/messages/{recent}').get_json()
+    assert [m['content'] for m in hot['conversation']] == ['Thanks, got the statement']
+    full = client.get(f'/api/messages/{recent}?include_archived=1&limit=2').get_json()
+    assert [m['content'] for m in full['conversation']] == ['Sent to your email', 'Thanks, got the statement']
+    older = client.get(f"/api/messages/{recent}?include_archived=1&before={full['conversation_cursor']}").get_json()
+    assert [m['content'] for m in older['conversation']] == ['Where is my loan statement?']
+
+    assert client.get(f'/api/messages/{answered}').status_code == 404
+    assert client.get(f'/api/messages/{answered}?include_archived=1').get_json()['message']['id'] == answered
+
+    found = client.get('/api/search?q=statement').get_json()['messages']
+    assert [m['id'] for m in found] == [recent]
+    found = client.get('/api/search?q=LOAN statement&include_archived=1').get_json()['messages']
+    assert [(m['id'], m.get('archived', False)) for m in found] == [(answered, True)]
+
+    # Jane's thread is open again now; nothing else is old enough or closed
+    assert archive.archive_old(db, timedelta(days=30))['messages'] == 0
+    assert archive.compact(db, min_free_ratio=0.0) is not None
+
+
+def test_message_arriving_mid_batch_keeps_the_thread_hot(client, db):
+    answered = send(client, 'Where is my loan statement?')['message_id']
+    client.post(f'/api/messages/{answered}/reply', json={'content': 'Sent to your email'})
+    age_messages(db, 100)
+    with db.connect() as conn:
+        rows = conn.execute(text(archive.SELECT_BATCH_SQL), {
+            'after': 0, 'cutoff': datetime.utcnow() - timedelta(days=30), 'limit': 10
+        }).fetchall()
+    assert len(rows) == 2
+
+    reopened = send(client, 'One more question')['message_id']  # between selecting and moving the batch
+    assert archive.archive_batch(db, rows) == 0
+    with db.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM messages")).scalar() == 3
+        assert conn.execute(text("SELECT COUNT(*) FROM archived_messages")).scalar() == 0
+    conversation = client.get(f'/api/messages/{reopened}').get_json()['conversation']
+    assert [m['content'] for m in conversation][:2] == ['Where is my loan statement?', 'Sent to your email']
+
+
+def test_reconciled_stats_keep_archived_replies(client, db):
+    answered = send(client, 'Where is my loan statement?')['message_id']
+    client.post(f'/api/messages/{answered}/reply', json={'content': 'Sent to your email'})
+    age_messages(db, 100)
+    assert archive.archive_old(db, timedelta(days=30))['messages'] == 2
+    with db.begin() as conn:
+        replies, seconds, count = archive.archived_totals(conn)
+        assert (replies, count) == ({1: 1}, 1) and seconds >= 0
+        # Totals of an archive written before archive_totals existed are counted once on start-up
+        conn.execute(archive.archive_totals.delete())
+    archive.create_tables(db)
+    archive.create_tables(db)
+    with db.connect() as conn:
+        assert archive.archived_totals(conn)[0::2] == ({1: 1}, 1)
+
+    session = app_module.Session()
+    try:
+        app_module.reconcile_inbox_stats(session)
+    finally:
+        session.close()
+    stats = app_module.inbox_stats.snapshot()
+    assert stats['messages']['total'] == 0  # the inbox counts hot messages only
+    assert stats['replies']['by_agent'] == {'1': 1}
+    assert stats['first_response']['count'] == 1 and stats['first_response']['average_seconds'] is not None
+
+
+def test_archive_can_live_in_an_attached_sqlite_file(tmp_path):
+    engine = database.create_database_engine(
+        f"sqlite:///{tmp_path / 'main.db'}", archive_path=str(tmp_path / 'archive.db')
+    )
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, customer_id INTEGER, content TEXT, "
+                          "direction TEXT, agent_id INTEGER, agent_name TEXT, status TEXT, priority INTEGER, "
+                          "created_at DATETIME, replied_at DATETIME, repeat_count INTEGER DEFAULT 0)"))
+        conn.execute(text("INSERT INTO messages (customer_id, content, direction, status, created_at) "
+                          "VALUES (NULL, 'old reply', 'outgoing', 'sent', '2020-01-01 00:00:00')"))
+    search_index.create_search_tables(engine)
+    archive.create_tables(engine)
+    archive.create_tables(engine)  # idempotent
+
+    assert archive.archive_old(engine, timedelta(days=30))['messages'] == 1
+    with engine.connect() as conn:
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM archive.sqlite_master WHERE type = 'table'"))}
+        assert 'archived_messages' in tables
+        assert conn.execute(text("SELECT COUNT(*) FROM main.sqlite_master WHERE name = 'archived_messages'")).scalar() == 0
+        assert set(archive.sizes(conn)['storage']) == {'main', 'archive'}
+    engine.dispose()
@@ -0,0 +1,103 @@
+from app import app, socketio, changes, Session, Agent, CannedMessage
+
+
+def send(client, content, email):
+    name = email.split('@')[0].title()
+    return client.post('/api/customers/send-message', json={'name': f'{name} Doe', 'email': email, 'content': content}).get_json()
+
+
+def received(socket_client):
+    return [(event['name'], event['args'][0]) for event in socket_client.get_received()]
+
+
+def test_bulk_reply_answers_many_messages_in_one_batch(client):
+    jane = send(client, 'hello there', 'jane@example.com')
+    bob = send(client, 'is anyone around', 'bob@example.com')
+    claimed = send(client, 'urgent question about fees', 'ann@example.com')
+    session = Session()
+    session.add_all([
+        CannedMessage(title='Greeting', content='Hi {first_name}, we are on it.', category='general'),
+        Agent(id=2, name='Sam', email='sam@example.com'),
+    ])
+    session.commit()
+    canned_id = session.query(CannedMessage.id).scalar()
+    session.close()
+    assert client.post('/api/queue/claim', json={'agent_id': 2}).get_json()['message']['id'] == claimed['message_id']
+
+    agent = socketio.test_client(app, flask_test_client=client, auth={'role': 'agent', 'agent_id': 1})
+    customer = socketio.test_client(app, flask_test_client=client, auth={'role': 'customer', 'customer_id': jane['customer_id']})
+    agent.get_received(), customer.get_received()
+    start = changes.seq
+
+    response = client.post('/api/messages/bulk-reply', json={
+        'message_ids': [jane['message_id'], bob['message_id'], claimed['message_id'], 999999, jane['message_id']],
+        'canned_id': canned_id,
+    }).get_json()
+    assert (response['applied'], response['failed']) == (2, 2)
+    assert [(r['message_id'], r['success'], r.get('status')) for r in response['results']] == [
+        (jane['message_id'], True, None), (bob['message_id'], True, None),
+        (claimed['message_id'], False, 409), (999999, False, 404),
+    ]
+
+    events = received(agent)
+    assert [(name, delta['op'], delta['seq']) for name, delta in events] == [('messages_batch', 'batch', start + 1)]
+    items = events[0][1]['items']
+    assert [item['reply']['content'] for item in items] == ['Hi Jane, we are on it.', 'Hi Bob, we are on it.']
+    assert all(item['message']['status'] == 'replied' for item in items)
+    (name, delta), = received(customer)
+    assert [item['customer_id'] for item in delta['items']] == [jane['customer_id']]
+    assert delta['seq'] == start + 1
+
+    assert client.get('/api/stats').get_json()['messages']['by_status'] == {'replied': 2, 'unread': 1}
+    threads = client.get('/api/conversations?status=open').get_json()['conversations']
+    assert [t['customer_id'] for t in threads] == [claimed['customer_id']]
+    found = client.get('/api/search?q=on it').get_json()['messages']
+    assert len(found) == 2
+    agent.disconnect(), customer.disconnect()
+
+
+def test_bulk_status_marks_read_and_unread(client):
+    ids = [send(client, f'message {i}', f'c{i}@example.com')['message_id'] for i in range(3)]
+    client.post(f'/api/messages/{ids[0]}/reply', json={'content': 'done'})
+    start = changes.seq
+
+    response = client.post('/api/messages/bulk-status', json={'message_ids': ids, 'status': 'read'}).get_json()
+    assert [r['changed'] for r in response['results']] == [False, True, True]  # replied stays replied
+    assert client.get('/api/stats').get_json()['messages']['unread'] == 0
+
+    response = client.post('/api/messages/bulk-status', json={'message_ids': ids[1:2], 'status': 'unread'}).get_json()
+    assert response['results'] == [{'message_id': ids[1], 'success': True, 'changed': True}]
+    assert client.get('/api/stats').get_json()['messages']['unread'] == 1
+    assert client.post('/api/messages/bulk-status', json={'message_ids': ids, 'status': 'read'}).get_json()['applied'] == 3
+
+    deltas = client.get(f'/api/changes?since={start}&epoch={changes.epoch}').get_json()['changes']
+    assert [(d['event'], len(d['items'])) for d in deltas] == [('messages_batch', 2), ('messages_batch', 1), ('messages_batch', 1)]
+
+
+def test_bulk_requests_are_validated(client):
+    assert client.post('/api/messages/bulk-status', json={'message_ids': []}).status_code == 400
+    assert client.post('/api/messages/bulk-status', json={'message_ids': ['x']}).status_code == 400
+    assert client.post('/api/messages/bulk-status', json={'message_ids': [1], 'status': 'replied'}).status_code == 400
+    assert client.post('/api/messages/bulk-reply', json={'message_ids': [1]}).status_code == 400
+    assert client.post('/api/messages/bulk-reply', json={'message_ids': [1], 'canned_id': 12345}).status_code == 404
+    assert client.post('/api/messages/bulk-reply', json={'message_ids': list(range(1000)), 'content': 'x'}).status_code == 400
+
+
+def test_bulk_reply_skips_unfilled_placeholders_and_keeps_reply_order(client):
+    first = send(client, 'where is my loan', 'jane@example.com')
+    second = send(client, 'also, my card is blocked', 'jane@example.com')
+    session = Session()
+    session.add(CannedMessage(title='Tier', content='Hi {first_name}, as a {account_type} member...', category='general'))
+    session.commit()
+    canned_id = session.query(CannedMessage.id).scalar()
+    session.close()
+    ids = [first['message_id'], second['message_id']]
+
+    response = client.post('/api/messages/bulk-reply', json={'message_ids': ids, 'canned_id': canned_id}).get_json()
+    assert response['applied'] == 0
+    assert {(r['status'], r['error']) for r in response['results']} == {(422, 'No value for account_type')}
+
+    # Same customer, same content: each reply id is the row inserted for that message
+    response = client.post('/api/messages/bulk-reply', json={'message_ids': ids[::-1], 'content': 'On it'}).get_json()
+    reply_ids = [r['reply_id'] for r in response['results']]
+    assert len(set(reply_ids)) == 2 and reply_ids == sorted(reply_ids)
@@ -0,0 +1,66 @@
+import json
+
+from app import Session, CannedMessage, Customer
+from canned import Template, TypeaheadIndex
+
+
+def add_canned(*rows):
+    session = Session()
+    session.add_all(CannedMessage(title=title, content=content, category=category) for title, content, category in rows)
+    session.commit()
+    session.close()
+
+
+def test_catalog_is_served_with_etag_until_a_create(client):
+    add_canned(('Password Reset', 'Use "Forgot Password".', 'account'))
+    first = client.get('/api/canned-messages')
+    assert [m['title'] for m in first.get_json()] == ['Password Reset']
+    etag = first.headers['ETag']
+
+    assert client.get('/api/canned-messages', headers={'If-None-Match': etag}).status_code == 304
+    stats = client.get('/api/cache/stats').get_json()['canned_messages']
+    assert (stats['loads'], stats['hits']) == (1, 1)
+
+    client.post('/api/canned-messages', json={'title': 'Loan Status', 'content': 'Reviewing it.', 'category': 'loan'})
+    changed = client.get('/api/canned-messages', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+    assert [m['title'] for m in changed.get_json()] == ['Password Reset', 'Loan Status']
+
+
+def test_typeahead_matches_prefixes_and_infixes_by_field():
+    entries = [
+        {'id': 1, 'title': 'Password Reset', 'content': 'Click "Forgot Password".', 'category': 'account'},
+        {'id': 2, 'title': 'Loan Disbursement Timeline', 'content': 'Funds arrive in 1-2 days.', 'category': 'loan'},
+        {'id': 3, 'title': 'General Inquiry', 'content': 'We will reply about your loan soon.', 'category': 'general'},
+        {'id': 4, 'title': 'Security', 'content': 'Never share how to bypass checks.', 'category': 'account'},
+    ]
+    index = TypeaheadIndex(entries)
+    assert index.search('loan') == [1, 2]          # title before content
+    assert index.search('disb tim') == [1]
+    assert index.search('pass') == [0, 3]          # word prefix before a match inside "bypass"
+    assert index.search('acc') == [0, 3]
+    assert index.search('loan reset') == []
+    assert index.search('') == []
+
+
+def test_templates_render_customer_profile(client):
+    template = Template('Hi {first_name}, your {account_type} account. {unknown} {braces')
+    assert template.fields == ('first_name', 'account_type', 'unknown')
+    assert template.render({'first_name': 'Ann', 'account_type': 'premium'}) == \
+        'Hi Ann, your premium account. {unknown} {braces'
+
+    add_canned(('Greeting', 'Hi {first_name} ({account_type})', 'general'))
+    session = Session()
+    customer = Customer(name='Ann Lee', email='ann@example.com', customer_id='C1',
+                        profile_data=json.dumps({'account_type': 'premium'}))
+    session.add(customer)
+    session.commit()
+    customer_id = session.query(Customer.id).scalar()
+    canned_id = session.query(CannedMessage.id).scalar()
+    session.close()
+
+    rendered = client.get(f'/api/canned-messages/{canned_id}/render?customer_id={customer_id}').get_json()
+    assert rendered['content'] == 'Hi Ann (premium)' and rendered['missing'] == []
+    assert client.get(f'/api/canned-messages/{canned_id}/render').get_json()['missing'] == ['first_name', 'account_type']
+    assert client.get(f'/api/canned-messages/{canned_id}/render?customer_id=999').status_code == 404
+    assert client.get('/api/canned-messages/999/render').status_code == 404
@@ -0,0 +1,69 @@
+import pytest
+
+from app import app, socketio, changes
+from change_feed import ChangeFeed, MemoryChangeLog, DatabaseChangeLog
+
+
+@pytest.fixture(params=['memory', 'database'])
+def small_log(request, db):
+    if request.param == 'memory':
+        return MemoryChangeLog(size=3)
+    return DatabaseChangeLog(db, size=3, prune_every=1)
+
+
+def test_since_returns_missing_deltas_or_requests_reset(small_log):
+    emitted = []
+    feed = ChangeFeed(emit=lambda event, delta, to=None: emitted.append((event, delta['seq'])), log=small_log)
+    for i in range(5):
+        feed.publish('new_message', 'insert', message_id=i)
+
+    assert emitted[-1] == ('new_message', 5)
+    assert [d['seq'] for d in feed.since(3)] == [4, 5]
+    assert feed.since(5) == []
+    assert feed.since(1) is None             # older than the retained log
+    assert feed.since(9) is None             # ahead of this server (restart)
+    assert feed.since(4, epoch='other') is None
+
+
+def test_database_log_is_shared_between_processes(db):
+    first, second = DatabaseChangeLog(db), DatabaseChangeLog(db)
+    assert first.epoch == second.epoch
+    first.append({'op': 'insert'})
+    second.append({'op': 'status'})
+    assert first.seq == second.seq == 2
+    assert [d['op'] for d in first.since(0)] == ['insert', 'status']
+
+
+def test_write_paths_publish_versioned_deltas(client):
+    socket_client = socketio.test_client(app, flask_test_client=client, auth={'role': 'agent', 'agent_id': 1})
+    socket_client.get_received()
+    start = changes.seq
+
+    message_id = client.post('/api/customers/send-message', json={
+        'name': 'Jane', 'email': 'jane@example.com', 'content': 'urgent help'
+    }).get_json()['message_id']
+    client.post(f'/api/messages/{message_id}/read')
+    client.post(f'/api/messages/{message_id}/read')  # no change, no delta
+    client.post(f'/api/messages/{message_id}/reply', json={'content': 'On it', 'agent_name': 'Sam'})
+
+    received = [(event['name'], event['args'][0]) for event in socket_client.get_received()]
+    assert [name for name, _ in received] == ['new_message', 'message_status', 'new_reply']
+    assert [delta['seq'] for _, delta in received] == [start + 1, start + 2, start + 3]
+
+    inserted, status, reply = (delta for _, delta in received)
+    assert inserted['op'] == 'insert'
+    assert inserted['message']['priority'] == 3
+    assert inserted['message']['customer_name'] == 'Jane'
+    assert status['op'] == 'status' and status['message']['status'] == 'read'
+    assert reply['op'] == 'update'
+    assert reply['message']['status'] == 'replied'
+    assert reply['reply']['content'] == 'On it' and reply['reply']['direction'] == 'outgoing'
+
+    resync = client.get(f'/api/changes?since={start + 1}&epoch={changes.epoch}').get_json()
+    assert resync['reset'] is False
+    assert [d['seq'] for d in resync['changes']] == [start + 2, start + 3]
+    assert client.get('/api/changes?since=0&epoch=stale').get_json()['reset'] is True
+
+    page = client.get('/api/messages?limit=10').get_json()
+    assert page['seq'] == changes.seq and page['epoch'] == changes.epoch
+    socket_client.disconnect()
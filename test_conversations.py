@@ -0,0 +1,67 @@
+from sqlalchemy import text
+
+import conversations
+
+
+def send(client, email, content, name='Jane'):
+    response = client.post('/api/customers/send-message', json={'name': name, 'email': email, 'content': content})
+    assert response.status_code == 200
+    return response.get_json()['message_id']
+
+
+def thread_rows(db):
+    with db.connect() as conn:
+        return conn.execute(text(
+            "SELECT customer_id, unread_count, open_count, max_priority, message_count, "
+            "last_message_id, last_message_preview, last_message_direction, last_activity "
+            "FROM conversations ORDER BY customer_id"
+        )).fetchall()
+
+
+def test_threads_track_send_read_and_reply(client, db):
+    first = send(client, 'jane@example.com', 'urgent: my loan was denied')
+    second = send(client, 'jane@example.com', 'hello?')
+    send(client, 'bob@example.com', 'how do I change my email', name='Bob')
+
+    data = client.get('/api/conversations').get_json()
+    assert [t['customer_email'] for t in data['conversations']] == ['jane@example.com', 'bob@example.com']
+    jane = data['conversations'][0]
+    assert (jane['unread_count'], jane['open_count'], jane['message_count']) == (2, 2, 2)
+    assert jane['last_message'] == {'id': second, 'preview': 'hello?', 'direction': 'incoming'}
+    assert jane['max_priority'] == 3
+
+    client.post(f'/api/messages/{second}/read')
+    client.post(f'/api/messages/{first}/reply', json={'content': 'Looking into it'})
+    jane = client.get('/api/conversations?priority=3').get_json()['conversations']
+    assert jane == []
+
+    jane = client.get('/api/conversations?status=open').get_json()['conversations'][1]
+    assert (jane['unread_count'], jane['open_count'], jane['message_count']) == (0, 1, 3)
+    assert jane['last_message']['direction'] == 'outgoing'
+    assert jane['max_priority'] < 3
+    assert [t['customer_email'] for t in client.get('/api/conversations?status=unread').get_json()['conversations']] \
+        == ['bob@example.com']
+
+    # A full recompute agrees with the incremental updates
+    incremental = thread_rows(db)
+    with db.begin() as conn:
+        conn.execute(text("DELETE FROM conversations"))
+        conversations.refresh(conn)
+    assert thread_rows(db) == incremental
+
+
+def test_thread_pages_cover_all_customers(client):
+    for i in range(7):
+        send(client, f'customer{i}@example.com', f'question {i}')
+    expected = [t['customer_id'] for t in client.get('/api/conversations?limit=200').get_json()['conversations']]
+    assert len(expected) == 7
+
+    seen, cursor = [], None
+    while True:
+        page = client.get('/api/conversations?limit=3' + (f'&cursor={cursor}' if cursor else '')).get_json()
+        seen.extend(t['customer_id'] for t in page['conversations'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+    assert client.get('/api/conversations?cursor=bad').status_code == 400
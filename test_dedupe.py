@@ -0,0 +1,57 @@
+from sqlalchemy import text
+
+import import_data
+from dedupe import DedupeIndex, Fingerprint
+from test_import_data import write_export
+
+
+def test_index_matches_normalized_and_near_duplicates():
+    index = DedupeIndex()
+    index.load(1, [(10, 'When will my loan be disbursed?'), (11, 'ok')])
+    index.add(2, 20, 'I need to reset my password')
+
+    assert index.find(1, 'when will my loan be disbursed??') == 10
+    assert index.find(1, 'When will my loan be disbursd') == 10
+    assert index.find(1, 'How do I update my phone number on the account') is None
+    assert index.find(1, 'OK!') == 11
+    assert index.find(1, 'okay') is None  # short texts only match exactly
+    assert index.find(2, 'When will my loan be disbursed?') is None  # per customer
+
+    index.discard(10)
+    assert index.find(1, 'When will my loan be disbursed?') is None
+    assert Fingerprint('a  B-c').normalized == 'a b c'
+
+
+def send(client, content, email='jane@example.com'):
+    return client.post('/api/customers/send-message', json={'name': 'Jane', 'email': email, 'content': content}).get_json()
+
+
+def test_resubmissions_collapse_until_replied(client, db):
+    first = send(client, 'When will my loan be disbursed?')
+    again = send(client, 'when will my loan be disbursed??')
+    assert again['duplicate'] is True and again['message_id'] == first['message_id']
+    assert send(client, 'when will my loan be disbursed', email='bob@example.com')['duplicate'] is False
+
+    inbox = client.get('/api/messages?limit=10').get_json()['messages']
+    assert len(inbox) == 2
+    assert {m['customer_email']: m['repeat_count'] for m in inbox} == {'jane@example.com': 1, 'bob@example.com': 0}
+
+    client.post(f"/api/messages/{first['message_id']}/reply", json={'content': 'Tomorrow'})
+    later = send(client, 'When will my loan be disbursed?')
+    assert later['duplicate'] is False and later['message_id'] != first['message_id']
+    with db.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM messages WHERE direction = 'incoming'")).scalar() == 3
+
+
+def test_import_collapses_near_duplicates(db, tmp_path):
+    write_export(tmp_path, [
+        ['C1', 'Ann', 'ann@example.com', 'When will my loan be disbursed?'],
+        ['C1', 'Ann', 'ann@example.com', 'when will my loan be disbursed!!'],
+        ['C1', 'Ann', 'ann@example.com', 'when will my loan be disbursd'],
+        ['C1', 'Ann', 'ann@example.com', 'How do I update my phone number?'],
+    ])
+
+    assert import_data.import_excel_files_batched(str(tmp_path), chunk_size=2, bind=db) == 2
+    with db.connect() as conn:
+        repeats = dict(conn.execute(text("SELECT content, repeat_count FROM messages")).fetchall())
+    assert repeats == {'When will my loan be disbursed?': 2, 'How do I update my phone number?': 0}
@@ -0,0 +1,117 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+import import_data
+import search_index
+
+
+def write_export(directory, rows, name='GeneralistRails_Project_MessageData.xlsx'):
+    pd.DataFrame(rows, columns=['Customer ID', 'Name', 'Email', 'Message Body']).to_excel(
+        directory / name, index=False
+    )
+
+
+def counts(engine):
+    with engine.connect() as conn:
+        return tuple(
+            conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            for table in ('customers', 'messages', 'message_search')
+        )
+
+
+def test_batched_import_dedupes_and_resolves_customers(db, tmp_path):
+    write_export(tmp_path, [
+        ['C1', 'Ann', 'ann@example.com', 'urgent: loan approval?'],
+        ['C1', 'Ann', 'ann@example.com', 'urgent: loan approval?'],   # exact duplicate
+        ['C2', 'Bob', 'bob@example.com', 'how to change my email'],
+        [None, 'Ann again', 'ann@example.com', 'status update please'],  # same customer by email
+        ['C3', 'Cy', 'cy@example.com', None],                          # no message
+    ])
+
+    assert import_data.import_excel_files_batched(str(tmp_path), chunk_size=2, bind=db) == 3
+    assert counts(db) == (2, 3, 3)
+    with db.connect() as conn:
+        priorities = dict(conn.execute(text("SELECT content, priority FROM messages")).fetchall())
+    assert priorities == {'urgent: loan approval?': 3, 'how to change my email': 1, 'status update please': 2}
+
+    # Second run is a no-op
+    assert import_data.import_excel_files_batched(str(tmp_path), bind=db) == 0
+    assert counts(db) == (2, 3, 3)
+
+
+def test_batched_import_merges_new_refs_sharing_an_email(db, tmp_path):
+    write_export(tmp_path, [
+        ['A', 'Ann', 'x@example.com', 'first question'],
+        ['B', 'Ann B', 'x@example.com', 'second question'],
+        ['C', 'Cy', 'y@example.com', 'third question'],
+        ['B', 'Ann B', 'x@example.com', 'fourth question'],
+    ])
+
+    assert import_data.import_excel_files_batched(str(tmp_path), chunk_size=10, bind=db) == 4
+    with db.connect() as conn:
+        owners = dict(conn.execute(text(
+            "SELECT m.content, c.email FROM messages m JOIN customers c ON c.id = m.customer_id"
+        )).fetchall())
+        assert conn.execute(text("SELECT customer_id, email FROM customers ORDER BY id")).fetchall() == [
+            ('A', 'x@example.com'), ('C', 'y@example.com'),
+        ]
+    assert owners == {'first question': 'x@example.com', 'second question': 'x@example.com',
+                      'third question': 'y@example.com', 'fourth question': 'x@example.com'}
+
+
+def test_batched_import_resumes_after_interruption(db, tmp_path, monkeypatch):
+    write_export(tmp_path, [[f'C{i}', f'Customer {i}', f'c{i}@example.com', f'message {i}'] for i in range(10)])
+    path = str(tmp_path / 'GeneralistRails_Project_MessageData.xlsx')
+    rows = import_data.normalize_sheet(pd.read_excel(path))
+    signature = import_data.file_signature(path)
+
+    real_index = search_index.index_messages
+    calls = []
+
+    def failing_index(conn, ids):
+        calls.append(ids)
+        if len(calls) == 3:
+            raise RuntimeError('killed')
+        real_index(conn, ids)
+
+    monkeypatch.setattr(search_index, 'index_messages', failing_index)
+    with pytest.raises(RuntimeError):
+        import_data.bulk_import_rows(db, 'GeneralistRails_Project_MessageData.xlsx', signature, rows, 10, chunk_size=3)
+    assert counts(db) == (6, 6, 6)  # two chunks committed, the third rolled back
+
+    monkeypatch.setattr(search_index, 'index_messages', real_index)
+    imported = import_data.bulk_import_rows(db, 'GeneralistRails_Project_MessageData.xlsx', signature, rows, 10, chunk_size=3)
+    assert imported == 4
+    assert counts(db) == (10, 10, 10)
+
+
+def snapshot(engine):
+    with engine.connect() as conn:
+        return (
+            conn.execute(text("SELECT id, name, email, customer_id FROM customers ORDER BY id")).fetchall(),
+            conn.execute(text("SELECT id, customer_id, content, priority FROM messages ORDER BY id")).fetchall(),
+        )
+
+
+def test_parallel_import_matches_serial(db, tmp_path):
+    from sqlalchemy import create_engine
+    from models import Base
+
+    exports = tmp_path / 'exports'
+    exports.mkdir()
+    for n in range(4):
+        write_export(exports, [
+            [None, f'Customer {i}', f'c{i}@example.com', f'file {n} message {i % (n + 2)}'] for i in range(25)
+        ], name=f'GeneralistRails_Project_MessageData({n}).xlsx')
+
+    parallel = create_engine(f"sqlite:///{tmp_path / 'parallel.db'}")
+    Base.metadata.create_all(parallel)
+    search_index.create_search_tables(parallel)
+
+    serial_count = import_data.import_excel_files_batched(str(exports), chunk_size=10, bind=db)
+    parallel_count = import_data.import_excel_files_batched(str(exports), chunk_size=10, bind=parallel, workers=3)
+
+    assert serial_count == parallel_count
+    assert snapshot(db) == snapshot(parallel)
+    parallel.dispose()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import app as app_module
+from inbox_stats import InboxStats
+
+
+def send(client, content, email='jane@example.com'):
+    response = client.post('/api/customers/send-message', json={'name': 'Jane', 'email': email, 'content': content})
+    return response.get_json()['message_id']
+
+
+def test_counters_follow_writes_and_match_reconcile(client):
+    urgent = send(client, 'urgent: my loan approval is stuck')
+    other = send(client, 'just saying hello', email='bob@example.com')
+    first = client.get('/api/stats').get_json()
+    assert first['messages']['unread'] == 2
+    assert first['messages']['unread_high_priority'] == 1
+
+    send(client, 'another hello', email='bob@example.com')
+    client.post(f'/api/messages/{other}/read')
+    client.post(f'/api/messages/{urgent}/reply', json={'content': 'On it', 'agent_id': 7})
+    client.post(f'/api/messages/{urgent}/reply', json={'content': 'Done', 'agent_id': 7})
+
+    stats = client.get('/api/stats').get_json()
+    assert stats['reconciled_at'] == first['reconciled_at']  # served from the counters
+    assert stats['messages']['by_status'] == {'unread': 1, 'read': 1, 'replied': 1}
+    assert stats['messages']['high_priority'] == 1
+    assert stats['messages']['unread_high_priority'] == 0
+    assert stats['replies'] == {'total': 2, 'by_agent': {'7': 2}}
+    assert stats['first_response']['count'] == 1
+    assert sum(stats['first_response']['by_tier']['high']) == 1
+
+    app_module.inbox_stats.reconcile_interval = 0
+    reconciled = client.get('/api/stats').get_json()
+    assert reconciled['reconciled_at'] != first['reconciled_at']
+    assert reconciled['messages'] == stats['messages']
+    assert reconciled['replies'] == stats['replies']
+    assert reconciled['first_response']['by_tier'] == stats['first_response']['by_tier']
+    assert reconciled['first_response']['count'] == 1
+
+
+def test_latency_histogram_window():
+    stats = InboxStats(window=600)
+    now = datetime.utcnow()
+    stats.added(3)
+    stats.added(0)
+    stats.replied(3, 'unread', 1, now - timedelta(hours=2), now - timedelta(minutes=30))
+    stats.replied(0, 'unread', 1, now - timedelta(minutes=3), now)
+
+    snapshot = stats.snapshot(now)
+    assert snapshot['first_response']['by_tier']['high'] == [0] * 7  # replied before the window
+    assert snapshot['first_response']['by_tier']['none'] == [0, 1, 0, 0, 0, 0, 0]
+    assert snapshot['first_response']['count'] == 2
+    assert snapshot['first_response']['average_seconds'] == (90 * 60 + 180) / 2
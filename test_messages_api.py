@@ -0,0 +1,116 @@
+import json
+from datetime import datetime, timedelta
+
+import serialization
+from app import Session, Customer, Message
+
+
+def seed_messages(count, priority=2):
+    session = Session()
+    customer = Customer(name='Jane Doe', email='jane@example.com', customer_id='CUST_TEST')
+    session.add(customer)
+    session.flush()
+    base = datetime(2024, 1, 1)
+    for i in range(count):
+        session.add(Message(
+            customer_id=customer.id,
+            content=f'message {i}',
+            direction='incoming',
+            status='unread',
+            priority=priority if i % 2 else priority + 1,
+            created_at=base + timedelta(minutes=i // 3)  # force created_at ties
+        ))
+    session.commit()
+    session.close()
+
+
+def test_unpaginated_list_is_unchanged(client):
+    seed_messages(5)
+    response = client.get('/api/messages')
+    data = response.get_json()
+    assert isinstance(data, list)
+    assert len(data) == 5
+    assert data[0]['customer_name'] == 'Jane Doe'
+    assert [m['priority'] for m in data] == sorted((m['priority'] for m in data), reverse=True)
+
+
+def test_full_list_streams_json_array_or_ndjson(client, monkeypatch):
+    monkeypatch.setattr(serialization, 'STREAM_BATCH', 2)
+    seed_messages(5)
+    data = client.get('/api/messages').get_json()
+    assert data[0]['created_at'] == datetime(2024, 1, 1, 0, 1).isoformat()
+
+    response = client.get('/api/messages', headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == data
+
+    assert client.get('/api/messages', headers={'Accept': '*/*'}).get_json() == data
+
+
+def test_keyset_pages_cover_full_ordering(client):
+    seed_messages(23)
+    expected = [m['id'] for m in client.get('/api/messages').get_json()]
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/messages?limit=5' + (f'&cursor={cursor}' if cursor else '')
+        page = client.get(url).get_json()
+        assert len(page['messages']) <= 5
+        seen.extend(m['id'] for m in page['messages'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == expected
+
+
+def test_invalid_cursor_is_rejected(client):
+    response = client.get('/api/messages?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+
+def test_conversation_history_pages_backwards(client):
+    seed_messages(23)
+    first_id = client.get('/api/messages').get_json()[0]['id']
+
+    everything = [m['id'] for m in client.get(f'/api/messages/{first_id}?limit=200').get_json()['conversation']]
+    assert len(everything) == 23
+
+    pages = []
+    url = f'/api/messages/{first_id}?limit=10'
+    while url:
+        data = client.get(url).get_json()
+        pages.insert(0, [m['id'] for m in data['conversation']])
+        cursor = data['conversation_cursor']
+        url = f'/api/messages/{first_id}?limit=10&before={cursor}' if cursor else None
+    assert [len(page) for page in pages] == [3, 10, 10]
+    assert [i for page in pages for i in page] == everything
+
+    assert client.get(f'/api/messages/{first_id}?before=bogus').status_code == 400
+
+
+def test_conversation_cache_is_invalidated_by_replies(client):
+    seed_messages(3)
+    message_id = client.get('/api/messages').get_json()[0]['id']
+
+    before = client.get('/api/cache/stats').get_json()['conversations']
+    first = client.get(f'/api/messages/{message_id}').get_json()
+    assert len(first['conversation']) == 3 and first['conversation_cursor'] is None
+    assert first['customer']['name'] == 'Jane Doe'
+    client.get(f'/api/messages/{message_id}')
+    stats = client.get('/api/cache/stats').get_json()['conversations']
+    assert (stats['hits'] - before['hits'], stats['misses'] - before['misses']) == (1, 1)
+
+    client.post(f'/api/messages/{message_id}/reply', json={'content': 'On it', 'agent_name': 'Sam'})
+    after = client.get(f'/api/messages/{message_id}').get_json()
+    assert after['conversation'][-1]['content'] == 'On it'
+    assert after['message']['status'] == 'replied'
+
+
+def test_send_message_without_an_email(client):
+    first = client.post('/api/customers/send-message', json={'name': 'Anon', 'email': None, 'content': 'hello'})
+    assert first.status_code == 200
+    second = client.post('/api/customers/send-message', json={'name': 'Anon', 'content': 'still there?'})
+    assert second.get_json()['customer_id'] == first.get_json()['customer_id']
@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.engine import Engine
+
+from metrics import RequestMetrics
+
+
+def test_metrics_endpoint_reports_requests_queries_and_emits(client):
+    client.post('/api/customers/send-message', json={'name': 'Jane', 'email': 'jane@example.com', 'content': 'hi'})
+    client.get('/api/messages?limit=10')
+
+    response = client.get('/metrics')
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_request_duration_seconds_bucket{endpoint="get_messages",method="GET",status="200",le="+Inf"}' in body
+    assert 'db_queries_per_request_count{endpoint="customer_send_message"}' in body
+    assert 'http_response_rows_total{endpoint="get_messages"}' in body
+    assert 'socketio_emits_total{event="new_message"}' in body
+    assert 'socketio_connected_clients ' in body
+
+
+def test_slow_and_repeated_queries_are_logged(caplog):
+    app = Flask(__name__)
+    metrics = RequestMetrics(slow_query_ms=0, repeat_threshold=3)
+    metrics.init_app(app)
+    engine = create_engine('sqlite://')
+
+    @app.route('/rows')
+    def rows():
+        with engine.connect() as conn:
+            values = [conn.execute(text('SELECT :n'), {'n': n}).scalar() for n in range(3)]
+        return jsonify(values)
+
+    try:
+        with caplog.at_level(logging.WARNING, logger='metrics'):
+            assert app.test_client().get('/rows').get_json() == [0, 1, 2]
+    finally:
+        event.remove(Engine, 'before_cursor_execute', metrics._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', metrics._after_cursor_execute)
+        event.remove(Engine, 'handle_error', metrics._handle_error)
+
+    assert metrics.repeated_queries.value(endpoint='rows') == 1
+    assert metrics.slow_queries.value(endpoint='rows') >= 3
+    assert metrics.response_rows.value(endpoint='rows') == 3
+    assert any('likely N+1' in record.getMessage() for record in caplog.records)
+    assert 'db_queries_per_request_sum{endpoint="rows"} 3' in metrics.render()
+
+
+def test_failed_statement_does_not_leave_its_start_time_on_the_connection():
+    app = Flask(__name__)
+    metrics = RequestMetrics()
+    metrics.init_app(app)
+    engine = create_engine('sqlite://')
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text('SELECT * FROM missing_table'))
+            assert metrics._started not in conn.info
+            assert conn.execute(text('SELECT 1')).scalar() == 1
+            assert metrics._started not in conn.info
+    finally:
+        event.remove(Engine, 'before_cursor_execute', metrics._before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', metrics._after_cursor_execute)
+        event.remove(Engine, 'handle_error', metrics._handle_error)
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from models import Base
+from migrations import migrate, MigrationError, MIGRATIONS
+
+
+def legacy_engine(tmp_path):
+    """A database created before the model indexes were declared"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(text(f"DROP INDEX {index.name}"))
+    return engine
+
+
+def test_migrate_adds_indexes_and_keeps_data(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO customers (id, name, email) VALUES (1, 'A', 'a@example.com')"))
+        conn.execute(text("INSERT INTO messages (customer_id, content, direction) VALUES (1, 'hi', 'incoming')"))
+
+    assert migrate(engine) == [version for version, _, _ in MIGRATIONS]
+    assert migrate(engine) == []
+
+    inspector = inspect(engine)
+    message_indexes = {ix['name'] for ix in inspector.get_indexes('messages')}
+    assert {'ix_messages_inbox', 'ix_messages_inbox_status', 'ix_messages_customer_created'} <= message_indexes
+    assert any(ix['name'] == 'ux_customers_email' and ix['unique'] for ix in inspector.get_indexes('customers'))
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM messages")).scalar() == 1
+
+
+def test_duplicate_emails_block_unique_index(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO customers (name, email) VALUES ('A', 'dup@example.com')"))
+        conn.execute(text("INSERT INTO customers (name, email) VALUES ('B', 'dup@example.com')"))
+
+    with pytest.raises(MigrationError):
+        migrate(engine)
+    # The index migration before it still went through
+    assert migrate(engine, target=1) == []
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM customers")).scalar() == 2
@@ -1,86 +1,117 @@
 #!/usr/bin/env python3
 """
-Test script to demonstrate priority detection
+Priority detection tests. Run directly for a readable demo of the classifier.
 """
 
-# Copy of the priority detection logic from app.py
-URGENCY_KEYWORDS = {
-    'high': ['loan approval', 'loan disbursed', 'disbursement', 'approval process', 
-             'urgent', 'asap', 'immediately', 'critical', 'emergency'],
-    'medium': ['status', 'update', 'when', 'how long', 'timeline'],
-    'low': ['how to', 'update information', 'change', 'modify']
-}
-
-def calculate_priority(content):
-    """Calculate message priority based on content"""
-    content_lower = content.lower()
-    priority = 0
-    matched_keywords = []
-    
-    for keyword in URGENCY_KEYWORDS['high']:
-        if keyword in content_lower:
-            priority = max(priority, 3)
-            matched_keywords.append(f"HIGH: '{keyword}'")
-    
-    for keyword in URGENCY_KEYWORDS['medium']:
-        if keyword in content_lower:
-            priority = max(priority, 2)
-            if priority < 3:  # Only add if not already high priority
-                matched_keywords.append(f"MEDIUM: '{keyword}'")
-    
-    for keyword in URGENCY_KEYWORDS['low']:
-        if keyword in content_lower:
-            priority = max(priority, 1)
-            if priority < 2:  # Only add if not already higher priority
-                matched_keywords.append(f"LOW: '{keyword}'")
-    
-    return priority, matched_keywords
-
-# Test cases
+import os
+
+import pandas as pd
+import pytest
+
+from priority import PriorityEngine, URGENCY_KEYWORDS, PRIORITY_LABELS, calculate_priority, classify_priority
+
+# (message, expected priority)
 test_messages = [
-    "When will my loan be disbursed? I need it urgently!",
-    "What's the status of my loan approval?",
-    "How to update my account information?",
-    "I need to know about the approval process for my loan application.",
-    "This is an emergency! I need help immediately!",
-    "Can you tell me when I'll receive my funds?",
-    "How do I change my email address?",
-    "I'm asking about the timeline for disbursement.",
-    "Just a general question about your services.",
-    "URGENT: My loan disbursement is delayed!",
+    ("When will my loan be disbursed? I need it urgently!", 3),
+    ("What's the status of my loan approval?", 3),
+    ("How to update my account information?", 2),
+    ("I need to know about the approval process for my loan application.", 3),
+    ("This is an emergency! I need help immediately!", 3),
+    ("Can you tell me when I'll receive my funds?", 2),
+    ("How do I change my email address?", 1),
+    ("I'm asking about the timeline for disbursement.", 3),
+    ("Just a general question about your services.", 0),
+    ("URGENT: My loan disbursement is delayed!", 3),
 ]
 
-print("=" * 80)
-print("PRIORITY DETECTION TEST")
-print("=" * 80)
-print()
-
-priority_labels = {
-    0: "None (Default)",
-    1: "Low",
-    2: "Medium", 
-    3: "High/Urgent"
-}
-
-for i, message in enumerate(test_messages, 1):
-    priority, keywords = calculate_priority(message)
-    print(f"Test {i}:")
-    print(f"  Message: \"{message}\"")
-    print(f"  Priority: {priority} ({priority_labels[priority]})")
-    if keywords:
-        print(f"  Matched Keywords: {', '.join(keywords)}")
-    else:
-        print(f"  Matched Keywords: None")
+
+def test_calculate_priority():
+    for message, expected in test_messages:
+        assert calculate_priority(message) == expected, message
+
+
+def test_classify_returns_score_and_keywords():
+    priority, keywords = classify_priority("URGENT: My loan disbursement is delayed!")
+    assert priority == 3
+    assert keywords == ['urgent', 'disbursement']
+    assert classify_priority("Just a general question") == (0, [])
+    assert classify_priority("") == (0, [])
+
+
+def test_keywords_match_at_word_start():
+    assert calculate_priority("Please make the changes") == 1
+    assert calculate_priority("What is the exchange rate?") == 0
+
+
+def test_score_many_matches_single_scoring():
+    messages = [message for message, _ in test_messages] + ['', 'modify my pin']
+    expected = [calculate_priority(m) for m in messages]
+    assert PriorityEngine().score_many(messages) == expected
+
+    series = pd.Series(messages + [None])
+    assert PriorityEngine().score_many(series).tolist() == expected + [0]
+
+
+def test_reload_swaps_keyword_table(tmp_path):
+    engine = PriorityEngine()
+    assert engine.score("my card was stolen") == 0
+    engine.reload({'high': ['stolen'], 'low': ['card']})
+    assert engine.classify("my card was stolen") == (3, ['card', 'stolen'])
+    assert engine.score("when is my loan approval") == 0
+
+    path = tmp_path / 'keywords.json'
+    path.write_text('{"medium": ["card"]}')
+    engine.load_keywords_file(str(path))
+    assert engine.score("my card was stolen") == 2
+
+
+def test_keywords_file_is_watched(tmp_path):
+    path = tmp_path / 'keywords.json'
+    path.write_text('{"high": ["stolen"]}')
+    engine = PriorityEngine()
+    engine.watch_file(str(path), interval=0)
+    assert engine.score("my card was stolen") == 3
+
+    path.write_text('{"low": ["stolen"]}')
+    os.utime(path, ns=(0, 10 ** 9))
+    assert engine.score("my card was stolen") == 1
+
+    path.write_text('{"high": "stolen"}')
+    os.utime(path, ns=(0, 2 * 10 ** 9))
+    assert engine.score("my card was stolen") == 1  # unusable file: previous table kept
+    with pytest.raises(ValueError):
+        engine.reload({'high': 'stolen'})
+
+
+def test_priority_keywords_are_read_only_over_http(client):
+    assert client.get('/api/priority/keywords').get_json() == URGENCY_KEYWORDS
+    assert client.put('/api/priority/keywords', json={'high': ['fraud']}).status_code == 405
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("PRIORITY DETECTION TEST")
+    print("=" * 80)
     print()
 
-print("=" * 80)
-print("KEYWORD LISTS:")
-print("=" * 80)
-print(f"\nHigh Priority Keywords (Priority 3):")
-print(f"  {', '.join(URGENCY_KEYWORDS['high'])}")
-print(f"\nMedium Priority Keywords (Priority 2):")
-print(f"  {', '.join(URGENCY_KEYWORDS['medium'])}")
-print(f"\nLow Priority Keywords (Priority 1):")
-print(f"  {', '.join(URGENCY_KEYWORDS['low'])}")
-print()
+    for i, (message, _) in enumerate(test_messages, 1):
+        priority, keywords = classify_priority(message)
+        print(f"Test {i}:")
+        print(f"  Message: \"{message}\"")
+        print(f"  Priority: {priority} ({PRIORITY_LABELS[priority]})")
+        if keywords:
+            print(f"  Matched Keywords: {', '.join(keywords)}")
+        else:
+            print(f"  Matched Keywords: None")
+        print()
 
+    print("=" * 80)
+    print("KEYWORD LISTS:")
+    print("=" * 80)
+    print(f"\nHigh Priority Keywords (Priority 3):")
+    print(f"  {', '.join(URGENCY_KEYWORDS['high'])}")
+    print(f"\nMedium Priority Keywords (Priority 2):")
+    print(f"  {', '.join(URGENCY_KEYWORDS['medium'])}")
+    print(f"\nLow Priority Keywords (Priority 1):")
+    print(f"  {', '.join(URGENCY_KEYWORDS['low'])}")
+    print()
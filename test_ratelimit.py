@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from sqlalchemy import text
+
+import app as app_module
+from ratelimit import Limit, MemoryBucketStore, SQLiteBucketStore
+
+
+def test_limit_specs():
+    assert Limit.parse('10/minute') == Limit(10 / 60, 10)
+    assert Limit.parse('2/second:5') == Limit(2, 5)
+    assert Limit.parse('100/hours') == Limit(100 / 3600, 100)
+    assert Limit.parse('off') is None and Limit.parse('') is None
+    for spec in ('ten/minute', '10/fortnight', '0/minute', '10/minute:0'):
+        with pytest.raises(ValueError):
+            Limit.parse(spec)
+
+
+def test_buckets_refill_and_take_all_or_nothing(tmp_path):
+    memory = MemoryBucketStore()
+    fast, slow = Limit(rate=100, burst=1), Limit(rate=0.001, burst=2)
+    assert memory.take({'ip': fast, 'email': slow}) == {}
+    empty = memory.take({'ip': fast, 'email': slow})
+    assert list(empty) == ['ip'] and 0 < empty['ip'] <= 0.01
+    time.sleep(0.02)
+    assert memory.take({'ip': fast, 'email': slow}) == {}  # the rejection took nothing from email
+    assert list(memory.take({'other-ip': fast, 'email': slow})) == ['email']
+
+    # Two stores on one file act like two worker processes sharing the limit
+    path = str(tmp_path / 'limits.db')
+    worker_a, worker_b = SQLiteBucketStore(path), SQLiteBucketStore(path)
+    assert worker_a.take({'ip': slow}) == {}
+    assert worker_b.take({'ip': slow}) == {}
+    assert list(worker_a.take({'ip': slow})) == ['ip']
+    assert len(worker_b) == 1
+
+
+def send(client, email, ip='10.0.0.1'):
+    return client.post('/api/customers/send-message', json={'name': 'Jane', 'email': email, 'content': f'hi from {email}'},
+                       environ_base={'REMOTE_ADDR': ip})
+
+
+def test_send_message_rejects_before_database_work(client, db):
+    app_module.rate_limiter.enabled = True
+    email_burst = int(app_module.rate_limiter.limits('send_message')['email'].burst)
+    codes = [send(client, 'jane@example.com').status_code for _ in range(email_burst + 1)]
+    assert codes == [200] * email_burst + [429]
+    rejected = send(client, ' JANE@example.com ')
+    assert rejected.status_code == 429 and int(rejected.headers['Retry-After']) >= 1
+    assert send(client, 'bob@example.com').status_code == 200
+    assert send(client, 'jane@example.com', ip='10.0.0.2').status_code == 429  # per email, from any address
+
+    with db.connect() as conn:
+        assert conn.execute(text("SELECT SUM(1 + repeat_count) FROM messages")).scalar() == email_burst + 1
+
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'rate_limit_requests_total{route="send_message",result="rejected"} 3' in metrics
+    assert 'rate_limit_exhausted_total{route="send_message",key="email"} 3' in metrics
+    assert 'rate_limit_burst{route="send_message",key="ip"}' in metrics
@@ -0,0 +1,36 @@
+import json
+import threading
+import time
+
+from socket_queue import SQLiteQueueManager, socketio_options
+
+
+def test_socketio_options():
+    assert socketio_options(None) == {}
+    assert socketio_options('redis://localhost:6379/0') == {'message_queue': 'redis://localhost:6379/0'}
+    assert isinstance(socketio_options('sqlite-queue:///:memory:')['client_manager'], SQLiteQueueManager)
+
+
+def test_published_emits_reach_other_listeners(tmp_path):
+    queue_url = f"sqlite-queue:///{tmp_path / 'queue.db'}"
+    publisher = SQLiteQueueManager(queue_url, write_only=True)
+    listener = SQLiteQueueManager(queue_url, poll_interval=0.01)
+    received = []
+
+    def listen():
+        for payload in listener._listen():
+            received.append(json.loads(payload))
+            return
+
+    thread = threading.Thread(target=listen, daemon=True)
+    thread.start()
+    time.sleep(0.1)  # listener has recorded its starting position
+    publisher.emit('new_message', {'id': 42}, room='agents')
+    thread.join(timeout=5)
+
+    assert len(received) == 1
+    assert received[0]['method'] == 'emit'
+    assert received[0]['event'] == 'new_message'
+    assert received[0]['data'] == [{'id': 42}]
+    assert received[0]['room'] == 'agents'
+    assert received[0]['host_id'] == publisher.host_id
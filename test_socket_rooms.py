@@ -0,0 +1,71 @@
+import pytest
+
+from app import app, socketio
+
+
+@pytest.fixture
+def connect(client):
+    connected = []
+
+    def connect(auth=None):
+        socket_client = socketio.test_client(app, flask_test_client=client, auth=auth)
+        socket_client.get_received()
+        connected.append(socket_client)
+        return socket_client
+
+    yield connect
+    for socket_client in connected:
+        if socket_client.is_connected():
+            socket_client.disconnect()
+
+
+def event_names(socket_client):
+    return [event['name'] for event in socket_client.get_received()]
+
+
+def send(client, content, email='jane@example.com'):
+    return client.post('/api/customers/send-message', json={
+        'name': 'Jane', 'email': email, 'content': content
+    }).get_json()
+
+
+def test_events_only_reach_interested_rooms(client, connect):
+    first = send(client, 'hello')
+    inbox_agent = connect({'role': 'agent', 'agent_id': 1})
+    urgent_agent = connect({'role': 'agent', 'agent_id': 2, 'tiers': [3]})
+    customer = connect({'role': 'customer', 'customer_id': first['customer_id']})
+    other_customer = connect({'role': 'customer', 'customer_id': first['customer_id'] + 1})
+    anonymous = connect()
+
+    send(client, 'urgent please help')
+    send(client, 'just saying hi', email='other@example.com')
+
+    assert event_names(inbox_agent) == ['new_message', 'new_message']
+    assert event_names(urgent_agent) == ['new_message']
+    assert event_names(customer) == ['new_message']
+    assert event_names(other_customer) == ['new_message']  # other@example.com is the next customer
+    assert event_names(anonymous) == []
+
+
+def test_subscribe_validates_rooms(connect):
+    agent = connect({'role': 'agent', 'agent_id': 1, 'tiers': [3]})
+    ack = agent.emit('subscribe', {'rooms': ['priority:2', 'customer:7', 'agent:9', 'priority:8']}, callback=True)
+    assert ack == {'rooms': ['agent:1', 'customer:7', 'priority:2', 'priority:3'],
+                   'rejected': ['agent:9', 'priority:8']}
+    assert agent.emit('unsubscribe', {'rooms': ['priority:3']}, callback=True)['rooms'] == \
+        ['agent:1', 'customer:7', 'priority:2']
+
+    customer = connect({'role': 'customer', 'customer_id': 7})
+    assert customer.emit('subscribe', {'rooms': ['inbox', 'customer:8']}, callback=True)['rejected'] == \
+        ['inbox', 'customer:8']
+
+
+def test_room_stats_report_fan_out(client, connect):
+    connect({'role': 'agent', 'agent_id': 1})
+    connect({'role': 'agent', 'agent_id': 2})
+    send(client, 'urgent')
+
+    rooms = client.get('/api/socket/rooms').get_json()['rooms']
+    assert rooms['inbox']['members'] == 2
+    assert rooms['inbox']['events'] >= 1 and rooms['inbox']['deliveries'] >= 2
+    assert rooms['priority:3']['events'] >= 1
@@ -0,0 +1,34 @@
+import json
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine, inspect
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(statement, tmp_path):
+    """Modules loaded and tables in a fresh database after running ``statement`` in a new interpreter"""
+    path = tmp_path / 'startup.db'
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', PYTHONPATH=REPO_ROOT)
+    process = subprocess.run([sys.executable, '-c', f'{statement}; import json, sys; print(json.dumps(sorted(sys.modules)))'],
+                             cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    engine = create_engine(f'sqlite:///{path}')
+    tables = set(inspect(engine).get_table_names())
+    engine.dispose()
+    return set(json.loads(process.stdout.splitlines()[-1])), tables
+
+
+def test_cli_modules_import_without_flask_or_pandas(tmp_path):
+    modules, tables = run('import import_data, migrations', tmp_path)
+    assert 'models' in modules
+    assert not {'app', 'flask', 'flask_socketio', 'pandas'} & modules
+    assert tables == set()
+
+
+def test_schema_is_created_by_create_app_not_on_import(tmp_path):
+    _, tables = run('import app', tmp_path)
+    assert tables == set()
+    _, tables = run('import app; app.create_app()', tmp_path)
+    assert {'customers', 'messages', 'conversations', 'message_claims', 'archived_messages'} <= tables
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import pytest
+
+import app as app_module
+from app import Session, Agent, Customer, Message
+from work_queue import WorkQueue
+
+BASE = datetime(2024, 1, 1)
+
+
+def test_heap_order_expiry_and_release():
+    queue = WorkQueue(claim_timeout=60)
+    queue.load([(1, 1, BASE), (2, 3, BASE + timedelta(minutes=5)), (3, 3, BASE)], max_id=3)
+    queue.add(4, 2, BASE)
+
+    assert queue.next_candidate(BASE) == 3          # urgent, oldest first
+    queue.claimed(3, agent_id=7, expires_at=BASE + timedelta(minutes=1))
+    assert queue.next_candidate(BASE) == 2
+    queue.remove(2)                                  # replied while being looked at
+    queue.remove(4)
+    assert queue.next_candidate(BASE) == 1
+    queue.claimed(1, agent_id=8, expires_at=BASE + timedelta(minutes=10))
+    assert queue.next_candidate(BASE) is None
+
+    assert queue.next_candidate(BASE + timedelta(minutes=2)) == 3   # claim timed out
+    queue.release(1)
+    assert queue.next_candidate(BASE) == 1
+    assert queue.stats() == {'waiting': 0, 'claimed': 0, 'loaded': True}
+
+
+def seed(messages, agents=2):
+    session = Session()
+    session.add_all(Agent(id=i, name=f'Agent {i}', email=f'agent{i}@example.com') for i in range(1, agents + 1))
+    customer = Customer(name='Jane', email='jane@example.com', customer_id='CUST_1')
+    session.add(customer)
+    session.flush()
+    for priority, minutes in messages:
+        session.add(Message(customer_id=customer.id, content=f'p{priority} +{minutes}', direction='incoming',
+                            status='unread', priority=priority, created_at=BASE + timedelta(minutes=minutes)))
+    session.commit()
+    session.close()
+
+
+def claim(client, agent_id):
+    return client.post('/api/queue/claim', json={'agent_id': agent_id})
+
+
+def test_claim_release_and_reply_guard(client):
+    seed([(1, 0), (3, 10), (3, 5), (2, 0)])
+
+    first = claim(client, 1).get_json()
+    assert first['message']['content'] == 'p3 +5' and first['claim']['agent_id'] == 1
+    assert claim(client, 2).get_json()['message']['content'] == 'p3 +10'
+
+    reply = client.post(f"/api/messages/{first['message']['id']}/reply", json={'content': 'mine', 'agent_id': 2})
+    assert reply.status_code == 409
+    assert client.post('/api/queue/release', json={'agent_id': 2, 'message_id': first['message']['id']}).status_code == 409
+    assert client.post('/api/queue/release', json={'agent_id': 1, 'message_id': first['message']['id']}).status_code == 200
+    assert claim(client, 2).get_json()['message']['content'] == 'p3 +5'
+
+    # Customers keep writing while agents work
+    client.post('/api/customers/send-message', json={'name': 'Jane', 'email': 'jane@example.com', 'content': 'urgent!'})
+    assert claim(client, 1).get_json()['message']['content'] == 'urgent!'
+    assert claim(client, 99).status_code == 404
+    assert client.get('/api/queue/stats').get_json()['claimed'] == 3
+
+
+def test_replied_messages_leave_the_queue(client):
+    seed([(3, 0), (1, 0)])
+    claimed = claim(client, 1).get_json()['message']
+    assert client.post(f"/api/messages/{claimed['id']}/reply", json={'content': 'done', 'agent_id': 1}).status_code == 200
+    assert claim(client, 1).get_json()['message']['priority'] == 1
+    assert claim(client, 2).get_json()['message'] is None
+
+
+def test_concurrent_claims_never_share_a_message(client):
+    seed([(i % 4, i) for i in range(20)], agents=8)
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: claim(client, i % 8 + 1).get_json(), range(24)))
+
+    claimed = [r['message']['id'] for r in results if r['message']]
+    assert len(claimed) == 20 and len(set(claimed)) == 20
+
+
+def test_claims_made_by_another_process_are_respected(client):
+    seed([(3, 0), (2, 0)])
+    first = claim(client, 1).get_json()['message']
+    # A second process starts with an empty heap and the same database
+    app_module.work_queue = WorkQueue()
+    assert claim(client, 2).get_json()['message']['id'] != first['id']
+
+
+def test_create_app_loads_only_open_incoming_messages(client, monkeypatch):
+    seed([(3, 0), (2, 5), (1, 10)])
+    session = Session()
+    replied = session.query(Message).filter_by(priority=2).one()
+    replied.status = 'replied'
+    session.add(Message(customer_id=replied.customer_id, content='done', direction='outgoing', agent_id=1))
+    session.commit()
+    session.close()
+
+    monkeypatch.setattr(app_module, '_started', False)
+    app_module.create_app(init_schema=False)
+    assert app_module.work_queue.stats() == {'waiting': 2, 'claimed': 0, 'loaded': True}
+    assert claim(client, 1).get_json()['message']['priority'] == 3
+    assert claim(client, 2).get_json()['message']['priority'] == 1
+    assert claim(client, 1).get_json()['message'] is None
+
+
+def test_failed_claim_keeps_the_message_and_string_ids_work(client, monkeypatch):
+    seed([(3, 0)])
+    record_claim = app_module.claims.record_claim
+
+    def failing(*args, **kwargs):
+        raise RuntimeError('database is locked')
+
+    monkeypatch.setattr(app_module.claims, 'record_claim', failing)
+    with pytest.raises(RuntimeError):
+        claim(client, 1)
+    monkeypatch.setattr(app_module.claims, 'record_claim', record_claim)
+
+    claimed = client.post('/api/queue/claim', json={'agent_id': '1'}).get_json()['message']
+    assert claimed['content'] == 'p3 +0'
+    release = client.post('/api/queue/release', json={'agent_id': '1', 'message_id': str(claimed['id'])})
+    assert release.status_code == 200
+    assert client.get('/api/queue/stats').get_json()['waiting'] == 1
+    assert client.post('/api/queue/release', json={'agent_id': 'one', 'message_id': 1}).status_code == 400
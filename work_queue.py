@@ -0,0 +1,201 @@
+"""
+Priority work queue: agents claim the next-best message instead of all
+working the same sorted list.
+
+``WorkQueue`` keeps every incoming message that has not been replied to in a
+heap keyed by (-priority, created_at, id): most urgent first, oldest first
+within a priority. It is built from the database when the server starts
+(only the open incoming messages are read), fed by the write paths
+(``add`` / ``remove``) and tops itself up with messages whose id is above the
+highest one it has loaded, so inserts made by other server processes are
+picked up with a primary-key range query rather than a scan.
+
+Claims are recorded in the ``message_claims`` table. The heap only proposes
+a candidate (O(log n), under a lock so concurrent claims in one process get
+different messages); ``record_claim`` then inserts the claim row, and the
+primary key makes that atomic across processes. A claim expires after
+``claim_timeout`` seconds and the message goes back into the heap.
+"""
+
+import heapq
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, select
+
+import database
+
+DEFAULT_CLAIM_TIMEOUT = 300
+
+claims_metadata = MetaData()
+message_claims = Table(
+    'message_claims', claims_metadata,
+    Column('message_id', Integer, primary_key=True),
+    Column('agent_id', Integer, nullable=False, index=True),
+    Column('claimed_at', DateTime, nullable=False),
+    Column('expires_at', DateTime, nullable=False),
+)
+
+
+def create_claims_table(bind):
+    claims_metadata.create_all(bind)
+
+
+class WorkQueue:
+    def __init__(self, claim_timeout=DEFAULT_CLAIM_TIMEOUT):
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._heap = []           # (-priority, created_at, message_id)
+        self._keys = {}           # message_id -> heap key, for every open message
+        self._waiting = set()     # message ids currently in the heap
+        self._claims = {}         # message_id -> (agent_id, expires_at)
+        self._expiries = []       # (expires_at, message_id)
+        self._removed = set()     # removed before the initial load finished
+        self._max_loaded_id = 0
+        self.loaded = False
+
+    def load(self, rows, max_id=0):
+        """Merge (id, priority, created_at) rows of open messages.
+
+        The first load heapifies everything at once; later (incremental) loads
+        push row by row.
+
+        ``max_id`` is the highest message id the caller looked at, open or not.
+        """
+        with self._lock:
+            self._max_loaded_id = max(self._max_loaded_id, max_id)
+            for message_id, priority, created_at in rows:
+                self._max_loaded_id = max(self._max_loaded_id, message_id)
+                if message_id in self._keys or message_id in self._removed:
+                    continue
+                key = (-(priority or 0), created_at, message_id)
+                self._keys[message_id] = key
+                self._waiting.add(message_id)
+                if self.loaded:
+                    heapq.heappush(self._heap, key)
+                else:
+                    self._heap.append(key)
+            if not self.loaded:
+                heapq.heapify(self._heap)
+            self._removed.clear()
+            self.loaded = True
+
+    @property
+    def max_loaded_id(self):
+        return self._max_loaded_id
+
+    def add(self, message_id, priority, created_at):
+        with self._lock:
+            if message_id in self._keys:
+                return
+            key = (-(priority or 0), created_at, message_id)
+            self._keys[message_id] = key
+            self._waiting.add(message_id)
+            heapq.heappush(self._heap, key)
+
+    def remove(self, message_id):
+        """Drop a message that no longer needs work (e.g. it was replied to)"""
+        with self._lock:
+            self._keys.pop(message_id, None)
+            self._waiting.discard(message_id)
+            self._claims.pop(message_id, None)
+            if not self.loaded:
+                self._removed.add(message_id)
+
+    def next_candidate(self, now):
+        """Pop the best unclaimed message id, or None. The caller must then
+        either ``claimed`` or ``remove`` it."""
+        with self._lock:
+            self._expire(now)
+            while self._heap:
+                _, _, message_id = heapq.heappop(self._heap)
+                if message_id in self._waiting:  # skip entries left by remove()
+                    self._waiting.discard(message_id)
+                    return message_id
+            return None
+
+    def claimed(self, message_id, agent_id, expires_at):
+        with self._lock:
+            if message_id not in self._keys:
+                return
+            self._waiting.discard(message_id)
+            self._claims[message_id] = (agent_id, expires_at)
+            heapq.heappush(self._expiries, (expires_at, message_id))
+
+    def release(self, message_id):
+        with self._lock:
+            if self._claims.pop(message_id, None) is not None:
+                self._requeue(message_id)
+
+    def requeue(self, message_id):
+        """Put back a candidate from ``next_candidate`` that could not be claimed"""
+        with self._lock:
+            self._requeue(message_id)
+
+    def stats(self):
+        with self._lock:
+            return {'waiting': len(self._waiting), 'claimed': len(self._claims), 'loaded': self.loaded}
+
+    def _requeue(self, message_id):
+        key = self._keys.get(message_id)
+        if key is not None and message_id not in self._waiting:
+            self._waiting.add(message_id)
+            heapq.heappush(self._heap, key)
+
+    def _expire(self, now):
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, message_id = heapq.heappop(self._expiries)
+            claim = self._claims.get(message_id)
+            if claim is not None and claim[1] == expires_at:
+                del self._claims[message_id]
+                self._requeue(message_id)
+
+
+def record_claim(conn, message_id, agent_id, now, timeout):
+    """Insert the claim row; returns (agent_id, expires_at) of whoever holds the claim"""
+    expires_at = now + timedelta(seconds=timeout)
+    conn.execute(message_claims.delete().where(
+        message_claims.c.message_id == message_id, message_claims.c.expires_at <= now
+    ))
+    inserted = conn.execute(database.insert(conn, message_claims).on_conflict_do_nothing().values(
+        message_id=message_id, agent_id=agent_id, claimed_at=now, expires_at=expires_at
+    ))
+    if inserted.rowcount == 1:
+        return agent_id, expires_at
+    holder = conn.execute(
+        select(message_claims.c.agent_id, message_claims.c.expires_at)
+        .where(message_claims.c.message_id == message_id)
+    ).one()
+    return holder.agent_id, holder.expires_at
+
+
+def active_claim(conn, message_id, now=None):
+    """(agent_id, expires_at) of an unexpired claim on the message, or None"""
+    row = conn.execute(
+        select(message_claims.c.agent_id, message_claims.c.expires_at)
+        .where(message_claims.c.message_id == message_id, message_claims.c.expires_at > (now or datetime.utcnow()))
+    ).first()
+    return tuple(row) if row else None
+
+
+def active_claims(conn, message_ids, now=None):
+    """{message_id: agent_id} of unexpired claims on any of the messages"""
+    rows = conn.execute(
+        select(message_claims.c.message_id, message_claims.c.agent_id)
+        .where(message_claims.c.message_id.in_(list(message_ids)),
+               message_claims.c.expires_at > (now or datetime.utcnow()))
+    )
+    return dict(rows.all())
+
+
+def release_claims(conn, message_ids):
+    """Delete any claims on the messages; returns how many were deleted"""
+    return conn.execute(message_claims.delete().where(message_claims.c.message_id.in_(list(message_ids)))).rowcount
+
+
+def release_claim(conn, message_id, agent_id=None):
+    """Delete the claim (only if held by ``agent_id`` when given); returns whether one was deleted"""
+    query = message_claims.delete().where(message_claims.c.message_id == message_id)
+    if agent_id is not None:
+        query = query.where(message_claims.c.agent_id == agent_id)
+    return conn.execute(query).rowcount > 0